@@ -0,0 +1,92 @@
+import os
+import pickle
+import sqlite3
+import time
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'complex_mut_fr_parser')
+DEFAULT_CACHE_SIZE_MB = 256
+CACHE_FILE_NAME = f"codon_cache.v{CACHE_FORMAT_VERSION}.sqlite"
+# eviction brings the cache down to this fraction of its size cap
+EVICT_TARGET = 0.9
+SQLITE_MAX_VARIABLES = 900
+
+def get_bam_key(bam_file_path):
+  """
+  Identifies a BAM by absolute path, size and modification time: a rewritten BAM gets a new key.
+  """
+  stat = os.stat(bam_file_path)
+  return f"{os.path.abspath(bam_file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+class CodonCache:
+  """
+  On-disk cache of per-codon counts ({codon: count}, total_reads), keyed by BAM key, count
+  settings (engine and read filters) and codon position. Entries live in one SQLite file shared
+  by all processes; least recently used entries are evicted once the cache exceeds max_bytes.
+  """
+
+  def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE_MB << 20):
+    os.makedirs(cache_dir, exist_ok=True)
+    self.max_bytes = max_bytes
+    self.db = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE_NAME), timeout=60)
+    self.db.execute('''CREATE TABLE IF NOT EXISTS codon_stats (
+      bam TEXT, settings TEXT, codon_pos INTEGER, stats BLOB, size INTEGER, last_access REAL,
+      PRIMARY KEY (bam, settings, codon_pos))''')
+    self.db.execute('CREATE INDEX IF NOT EXISTS codon_stats_last_access ON codon_stats (last_access)')
+    self.db.commit()
+
+  def get_many(self, bam_key, settings, codon_positions):
+    codon_stats = {}
+    codon_positions = list(codon_positions)
+    now = time.time()
+    for idx in range(0, len(codon_positions), SQLITE_MAX_VARIABLES):
+      chunk = codon_positions[idx:idx + SQLITE_MAX_VARIABLES]
+      placeholders = ','.join('?' * len(chunk))
+      params = [bam_key, settings, *chunk]
+      rows = self.db.execute(
+        f'SELECT codon_pos, stats FROM codon_stats WHERE bam = ? AND settings = ? AND codon_pos IN ({placeholders})',
+        params).fetchall()
+      self.db.execute(
+        f'UPDATE codon_stats SET last_access = ? WHERE bam = ? AND settings = ? AND codon_pos IN ({placeholders})',
+        [now, *params])
+      for codon_start_pos, stats in rows:
+        codon_stats[codon_start_pos] = pickle.loads(stats)
+    self.db.commit()
+    return codon_stats
+
+  def put_many(self, bam_key, settings, codon_stats):
+    now = time.time()
+    rows = []
+    for codon_start_pos, (codon_counts, total_reads) in codon_stats.items():
+      stats = pickle.dumps((dict(codon_counts), total_reads), protocol=pickle.HIGHEST_PROTOCOL)
+      rows.append((bam_key, settings, codon_start_pos, stats, len(stats), now))
+    self.db.executemany('INSERT OR REPLACE INTO codon_stats VALUES (?, ?, ?, ?, ?, ?)', rows)
+    self.db.commit()
+    self.evict()
+
+  def size(self):
+    return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM codon_stats').fetchone()[0]
+
+  def evict(self):
+    excess = self.size() - self.max_bytes
+    if excess <= 0:
+      return 0
+    to_free = excess + int(self.max_bytes * (1 - EVICT_TARGET))
+    freed, evicted = 0, []
+    for rowid, size in self.db.execute('SELECT rowid, size FROM codon_stats ORDER BY last_access'):
+      evicted.append((rowid,))
+      freed += size
+      if freed >= to_free:
+        break
+    self.db.executemany('DELETE FROM codon_stats WHERE rowid = ?', evicted)
+    self.db.commit()
+    return len(evicted)
+
+  def close(self):
+    self.db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
@@ -0,0 +1,66 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from parsers import extract_multi_codon_frequencies
+from io_utils import get_sample_id, get_codon_table, get_codon_table_label, CODON_TABLE_COLUMNS
+
+_cohort_context = {}
+
+def init_cohort_context(codon_positions, engine, cache_options):
+  _cohort_context.update(codon_positions=codon_positions, engine=engine, cache_options=cache_options)
+
+def process_one_bam(bam_file_path):
+  """
+  Worker: opens its own pysam.AlignmentFile and returns the long-format codon table of one sample.
+  Errors are returned, not raised, so one bad BAM does not stop the cohort.
+  """
+  smpl_id = get_sample_id(bam_file_path)
+  try:
+    codon_rows = extract_multi_codon_frequencies(
+      bam_file_path, _cohort_context['codon_positions'], _cohort_context['engine'], **_cohort_context['cache_options'])
+    return smpl_id, get_codon_table(codon_rows, smpl_id), None
+  except Exception as e:
+    return smpl_id, None, f"{type(e).__name__}: {e}"
+
+def run_cohort(bam_file_paths, codon_positions, output_file_path, workers=1, engine='pileup', cache_options=None):
+  """
+  Processes many indexed BAMs over a process pool and streams the per-sample tables into one
+  merged CSV (samples in input order). The table is written to a .part file first and renamed
+  when complete. cache_options (cache_dir, refresh, cache_size_mb) are passed to
+  extract_multi_codon_frequencies; every worker opens the shared cache itself.
+
+  Returns the output path and the list of (bam_file_path, error) for samples that failed.
+  """
+  output_path = f"{output_file_path}/cohort_{get_codon_table_label(codon_positions)}_complex_freqs.csv"
+  part_path = f"{output_path}.part"
+  failed = []
+  cache_options = cache_options or {}
+  init_cohort_context(codon_positions, engine, cache_options)
+
+  if workers > 1:
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_cohort_context,
+                                   initargs=(codon_positions, engine, cache_options))
+    results = executor.map(process_one_bam, bam_file_paths)
+  else:
+    executor = None
+    results = map(process_one_bam, bam_file_paths)
+
+  try:
+    with open(part_path, 'w', newline='') as file:
+      file.write(','.join(CODON_TABLE_COLUMNS) + '\n')
+      for bam_file_path, (smpl_id, df, error) in zip(bam_file_paths, results):
+        if error is not None:
+          logging.warning(f"{smpl_id}: failed ({error})")
+          failed.append((bam_file_path, error))
+          continue
+        df.to_csv(file, index=False, header=False)
+        logging.info(f"{smpl_id}: {len(df)} codon rows")
+    os.replace(part_path, output_path)
+  except BaseException:
+    if os.path.exists(part_path):
+      os.remove(part_path)
+    raise
+  finally:
+    if executor is not None:
+      executor.shutdown(cancel_futures=True)
+  return output_path, failed
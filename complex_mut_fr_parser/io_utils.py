@@ -2,19 +2,84 @@ import pysam
 import pandas as pd
 import os
 from exceptions import GenomeRefError
+from utils import get_codon_range
 
-def codon_stats_to_csv(codon_stats, output_file_path, bam_file_path, codon_start_pos):
-  df = pd.DataFrame(codon_stats, columns=['CODON', 'FREQUENCY', 'DEPTH'])
-  df = df.sort_values(by='FREQUENCY', ascending=False)
-  print(df)
-  
+CODON_TABLE_COLUMNS = ['SAMPLE_ID', 'CODON_POS', 'CODON', 'FREQUENCY', 'DEPTH']
+BAM_MANIFEST_EXTENSIONS = ('.txt', '.tsv', '.csv', '.list')
+
+def get_sample_id(bam_file_path):
   basename = os.path.basename(bam_file_path)
   smpl_id = basename.replace('.fastq.gz.bam', '')
-  output_path = f"{output_file_path}/{smpl_id}_{codon_start_pos}_complex_freqs.csv"
+  return smpl_id[:-len('.bam')] if smpl_id.endswith('.bam') else smpl_id
+
+def get_codon_table(codon_rows, smpl_id):
+  df = pd.DataFrame(codon_rows, columns=CODON_TABLE_COLUMNS[1:])
+  df.insert(0, 'SAMPLE_ID', smpl_id)
+  return df.sort_values(by=['CODON_POS', 'FREQUENCY'], ascending=[True, False])
+
+def get_codon_table_label(codon_positions):
+  first_pos, last_pos = min(codon_positions), max(codon_positions)
+  return first_pos if first_pos == last_pos else f"{first_pos}-{last_pos}"
+
+def codon_table_to_csv(codon_rows, output_file_path, bam_file_path, codon_positions):
+  """
+  Writes the long-format codon table (one row per sample, codon position and codon).
+  """
+  smpl_id = get_sample_id(bam_file_path)
+  df = get_codon_table(codon_rows, smpl_id)
+  output_path = f"{output_file_path}/{smpl_id}_{get_codon_table_label(codon_positions)}_complex_freqs.csv"
   df.to_csv(output_path, index=False)
-  
+  print(f"{smpl_id}: {len(df)} codon rows written to {output_path}")
+
+def get_cds_location(gb_file_path, product):
+  from Bio import SeqIO
+  with open(gb_file_path, 'r') as file:
+    for record in SeqIO.parse(file, 'genbank'):
+      for feature in record.features:
+        if feature.type == 'CDS' and feature.qualifiers.get('product', [None])[0] == product:
+          return int(feature.location.start) + 1, int(feature.location.end)
+  raise ValueError(f"CDS '{product}' not found in {gb_file_path}")
+
+def get_reference_seq(gb_file_path):
+  from Bio import SeqIO
+  with open(gb_file_path, 'r') as file:
+    return str(next(SeqIO.parse(file, 'genbank')).seq)
+
+def read_codon_positions(codon_spec, gb_file_path=None):
+  """
+  Resolves the codon positions argument (1-based codon start positions):
+    - a position or a comma-separated list of positions: 6747 or 6747,6750
+    - a file with one position per line
+    - a CDS range in GenBank notation, every codon of it: 266..21555
+    - a CDS product name from the GenBank file given with gb_file_path: 'surface glycoprotein'
+  """
+  if os.path.isfile(codon_spec):
+    with open(codon_spec, 'r') as file:
+      return [int(line) for line in file if line.strip() and not line.startswith('#')]
+  if '..' in codon_spec:
+    start, end = codon_spec.split('..')
+    return get_codon_range(int(start), int(end))
+  if gb_file_path is not None and not codon_spec.replace(',', '').strip().isdigit():
+    return get_codon_range(*get_cds_location(gb_file_path, codon_spec))
+  return [int(pos) for pos in codon_spec.split(',') if pos.strip()]
+
+def collect_bam_paths(path):
+  """
+  Resolves the BAM input: a single .bam, a directory (all *.bam in it) or a manifest
+  file with one BAM path per line (first column; relative paths are relative to the manifest).
+  """
+  if os.path.isdir(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.bam'))
+  if path.endswith(BAM_MANIFEST_EXTENSIONS):
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as file:
+      bam_paths = [line.replace(',', '\t').split('\t')[0].strip() for line in file
+                   if line.strip() and not line.startswith('#')]
+    return [os.path.join(manifest_dir, bam_path) for bam_path in bam_paths if bam_path.endswith('.bam')]
+  return [path]
+
 def open_and_validate_bam(bam_file):
   bam = pysam.AlignmentFile(bam_file, "rb")
   if len(bam.references) != 1:
     raise GenomeRefError('GenomeRefError: input .bam must contain one and only one reference (chromosome)')
-  return bam
\ No newline at end of file
+  return bam
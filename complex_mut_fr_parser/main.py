@@ -6,19 +6,74 @@ Created on Tue Aug  6 09:47:33 2024
 @author: Dariia Vyshenska
 """
 import argparse
-from parsers import extract_codon_frequencies
-from io_utils import codon_stats_to_csv
+import logging
+from parsers import extract_multi_codon_frequencies, ENGINES
+from io_utils import codon_table_to_csv, read_codon_positions, collect_bam_paths, get_reference_seq
+from cohort import run_cohort
+from scan import scan_bam, SCAN_FORMATS, MIN_FREQ, MIN_DEPTH
+from cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE_MB
 
-def main(bam_file_path, codon_start_pos, output_file_path):
-  codon_frequencies = extract_codon_frequencies(bam_file_path, codon_start_pos)
-  codon_stats_to_csv(codon_frequencies, output_file_path, bam_file_path, codon_start_pos)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def main(bam_file_path, codon_positions, output_file_path, engine='pileup', cache_options=None):
+  codon_rows = extract_multi_codon_frequencies(bam_file_path, codon_positions, engine, **(cache_options or {}))
+  codon_table_to_csv(codon_rows, output_file_path, bam_file_path, codon_positions)
+
+def main_scan(bam_file_path, codon_positions, output_file_path, gb_file_path=None, scan_format='npz',
+              min_freq=MIN_FREQ, min_depth=MIN_DEPTH):
+  ref_seq = get_reference_seq(gb_file_path) if gb_file_path is not None else None
+  counts_path, report_path = scan_bam(bam_file_path, codon_positions, output_file_path, ref_seq, scan_format,
+                                      min_freq, min_depth)
+  logging.info(f"Codon counts written to {counts_path}, complex mutation report to {report_path}")
+
+def main_cohort(bam_file_paths, codon_positions, output_file_path, workers=1, engine='pileup', cache_options=None):
+  logging.info(f"Processing {len(bam_file_paths)} bam files with {workers} worker(s)")
+  output_path, failed = run_cohort(bam_file_paths, codon_positions, output_file_path, workers, engine,
+                                   cache_options)
+  logging.info(f"Merged table written to {output_path}")
+  if failed:
+    logging.warning(f"Failed to process {len(failed)} of {len(bam_file_paths)} bam files:")
+    for bam_file_path, error in failed:
+      logging.warning(f"  - {bam_file_path}: {error}")
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser(description='Extracts frequencies of complex mutations from INDEXED .bam file.',
                                   usage='Usage: ./main.py <indexed_bam_path> <ref_codon_start_pos> <output_dir>')
-  parser.add_argument('indexed_bam_path', type=str, help='Path to the indexed bam file')
-  parser.add_argument('ref_codon_start_pos', type=int, help='Codon start position in reference file')
+  parser.add_argument('indexed_bam_path', type=str,
+                      help='Path to the indexed bam file, a directory of indexed bams or a manifest (.txt/.tsv/.csv) with one bam path per line')
+  parser.add_argument('ref_codon_start_pos', type=str,
+                      help='Codon start position(s) in reference file: 6747, a list 6747,6750, a file with one position per line, '
+                           'a CDS range 266..21555 (every codon) or a CDS product name (with --gb_file_path)')
   parser.add_argument('output_path', type=str, help='Path where the output CSV will be saved')
+  parser.add_argument('--gb_file_path', type=str, default=None, help='GenBank file to look up CDS product names in')
+  parser.add_argument('--engine', choices=ENGINES, default='pileup',
+                      help='pileup: samtools-style pileup columns; fetch: walk each read alignment once, '
+                           'counting codons with deletions (-) and insertions (lowercase) explicitly (faster on deep bams)')
+  parser.add_argument('--scan', action='store_true',
+                      help='Scan mode: count every requested codon into a (codons x 64 codons + INDEL/N) tensor, '
+                           'export it and derive a thresholded complex mutation report')
+  parser.add_argument('--scan_format', choices=SCAN_FORMATS, default='npz', help='Count tensor format in scan mode (default: npz)')
+  parser.add_argument('--min_freq', type=float, default=MIN_FREQ, help=f'Minimal codon frequency in the scan report (default: {MIN_FREQ})')
+  parser.add_argument('--min_depth', type=int, default=MIN_DEPTH, help=f'Minimal codon position depth in the scan report (default: {MIN_DEPTH})')
+  parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for a cohort of bams (default: 1)')
+  parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR,
+                      help=f'Directory of the codon count cache, keyed by bam path/size/mtime, codon and engine (default: {DEFAULT_CACHE_DIR})')
+  parser.add_argument('--cache_size_mb', type=int, default=DEFAULT_CACHE_SIZE_MB,
+                      help=f'Size cap of the codon count cache; least recently used entries are evicted (default: {DEFAULT_CACHE_SIZE_MB})')
+  parser.add_argument('--no_cache', '--no-cache', action='store_true', help='Do not read or write the codon count cache')
+  parser.add_argument('--refresh', action='store_true', help='Recount all codons and overwrite their cache entries')
   
   args = parser.parse_args()
-  main(args.indexed_bam_path, args.ref_codon_start_pos, args.output_path)
+  codon_positions = read_codon_positions(args.ref_codon_start_pos, args.gb_file_path)
+  bam_file_paths = collect_bam_paths(args.indexed_bam_path)
+  cache_options = {
+    'cache_dir': None if args.no_cache else args.cache_dir, 'refresh': args.refresh, 'cache_size_mb': args.cache_size_mb,
+  }
+  if args.scan:
+    for bam_file_path in bam_file_paths:
+      main_scan(bam_file_path, codon_positions, args.output_path, args.gb_file_path, args.scan_format,
+                args.min_freq, args.min_depth)
+  elif bam_file_paths == [args.indexed_bam_path] and args.workers <= 1:
+    main(args.indexed_bam_path, codon_positions, args.output_path, args.engine, cache_options)
+  else:
+    main_cohort(bam_file_paths, codon_positions, args.output_path, args.workers, args.engine, cache_options)
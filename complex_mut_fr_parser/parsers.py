@@ -1,44 +1,244 @@
+import logging
 import pysam
+import numpy as np
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
 from utils import calc_freq
 from io_utils import open_and_validate_bam
+from dedup import ReadNameDeduplicator, hash_read_name
+from cache import CodonCache, get_bam_key, DEFAULT_CACHE_SIZE_MB
 
-def process_pileup(bam, codon_start_pos):
-  codon_end_pos = codon_start_pos + 2
-  read_ids = set()
+# codon positions further apart than this start a new pileup sweep instead of
+# piling up every column in between
+SWEEP_GAP = 1000
+# same read filters as the pileup engine (pysam pileup defaults)
+SKIP_READ_FLAGS = 0x4 | 0x100 | 0x200 | 0x400  # unmapped, secondary, qc fail, duplicate
+MIN_BASE_QUALITY = 13
+DELETED_BASE = '-'
+ENGINES = ('pileup', 'fetch')
+
+def count_column_codons(pileup_column, dedup=None):
+  dedup = dedup or ReadNameDeduplicator()
+  name_hashes = array('q')
+  codon_ids = array('H')
+  codons = {}
+  for pileup_read in pileup_column.pileups:
+    if pileup_read.is_del or pileup_read.is_refskip:
+      continue
+    
+    read_pos = pileup_read.query_position
+    if read_pos is None:
+      continue
+    
+    read = pileup_read.alignment.query_sequence
+    if read_pos + 2 >= len(read):
+      continue
+    
+    name_hashes.append(hash_read_name(pileup_read.alignment.query_name))
+    codon_ids.append(codons.setdefault(read[read_pos:read_pos+3], len(codons)))
+
+  return count_first_occurrences(dedup, name_hashes, codon_ids, list(codons))
+
+def count_first_occurrences(dedup, name_hashes, codon_ids, codon_names):
+  """
+  Counts the codons (codon_ids into codon_names) of the reads at one codon position; a read name
+  (fragment) is counted once, at its first alignment. Returns (codon_counts, total_reads).
+  """
+  is_first = dedup.first_occurrences(name_hashes)
+  counts = np.bincount(np.frombuffer(codon_ids, dtype=np.uint16)[is_first], minlength=len(codon_names)) if codon_names else []
   codon_counts = defaultdict(int)
+  for codon_id, codon in enumerate(codon_names):
+    if counts[codon_id]:
+      codon_counts[codon] = int(counts[codon_id])
+  return codon_counts, int(is_first.sum())
+
+def group_codon_positions(codon_positions, max_gap=SWEEP_GAP):
+  group = []
+  for codon_start_pos in codon_positions:
+    if group and codon_start_pos - group[-1] > max_gap:
+      yield group
+      group = []
+    group.append(codon_start_pos)
+  if group:
+    yield group
+
+def sweep_codon_counts(bam, codon_positions):
+  """
+  Collects codon counts for many codons in one sorted sweep over the BAM: each group of
+  nearby codons is covered by a single pileup and every column is visited once.
+  Returns {codon_start_pos: (codon_counts, total_reads)}; codons without coverage have no counts.
+  """
   ref_name = bam.references[0]
+  codon_positions = sorted(set(codon_positions))
+  codon_stats = {codon_start_pos: ({}, 0) for codon_start_pos in codon_positions}
+  dedup = ReadNameDeduplicator()
 
-  for pileup_column in bam.pileup(reference=ref_name, start=codon_start_pos-1, stop=codon_end_pos): # do I need stop position?  what does it do?
-    for pileup_read in pileup_column.pileups:
-      if pileup_read.is_del or pileup_read.is_refskip:
-        continue
-      
-      read_pos = pileup_read.query_position
-      if read_pos is None:
-        continue
-      
-      read_id = pileup_read.alignment.query_name
-      if read_id in read_ids:
-        continue
-      
-      read = pileup_read.alignment.query_sequence
-      if read_pos + 2 >= len(read):
+  for group in group_codon_positions(codon_positions):
+    # pileup columns are 0-based, codon positions are 1-based
+    pending = {codon_start_pos - 1: codon_start_pos for codon_start_pos in group}
+    for pileup_column in bam.pileup(reference=ref_name, start=group[0]-1, stop=group[-1], truncate=True):
+      codon_start_pos = pending.pop(pileup_column.reference_pos, None)
+      if codon_start_pos is not None:
+        codon_stats[codon_start_pos] = count_column_codons(pileup_column, dedup)
+      if not pending:
+        break
+  logging.info(f"Read de-duplication: peak {dedup.peak_nbytes} bytes for up to {dedup.n_reads} reads per codon")
+  return codon_stats
+
+def get_read_alignment(read):
+  """
+  Walks the CIGAR once and returns, per reference position covered by the read (from
+  reference_start), the aligned base ('-' for a deletion, None for a skipped region) with its
+  quality, and the bases inserted after each reference position (lowercase).
+  """
+  seq = read.query_sequence
+  quals = read.query_qualities
+  ref_bases, ref_quals, inserts = [], [], {}
+  query_pos = 0
+  for op, length in read.cigartuples:
+    if op in (0, 7, 8):  # M, =, X
+      ref_bases.extend(seq[query_pos:query_pos+length])
+      ref_quals.extend(quals[query_pos:query_pos+length] if quals is not None else [255] * length)
+      query_pos += length
+    elif op == 1:  # I
+      if ref_bases:
+        inserts[len(ref_bases) - 1] = seq[query_pos:query_pos+length].lower()
+      query_pos += length
+    elif op in (2, 3):  # D, N
+      ref_bases.extend((DELETED_BASE if op == 2 else None for _ in range(length)))
+      ref_quals.extend([255] * length)
+    elif op == 4:  # S
+      query_pos += length
+  return ref_bases, ref_quals, inserts
+
+def iter_read_codons(read, starts, idx):
+  """
+  Yields (codon_start, codon) for the 0-based codon starts (sorted, from starts[idx]) covered by the read.
+  """
+  ref_start, ref_end = read.reference_start, read.reference_end
+  quals = read.query_qualities
+  cigar = read.cigartuples
+  if all(op in (0, 4, 7, 8) for op, _ in cigar):
+    # no indels: codons are read straight off the query sequence
+    seq = read.query_sequence
+    clip = cigar[0][1] if cigar[0][0] == 4 else 0
+    for start in starts[idx:]:
+      if start + 3 > ref_end:
+        return
+      query_pos = start - ref_start + clip
+      if quals is None or quals[query_pos] >= MIN_BASE_QUALITY:
+        yield start, seq[query_pos:query_pos+3]
+    return
+
+  ref_bases, ref_quals, inserts = get_read_alignment(read)
+  for start in starts[idx:]:
+    if start + 3 > ref_end:
+      return
+    offset = start - ref_start
+    bases = ref_bases[offset:offset+3]
+    if None in bases or ref_quals[offset] < MIN_BASE_QUALITY:
+      continue
+    yield start, bases[0] + inserts.get(offset, '') + bases[1] + inserts.get(offset + 1, '') + bases[2]
+
+def fetch_codon_counts(bam, codon_positions):
+  """
+  Pileup-free variant of sweep_codon_counts: reads are fetched once per group of nearby codons
+  and each read's CIGAR is walked once to pull the three reference-aligned bases of every codon it
+  covers. Codons with deleted bases ('-') or inserted bases (lowercase, e.g. 'GCaT') are counted
+  explicitly instead of being skipped or read off the unaligned query sequence. Per codon, the
+  fragment name hashes and codon ids of a group are buffered in arrays and de-duplicated like a
+  pileup column once the group is fetched.
+  Returns {codon_start_pos: (codon_counts, total_reads)}.
+  """
+  ref_name = bam.references[0]
+  codon_positions = sorted(set(codon_positions))
+  codon_stats = {}
+  dedup = ReadNameDeduplicator()
+  peak_group_nbytes = 0
+
+  for group in group_codon_positions(codon_positions):
+    # reads are fetched in 0-based coordinates, codon positions are 1-based
+    starts = [codon_start_pos - 1 for codon_start_pos in group]
+    name_hashes = {start: array('q') for start in starts}
+    codon_ids = {start: array('H') for start in starts}
+    codons = {}
+    for read in bam.fetch(ref_name, starts[0], starts[-1] + 3):
+      if read.flag & SKIP_READ_FLAGS or read.query_sequence is None:
         continue
-      
-      read_ids.add(read_id)
-      codon = read[read_pos:read_pos+3]
-      codon_counts[codon] += 1
-    break
-  return codon_counts, len(read_ids)
-
-def extract_codon_frequencies(bam_file, codon_start_pos):
-  try:
+      idx = bisect_left(starts, read.reference_start)
+      name_hash = None
+      for start, codon in iter_read_codons(read, starts, idx):
+        if name_hash is None:
+          name_hash = hash_read_name(read.query_name)
+        name_hashes[start].append(name_hash)
+        codon_ids[start].append(codons.setdefault(codon, len(codons)))
+
+    peak_group_nbytes = max(peak_group_nbytes, sum(
+      name_hashes[start].itemsize * len(name_hashes[start]) + codon_ids[start].itemsize * len(codon_ids[start])
+      for start in starts))
+    codon_names = list(codons)
+    for codon_start_pos, start in zip(group, starts):
+      codon_stats[codon_start_pos] = count_first_occurrences(dedup, name_hashes[start], codon_ids[start], codon_names)
+
+  logging.info(f"Read de-duplication: peak {dedup.peak_nbytes} bytes for up to {dedup.n_reads} reads per codon, "
+               f"{peak_group_nbytes} bytes of buffered name hashes and codons per group")
+  return codon_stats
+
+def count_codons(bam, codon_positions, engine='pileup'):
+  if engine not in ENGINES:
+    raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+  if engine == 'fetch':
+    return fetch_codon_counts(bam, codon_positions)
+  return sweep_codon_counts(bam, codon_positions)
+
+def process_pileup(bam, codon_start_pos):
+  return sweep_codon_counts(bam, [codon_start_pos])[codon_start_pos]
+
+def get_count_settings(engine):
+  return f"{engine}:flags{SKIP_READ_FLAGS}:q{MIN_BASE_QUALITY}"
+
+def get_codon_stats(bam_file, codon_positions, engine='pileup', cache_dir=None, refresh=False,
+                    cache_size_mb=DEFAULT_CACHE_SIZE_MB):
+  """
+  Returns {codon_start_pos: (codon_counts, total_reads)}. With cache_dir, stored counts for the
+  same BAM (path, size, mtime), codon and settings are reused and only missing codons are counted;
+  refresh recounts every codon and overwrites the cache.
+  """
+  codon_positions = sorted(set(codon_positions))
+  if cache_dir is None:
     bam = open_and_validate_bam(bam_file)
-    codon_counts, total_reads = process_pileup(bam, codon_start_pos)
-    return calc_freq(codon_counts, total_reads)
-  except Exception as e:
-    print(e)
-  finally:
-    bam.close()
+    try:
+      return count_codons(bam, codon_positions, engine)
+    finally:
+      bam.close()
+
+  with CodonCache(cache_dir, cache_size_mb << 20) as cache:
+    bam_key, settings = get_bam_key(bam_file), get_count_settings(engine)
+    codon_stats = {} if refresh else cache.get_many(bam_key, settings, codon_positions)
+    missing = [codon_start_pos for codon_start_pos in codon_positions if codon_start_pos not in codon_stats]
+    if missing:
+      bam = open_and_validate_bam(bam_file)
+      try:
+        counted = count_codons(bam, missing, engine)
+      finally:
+        bam.close()
+      cache.put_many(bam_key, settings, counted)
+      codon_stats.update(counted)
+    logging.info(f"{bam_file}: {len(codon_positions) - len(missing)} of {len(codon_positions)} codons from cache")
+  return {codon_start_pos: codon_stats[codon_start_pos] for codon_start_pos in codon_positions}
+
+def extract_codon_frequencies(bam_file, codon_start_pos, engine='pileup', cache_dir=None, refresh=False):
+  codon_counts, total_reads = get_codon_stats(bam_file, [codon_start_pos], engine, cache_dir, refresh)[codon_start_pos]
+  return calc_freq(codon_counts, total_reads)
 
+def extract_multi_codon_frequencies(bam_file, codon_positions, engine='pileup', cache_dir=None, refresh=False,
+                                    cache_size_mb=DEFAULT_CACHE_SIZE_MB):
+  """
+  Returns long-format rows (codon_pos, codon, frequency, depth) for all codon positions,
+  collected with a single BAM open and one sorted sweep (or from the cache, see get_codon_stats).
+  """
+  codon_stats = get_codon_stats(bam_file, codon_positions, engine, cache_dir, refresh, cache_size_mb)
+  return [(codon_start_pos, *codon_freq)
+          for codon_start_pos, (codon_counts, total_reads) in codon_stats.items()
+          for codon_freq in calc_freq(codon_counts, total_reads)]
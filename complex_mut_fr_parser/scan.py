@@ -0,0 +1,152 @@
+import logging
+import numpy as np
+import pandas as pd
+from array import array
+from bisect import bisect_left
+from itertools import product
+from parsers import SKIP_READ_FLAGS, DELETED_BASE, iter_read_codons
+from dedup import hash_read_name
+from io_utils import open_and_validate_bam, get_sample_id, get_codon_table_label
+
+BASES = 'ACGT'
+CODONS = [''.join(codon) for codon in product(BASES, repeat=3)]
+INDEL_BIN = len(CODONS)
+N_BIN = len(CODONS) + 1
+BIN_LABELS = CODONS + ['INDEL', 'N']
+CODON_BINS = {codon: idx for idx, codon in enumerate(CODONS)}
+SCAN_FORMATS = ('npz', 'parquet')
+# flat (codon row, bin) indices buffered before they are added into the count tensor
+FLUSH_SIZE = 1 << 20
+MIN_FREQ = 0.01
+MIN_DEPTH = 20
+
+def get_codon_bin(codon):
+  codon_bin = CODON_BINS.get(codon)
+  if codon_bin is not None:
+    return codon_bin
+  if len(codon) != 3 or DELETED_BASE in codon:
+    return INDEL_BIN
+  codon_bin = CODON_BINS.get(codon.upper())
+  return N_BIN if codon_bin is None else codon_bin
+
+def scan_codon_counts(bam, codon_positions):
+  """
+  Counts codons at every requested codon position with one fetch over the scanned range.
+  Counts go into a dense (codon positions x 66) tensor: the 64 codons, an INDEL bin (codons with
+  deleted or inserted bases) and an N bin (any other base). Overlapping mates of one fragment are
+  counted once: a mate skips the codons its first-seen mate already covered. Mates waiting for
+  their pair are keyed by fragment name hash (see hash_read_name), not by read name.
+
+  Returns the sorted codon positions (1-based) and the int64 count tensor.
+  """
+  ref_name = bam.references[0]
+  codon_positions = np.unique(np.asarray(codon_positions, dtype=np.int64))
+  starts = (codon_positions - 1).tolist()
+  rows = {start: row for row, start in enumerate(starts)}
+  n_bins = len(BIN_LABELS)
+  counts = np.zeros(len(starts) * n_bins, dtype=np.int64)
+  flat_idx = array('q')
+  mate_rows = {}
+  peak_mates = 0
+
+  for read in bam.fetch(ref_name, starts[0], starts[-1] + 3):
+    if read.flag & SKIP_READ_FLAGS or read.query_sequence is None:
+      continue
+    name_hash = hash_read_name(read.query_name)
+    first_row, last_row = mate_rows.pop(name_hash, (0, -1))
+    read_first, read_last = None, -1
+    for start, codon in iter_read_codons(read, starts, bisect_left(starts, read.reference_start)):
+      row = rows[start]
+      if first_row <= row <= last_row:
+        continue
+      flat_idx.append(row * n_bins + get_codon_bin(codon))
+      if read_first is None:
+        read_first = row
+      read_last = row
+    if read.is_paired and read_first is not None and last_row < 0:
+      mate_rows[name_hash] = (read_first, read_last)
+      peak_mates = max(peak_mates, len(mate_rows))
+    if len(flat_idx) >= FLUSH_SIZE:
+      counts += np.bincount(np.frombuffer(flat_idx, dtype=np.int64), minlength=counts.size)
+      flat_idx = array('q')
+
+  if flat_idx:
+    counts += np.bincount(np.frombuffer(flat_idx, dtype=np.int64), minlength=counts.size)
+  logging.info(f"Mate de-duplication: peak {peak_mates} fragments waiting for their mate")
+  return codon_positions, counts.reshape(len(starts), n_bins)
+
+def save_codon_counts(codon_positions, counts, output_file_path, smpl_id, label, scan_format='npz'):
+  """
+  Exports the count tensor: NPZ (codon_pos, bins, counts arrays) or a wide Parquet table
+  (CODON_POS plus one column per codon/INDEL/N bin).
+  """
+  if scan_format not in SCAN_FORMATS:
+    raise ValueError(f"Unknown scan format '{scan_format}', expected one of {SCAN_FORMATS}")
+  output_path = f"{output_file_path}/{smpl_id}_{label}_codon_counts.{scan_format}"
+  if scan_format == 'npz':
+    with open(output_path, 'wb') as file:
+      np.savez_compressed(file, sample_id=smpl_id, codon_pos=codon_positions, bins=np.array(BIN_LABELS), counts=counts)
+  else:
+    df = pd.DataFrame(counts, columns=BIN_LABELS)
+    df.insert(0, 'CODON_POS', codon_positions)
+    df.to_parquet(output_path, index=False)
+  return output_path
+
+def get_ref_codon_bins(codon_positions, counts, ref_seq=None):
+  """
+  Reference codon bin per position: from the reference sequence if given, else the
+  consensus (most frequent) codon.
+  """
+  if ref_seq is None:
+    return counts[:, :len(CODONS)].argmax(axis=1)
+  return np.array([get_codon_bin(ref_seq[pos-1:pos+2].upper()) for pos in codon_positions.tolist()])
+
+def complex_mutation_report(smpl_id, codon_positions, counts, ref_seq=None, min_freq=MIN_FREQ, min_depth=MIN_DEPTH):
+  """
+  Derives the complex mutation table from the count tensor: codons that differ from the
+  reference codon in two or more bases, or carry an indel, at frequency >= min_freq and at
+  positions with depth >= min_depth.
+  """
+  depth = counts.sum(axis=1)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    freqs = np.where(depth[:, None] > 0, counts / depth[:, None], 0)
+
+  ref_bins = get_ref_codon_bins(codon_positions, counts, ref_seq)
+  codon_digits = np.array([[idx // 16, idx // 4 % 4, idx % 4] for idx in range(len(CODONS))])
+  ref_digits = codon_digits[np.minimum(ref_bins, len(CODONS) - 1)]
+  n_changes = (codon_digits[None, :, :] != ref_digits[:, None, :]).sum(axis=2)
+  # INDEL counts as complex, N is never reported
+  n_changes = np.concatenate([n_changes, np.full((len(ref_bins), 2), 3)], axis=1)
+  n_changes[:, N_BIN] = 0
+  n_changes[ref_bins >= len(CODONS)] = 0
+
+  mask = (n_changes >= 2) & (freqs >= min_freq) & (depth[:, None] >= min_depth) & (counts > 0)
+  rows, bins = np.nonzero(mask)
+  labels = np.array(BIN_LABELS)
+  df = pd.DataFrame({
+    'SAMPLE_ID': smpl_id,
+    'CODON_POS': codon_positions[rows],
+    'REF_CODON': labels[ref_bins[rows]],
+    'CODON': labels[bins],
+    'N_CHANGES': n_changes[rows, bins],
+    'FREQUENCY': np.round(freqs[rows, bins], 4),
+    'DEPTH': counts[rows, bins],
+    'TOTAL_DEPTH': depth[rows],
+  })
+  return df.sort_values(by=['CODON_POS', 'FREQUENCY'], ascending=[True, False])
+
+def scan_bam(bam_file_path, codon_positions, output_file_path, ref_seq=None, scan_format='npz',
+             min_freq=MIN_FREQ, min_depth=MIN_DEPTH):
+  bam = open_and_validate_bam(bam_file_path)
+  try:
+    codon_positions, counts = scan_codon_counts(bam, codon_positions)
+  finally:
+    bam.close()
+
+  smpl_id = get_sample_id(bam_file_path)
+  label = get_codon_table_label(codon_positions.tolist())
+  counts_path = save_codon_counts(codon_positions, counts, output_file_path, smpl_id, label, scan_format)
+  report = complex_mutation_report(smpl_id, codon_positions, counts, ref_seq, min_freq, min_depth)
+  report_path = f"{output_file_path}/{smpl_id}_{label}_complex_report.csv"
+  report.to_csv(report_path, index=False)
+  return counts_path, report_path
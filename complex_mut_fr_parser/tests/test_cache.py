@@ -0,0 +1,61 @@
+import unittest
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from cache import CodonCache, get_bam_key
+from parsers import get_codon_stats, get_count_settings
+from test_parsers import write_test_bam, REF_SEQ
+
+class TestCache(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+    self.bam_path = os.path.join(self.tmp_dir.name, 'sample.bam')
+    write_test_bam(self.bam_path, [('r1', 0, REF_SEQ[:30]), ('r2', 0, REF_SEQ[:3] + 'ACT' + REF_SEQ[6:30])])
+
+  def test_put_get(self):
+    with CodonCache(self.cache_dir) as cache:
+      cache.put_many('bam', 'pileup', {4: ({'GCT': 1, 'ACT': 1}, 2), 7: ({}, 0)})
+      self.assertEqual(cache.get_many('bam', 'pileup', [4, 7, 10]), {4: ({'GCT': 1, 'ACT': 1}, 2), 7: ({}, 0)})
+      self.assertEqual(cache.get_many('bam', 'fetch', [4]), {})
+      self.assertEqual(cache.get_many('other_bam', 'pileup', [4]), {})
+
+  def test_lru_eviction(self):
+    with CodonCache(self.cache_dir) as cache:
+      cache.put_many('bam', 'pileup', {pos: ({'GCT': pos}, pos) for pos in range(10)})
+      entry_size = cache.size() // 10
+      cache.max_bytes = entry_size * 10
+      time.sleep(0.01)
+      cache.get_many('bam', 'pileup', [0])
+      time.sleep(0.01)
+      cache.put_many('bam', 'pileup', {10: ({'GCT': 10}, 10)})
+      kept = cache.get_many('bam', 'pileup', range(11))
+      self.assertLessEqual(cache.size(), cache.max_bytes)
+      # the recently read entry 0 and the new entry 10 survive, the oldest ones go first
+      self.assertIn(0, kept)
+      self.assertIn(10, kept)
+      self.assertNotIn(1, kept)
+
+  def test_bam_key_changes_with_file(self):
+    bam_key = get_bam_key(self.bam_path)
+    write_test_bam(self.bam_path, [('r1', 0, REF_SEQ[:30])])
+    os.utime(self.bam_path, ns=(1, 1))
+    self.assertNotEqual(get_bam_key(self.bam_path), bam_key)
+
+  def test_get_codon_stats_uses_cache(self):
+    uncached = get_codon_stats(self.bam_path, [4, 7])
+    self.assertEqual(get_codon_stats(self.bam_path, [4, 7], cache_dir=self.cache_dir), uncached)
+    # served from the cache: the stored entry is returned even though the bam is not read again
+    with CodonCache(self.cache_dir) as cache:
+      cache.put_many(get_bam_key(self.bam_path), get_count_settings('pileup'), {4: ({'XXX': 2}, 2)})
+    self.assertEqual(get_codon_stats(self.bam_path, [4], cache_dir=self.cache_dir)[4], ({'XXX': 2}, 2))
+    self.assertEqual(dict(get_codon_stats(self.bam_path, [4], cache_dir=self.cache_dir, refresh=True)[4][0]),
+                     {'GCT': 1, 'ACT': 1})
+
+if __name__ == '__main__':
+  unittest.main()
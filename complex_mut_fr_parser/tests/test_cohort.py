@@ -0,0 +1,45 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import pandas as pd
+from cohort import run_cohort
+from io_utils import collect_bam_paths
+from test_parsers import write_test_bam, REF_SEQ
+
+class TestCohort(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.bam_dir = os.path.join(self.tmp_dir.name, 'bams')
+    os.makedirs(self.bam_dir)
+    write_test_bam(os.path.join(self.bam_dir, 'A.fastq.gz.bam'), [('r1', 0, REF_SEQ[:30])])
+    write_test_bam(os.path.join(self.bam_dir, 'B.bam'), [('r1', 0, REF_SEQ[:3] + 'ACT' + REF_SEQ[6:30])])
+    with open(os.path.join(self.bam_dir, 'C.bam'), 'w') as file:
+      file.write('not a bam')
+
+  def test_collect_bam_paths(self):
+    bam_paths = collect_bam_paths(self.bam_dir)
+    self.assertEqual([os.path.basename(path) for path in bam_paths], ['A.fastq.gz.bam', 'B.bam', 'C.bam'])
+    manifest_path = os.path.join(self.tmp_dir.name, 'manifest.tsv')
+    with open(manifest_path, 'w') as file:
+      file.write('# bam\tsample\nbams/B.bam\tB\n\nbams/A.fastq.gz.bam\tA\n')
+    self.assertEqual(collect_bam_paths(manifest_path),
+                     [os.path.join(self.tmp_dir.name, 'bams/B.bam'), os.path.join(self.tmp_dir.name, 'bams/A.fastq.gz.bam')])
+
+  def test_run_cohort(self):
+    for workers in (1, 2):
+      output_path, failed = run_cohort(collect_bam_paths(self.bam_dir), [4, 10], self.tmp_dir.name, workers)
+      self.assertEqual([os.path.basename(path) for path, _ in failed], ['C.bam'])
+      df = pd.read_csv(output_path)
+      self.assertEqual(list(df.columns), ['SAMPLE_ID', 'CODON_POS', 'CODON', 'FREQUENCY', 'DEPTH'])
+      self.assertEqual(list(df.itertuples(index=False, name=None)), [
+        ('A', 4, 'GCT', 1.0, 1), ('A', 10, 'GTT', 1.0, 1),
+        ('B', 4, 'ACT', 1.0, 1), ('B', 10, 'GTT', 1.0, 1)])
+      self.assertFalse(os.path.exists(output_path + '.part'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+import sys
+import os
+from array import array
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dedup import ReadNameDeduplicator, hash_read_name, get_fragment_name
+
+class TestDedup(unittest.TestCase):
+  def test_get_fragment_name(self):
+    self.assertEqual(get_fragment_name('A00123:1:1101:1000:2000/1'), 'A00123:1:1101:1000:2000')
+    self.assertEqual(get_fragment_name('A00123:1:1101:1000:2000/2'), 'A00123:1:1101:1000:2000')
+    self.assertEqual(get_fragment_name('A00123:1:1101:1000:2000'), 'A00123:1:1101:1000:2000')
+
+  def test_first_occurrences(self):
+    dedup = ReadNameDeduplicator()
+    names = ['r1/1', 'r2', 'r1/2', 'r3', 'r2', 'r1']
+    is_first = dedup.first_occurrences(array('q', map(hash_read_name, names)))
+    self.assertEqual(is_first.tolist(), [True, True, False, True, False, False])
+    self.assertEqual(dedup.n_reads, 6)
+    self.assertGreater(dedup.peak_nbytes, 0)
+    self.assertEqual(dedup.first_occurrences(array('q')).tolist(), [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,13 +1,129 @@
 import unittest
 import sys
 import os
+import tempfile
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from parsers import extract_codon_frequencies
+import pysam
+from parsers import (
+  extract_codon_frequencies, extract_multi_codon_frequencies, process_pileup, sweep_codon_counts, fetch_codon_counts)
+from io_utils import read_codon_positions
+
+REF_SEQ = 'ATGGCTACTGTTAAACCCGGGTTTAAACCCGGGTTTAAACCCGGGTTTAAACCCGGGTTT'
+
+def write_test_bam(bam_path, reads):
+  """
+  Writes a sorted, indexed BAM with (name, start, sequence[, cigartuples]) reads; reads without
+  cigartuples fully match over their length.
+  """
+  header = {'HD': {'VN': '1.6', 'SO': 'coordinate'}, 'SQ': [{'SN': 'REF1', 'LN': len(REF_SEQ)}]}
+  with pysam.AlignmentFile(bam_path, 'wb', header=header) as bam:
+    for name, start, seq, *cigar in sorted(reads, key=lambda read: read[1]):
+      segment = pysam.AlignedSegment(bam.header)
+      segment.query_name = name
+      segment.reference_id = 0
+      segment.reference_start = start
+      segment.query_sequence = seq
+      segment.cigartuples = cigar[0] if cigar else [(0, len(seq))]
+      segment.query_qualities = pysam.qualitystring_to_array('I' * len(seq))
+      segment.mapping_quality = 60
+      bam.write(segment)
+  pysam.index(bam_path)
 
 class TestParsesr(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.bam_path = os.path.join(self.tmp_dir.name, 'sample.bam')
+    write_test_bam(self.bam_path, [
+      ('r1', 0, REF_SEQ[:30]),
+      ('r2', 0, REF_SEQ[:3] + 'ACT' + REF_SEQ[6:30]),
+      ('r3', 2, REF_SEQ[2:3] + 'GTT' + REF_SEQ[6:40]),
+      ('r4', 20, REF_SEQ[20:60]),
+    ])
+
+  @unittest.skipUnless(os.path.exists('./test_data/coreF44.fastq.gz.bam'), 'test data not available')
   def test_extract_codon_frequencies(self):
-    curr_output = extract_codon_frequencies('./test_data/coreF44.fastq.gz.bam', 6747)
+    curr_output = dict((codon, freq) for codon, freq, _ in extract_codon_frequencies('./test_data/coreF44.fastq.gz.bam', 6747))
     self.assertEqual(curr_output['GCT'], 0.4972)
     self.assertEqual(curr_output['ACT'], 0.3437)
-    self.assertEqual(curr_output['GTT'], 0.1075)
\ No newline at end of file
+    self.assertEqual(curr_output['GTT'], 0.1075)
+
+  def test_process_pileup(self):
+    with pysam.AlignmentFile(self.bam_path, 'rb') as bam:
+      codon_counts, total_reads = process_pileup(bam, 4)
+    self.assertEqual(dict(codon_counts), {'GCT': 1, 'ACT': 1, 'GTT': 1})
+    self.assertEqual(total_reads, 3)
+
+  def test_sweep_matches_single_codon_runs(self):
+    codon_positions = [28, 4, 22, 55, 1]
+    with pysam.AlignmentFile(self.bam_path, 'rb') as bam:
+      codon_stats = sweep_codon_counts(bam, codon_positions)
+      for codon_start_pos in codon_positions:
+        self.assertEqual(codon_stats[codon_start_pos], process_pileup(bam, codon_start_pos))
+    self.assertEqual(list(codon_stats), [1, 4, 22, 28, 55])
+    self.assertEqual(dict(codon_stats[28][0]), {'CCC': 4})
+
+  def test_extract_multi_codon_frequencies(self):
+    rows = extract_multi_codon_frequencies(self.bam_path, [4, 59])
+    self.assertEqual(sorted(rows), [(4, 'ACT', 0.3333, 1), (4, 'GCT', 0.3333, 1), (4, 'GTT', 0.3333, 1)])
+
+  def test_fetch_matches_pileup(self):
+    codon_positions = [1, 4, 22, 28, 55, 59]
+    with pysam.AlignmentFile(self.bam_path, 'rb') as bam:
+      pileup_stats = sweep_codon_counts(bam, codon_positions)
+      fetch_stats = fetch_codon_counts(bam, codon_positions)
+    for codon_start_pos in codon_positions:
+      self.assertEqual(dict(fetch_stats[codon_start_pos][0]), dict(pileup_stats[codon_start_pos][0]))
+      self.assertEqual(fetch_stats[codon_start_pos][1], pileup_stats[codon_start_pos][1])
+
+  def test_fetch_counts_indel_codons(self):
+    bam_path = os.path.join(self.tmp_dir.name, 'indels.bam')
+    write_test_bam(bam_path, [
+      # deletion of the 2nd base of codon 4..6 (GCT -> G-T)
+      ('del', 0, REF_SEQ[:4] + REF_SEQ[5:30], [(0, 4), (2, 1), (0, 25)]),
+      # insertion of AA after the 1st base of codon 4..6 (GCT -> GaaCT)
+      ('ins', 0, REF_SEQ[:4] + 'AA' + REF_SEQ[4:30], [(0, 4), (1, 2), (0, 26)]),
+      # soft-clipped read: codons are taken from the aligned part only
+      ('clip', 3, 'NNN' + REF_SEQ[3:30], [(4, 3), (0, 27)]),
+      ('skip', 0, REF_SEQ[:3] + REF_SEQ[6:30], [(0, 3), (3, 3), (0, 24)]),
+    ])
+    with pysam.AlignmentFile(bam_path, 'rb') as bam:
+      codon_stats = fetch_codon_counts(bam, [4, 10])
+    self.assertEqual(dict(codon_stats[4][0]), {'G-T': 1, 'GaaCT': 1, 'GCT': 1})
+    self.assertEqual(codon_stats[4][1], 3)
+    self.assertEqual(dict(codon_stats[10][0]), {REF_SEQ[9:12]: 4})
+
+  def test_fetch_counts_fragments_once(self):
+    bam_path = os.path.join(self.tmp_dir.name, 'mates.bam')
+    write_test_bam(bam_path, [
+      # overlapping mates of one fragment, with and without /1 /2 suffixes
+      ('frag1/1', 0, REF_SEQ[:30]),
+      ('frag1/2', 2, REF_SEQ[2:3] + 'GTT' + REF_SEQ[6:40]),
+      ('frag2', 0, REF_SEQ[:3] + 'ACT' + REF_SEQ[6:30]),
+      ('frag2', 3, REF_SEQ[3:40]),
+      ('frag3', 20, REF_SEQ[20:60]),
+    ])
+    codon_positions = [4, 22, 55]
+    with pysam.AlignmentFile(bam_path, 'rb') as bam:
+      pileup_stats = sweep_codon_counts(bam, codon_positions)
+      fetch_stats = fetch_codon_counts(bam, codon_positions)
+    # the first-fetched mate wins
+    self.assertEqual(dict(fetch_stats[4][0]), {'GCT': 1, 'ACT': 1})
+    self.assertEqual(fetch_stats[4][1], 2)
+    self.assertEqual(fetch_stats[22][1], 3)
+    for codon_start_pos in codon_positions:
+      self.assertEqual(dict(fetch_stats[codon_start_pos][0]), dict(pileup_stats[codon_start_pos][0]))
+      self.assertEqual(fetch_stats[codon_start_pos][1], pileup_stats[codon_start_pos][1])
+
+  def test_read_codon_positions(self):
+    self.assertEqual(read_codon_positions('6747'), [6747])
+    self.assertEqual(read_codon_positions('6747,6750'), [6747, 6750])
+    self.assertEqual(read_codon_positions('10..21'), [10, 13, 16, 19])
+    positions_path = os.path.join(self.tmp_dir.name, 'codons.txt')
+    with open(positions_path, 'w') as file:
+      file.write('# codons\n4\n\n22\n')
+    self.assertEqual(read_codon_positions(positions_path), [4, 22])
+
+if __name__ == '__main__':
+  unittest.main()
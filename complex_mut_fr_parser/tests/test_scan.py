@@ -0,0 +1,71 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import numpy as np
+import pandas as pd
+import pysam
+from parsers import fetch_codon_counts
+from scan import scan_codon_counts, complex_mutation_report, scan_bam, get_codon_bin, BIN_LABELS, INDEL_BIN, N_BIN
+from test_parsers import write_test_bam, REF_SEQ
+
+class TestScan(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.bam_path = os.path.join(self.tmp_dir.name, 'sample.bam')
+    write_test_bam(self.bam_path, [
+      ('r1', 0, REF_SEQ[:30]),
+      ('r2', 0, REF_SEQ[:3] + 'ACT' + REF_SEQ[6:30]),
+      ('r3', 0, REF_SEQ[:3] + 'ACA' + REF_SEQ[6:30]),
+      ('r4', 0, REF_SEQ[:3] + 'NCT' + REF_SEQ[6:30]),
+      ('del', 0, REF_SEQ[:4] + REF_SEQ[5:30], [(0, 4), (2, 1), (0, 25)]),
+      ('r5', 20, REF_SEQ[20:60]),
+    ])
+
+  def test_get_codon_bin(self):
+    self.assertEqual(BIN_LABELS[get_codon_bin('GCT')], 'GCT')
+    self.assertEqual(get_codon_bin('G-T'), INDEL_BIN)
+    self.assertEqual(get_codon_bin('GaaCT'), INDEL_BIN)
+    self.assertEqual(get_codon_bin('GNT'), N_BIN)
+
+  def test_scan_matches_fetch_engine(self):
+    codon_positions = list(range(1, 58, 3))
+    with pysam.AlignmentFile(self.bam_path, 'rb') as bam:
+      scanned_positions, counts = scan_codon_counts(bam, codon_positions)
+      fetch_stats = fetch_codon_counts(bam, codon_positions)
+    self.assertEqual(scanned_positions.tolist(), codon_positions)
+    self.assertEqual(counts.shape, (len(codon_positions), 66))
+    for row, codon_start_pos in enumerate(codon_positions):
+      codon_counts, total_reads = fetch_stats[codon_start_pos]
+      self.assertEqual(counts[row].sum(), total_reads)
+      for codon, count in codon_counts.items():
+        self.assertEqual(counts[row, get_codon_bin(codon)], count)
+
+  def test_complex_mutation_report(self):
+    with pysam.AlignmentFile(self.bam_path, 'rb') as bam:
+      codon_positions, counts = scan_codon_counts(bam, [4, 7])
+    report = complex_mutation_report('sample', codon_positions, counts, REF_SEQ, min_freq=0.1, min_depth=1)
+    # ACT differs from GCT in one base, ACA in two; the deletion is reported as INDEL
+    self.assertEqual(sorted(zip(report['CODON_POS'], report['CODON'], report['DEPTH'])), [(4, 'ACA', 1), (4, 'INDEL', 1)])
+    self.assertEqual(set(report['REF_CODON']), {'GCT'})
+    self.assertTrue(complex_mutation_report('sample', codon_positions, counts, REF_SEQ, min_depth=6).empty)
+
+  def test_scan_bam_exports(self):
+    for scan_format in ('npz', 'parquet'):
+      counts_path, report_path = scan_bam(self.bam_path, [4, 7], self.tmp_dir.name, REF_SEQ, scan_format)
+      if scan_format == 'npz':
+        with np.load(counts_path) as scan:
+          self.assertEqual(scan['codon_pos'].tolist(), [4, 7])
+          self.assertEqual(scan['counts'][0, list(scan['bins']).index('GCT')], 1)
+      else:
+        df = pd.read_parquet(counts_path)
+        self.assertEqual(df['CODON_POS'].tolist(), [4, 7])
+        self.assertEqual(df['GCT'].tolist(), [1, 0])
+      self.assertTrue(os.path.exists(report_path))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,2 +1,5 @@
 def calc_freq(codon_counts, total_reads):
-  return [(codon, round(count / total_reads, 4), count) for codon, count in codon_counts.items()]
\ No newline at end of file
+  return [(codon, round(count / total_reads, 4), count) for codon, count in codon_counts.items()]
+
+def get_codon_range(cds_start, cds_end):
+  return list(range(cds_start, cds_end - 1, 3))
\ No newline at end of file
@@ -0,0 +1,143 @@
+import glob
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Any, Optional, Dict
+from parsers import extract_file_name, iter_vcf_records, Reference, CdsLookup
+from utils import write_rows, open_sink, get_file_tag
+
+VCF_EXTENSIONS = ('*.vcf', '*.vcf.gz', '*.vcf.bgz')
+MERGED_SAMPLE_ID = 'all_samples'
+
+# reference shared by all VCFs of a batch; set once per worker process
+_batch_context = {}
+
+def collect_vcf_paths(paths: List[str]) -> List[str]:
+  """
+  Expands input paths into a list of VCF files. Directories are searched (non-recursively)
+  for *.vcf, *.vcf.gz and *.vcf.bgz files.
+
+  Parameters:
+    paths (List[str]): VCF file and/or directory paths.
+
+  Returns:
+    List[str]: VCF file paths, in input order (sorted within each directory).
+  """
+  vcf_paths = []
+  for path in paths:
+    if os.path.isdir(path):
+      dir_files = set()
+      for pattern in VCF_EXTENSIONS:
+        dir_files.update(glob.glob(os.path.join(path, pattern)))
+      vcf_paths.extend(sorted(dir_files))
+    else:
+      vcf_paths.append(path)
+  return vcf_paths
+
+def init_batch_context(record_type: str, cds_index: CdsLookup, full_ref_seq: Reference,
+                       output_path: str, merged: bool, output_format: str, vcf_options: Dict[str, Any]) -> None:
+  _batch_context.update(
+    record_type=record_type, cds_index=cds_index, full_ref_seq=full_ref_seq,
+    output_path=output_path, merged=merged, output_format=output_format, vcf_options=vcf_options)
+
+def process_one_vcf(vcf_file_path: str) -> Tuple[str, int, Optional[List[List[Any]]]]:
+  """
+  Extracts indels from one VCF using the batch context. Per-sample files are streamed
+  by the worker itself; in merged mode the sample's rows are returned to the caller instead.
+
+  Parameters:
+    vcf_file_path (str): Path to the VCF file.
+
+  Returns:
+    Tuple[str, int, Optional[List[List[Any]]]]: Sample ID, number of indels and rows (merged mode only).
+  """
+  sample_id = extract_file_name(vcf_file_path)
+  rows = iter_vcf_records(
+    _batch_context['record_type'], sample_id, vcf_file_path,
+    _batch_context['cds_index'], _batch_context['full_ref_seq'], **_batch_context['vcf_options'])
+  if _batch_context['merged']:
+    data = list(rows)
+    return sample_id, len(data), data
+  n_indels = write_rows(
+    sample_id, _batch_context['output_path'], rows, _batch_context['output_format'],
+    get_file_tag(_batch_context['vcf_options']))
+  return sample_id, n_indels, None
+
+def run_batch(
+  record_type: str,
+  vcf_paths: List[str],
+  cds_index: CdsLookup,
+  full_ref_seq: Reference,
+  output_path: str,
+  workers: int = 1,
+  merged: bool = False,
+  output_format: str = 'csv',
+  vcf_options: Optional[Dict[str, Any]] = None
+  ) -> List[Tuple[str, str]]:
+  """
+  Extracts indels from many VCFs against one reference. Every VCF is processed
+  independently: a failing file is logged and reported, the rest of the batch continues.
+
+  Parameters:
+    record_type (str): VCF type ('legacy', 'mutect2' or 'auto').
+    vcf_paths (List[str]): Paths to the VCF files.
+    cds_index (Union[CdsIndex, CdsStore]): CDS index or per-contig CDS indexes.
+    full_ref_seq (Union[str, ReferenceStore]): full reference sequence or multi-contig reference store.
+    output_path (str): Output directory.
+    workers (int): Number of worker processes; 1 processes files in the current process.
+    merged (bool): Write one merged table instead of one file per sample. Rows of a sample are
+      appended once the whole sample succeeded. At most `workers` files are in flight, so at most
+      `workers` samples are held in memory while results are written in input order.
+    output_format (str): One of 'csv', 'csv.gz' or 'parquet'.
+    vcf_options (Optional[Dict[str, Any]]): Keyword options for parsers.iter_vcf_records
+      (prefilter, min_dp, min_af, valid_codon_only, engine).
+
+  Returns:
+    List[Tuple[str, str]]: Failed VCF paths with error messages.
+  """
+  vcf_options = vcf_options or {}
+  context = (record_type, cds_index, full_ref_seq, output_path, merged, output_format, vcf_options)
+  failed = []
+  merged_sink = open_sink(MERGED_SAMPLE_ID, output_path, output_format, get_file_tag(vcf_options)) if merged else None
+
+  def collect(vcf_file_path, get_result):
+    try:
+      sample_id, n_indels, data = get_result()
+    except Exception as e:
+      logging.error(f"Error processing {vcf_file_path}: {e}")
+      failed.append((vcf_file_path, str(e)))
+      return
+    logging.info(f"{sample_id}: {n_indels} indels")
+    if data:
+      merged_sink.write_rows(data)
+
+  try:
+    if workers <= 1:
+      init_batch_context(*context)
+      for vcf_file_path in vcf_paths:
+        collect(vcf_file_path, lambda: process_one_vcf(vcf_file_path))
+    else:
+      with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_context, initargs=context) as executor:
+        # sliding window of in-flight files, refilled as each result is collected in input order
+        pending_paths = iter(vcf_paths)
+        in_flight = deque()
+        for vcf_file_path in pending_paths:
+          in_flight.append((vcf_file_path, executor.submit(process_one_vcf, vcf_file_path)))
+          if len(in_flight) >= workers:
+            break
+        while in_flight:
+          vcf_file_path, future = in_flight.popleft()
+          collect(vcf_file_path, future.result)
+          next_path = next(pending_paths, None)
+          if next_path is not None:
+            in_flight.append((next_path, executor.submit(process_one_vcf, next_path)))
+  except BaseException:
+    if merged_sink is not None:
+      merged_sink.abort()
+    raise
+
+  if merged_sink is not None:
+    merged_sink.close()
+
+  return failed
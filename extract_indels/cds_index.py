@@ -0,0 +1,137 @@
+import bisect
+from typing import Dict, List, Tuple, Iterable
+
+CdsRegion = Tuple[int, int, str]
+# (names the contig can be addressed by, CDS regions of the contig); the first name is the primary one
+ContigCds = Tuple[Tuple[str, ...], List[CdsRegion]]
+
+class CdsIndex:
+  """
+  Static interval index over CDS regions (1-based, inclusive coordinates).
+
+  The regions are split into elementary segments at every CDS boundary; each segment
+  stores the CDS regions that cover it. Point and range lookups are then a bisect over
+  the sorted segment starts instead of a scan over all regions.
+  """
+
+  def __init__(self, cds_regions: Iterable[CdsRegion]):
+    """
+    Builds the index.
+
+    Parameters:
+      cds_regions (Iterable[Tuple[int, int, str]]): CDS regions of one contig, as returned per contig by reference.parse_genbank.
+    """
+    self.regions: List[CdsRegion] = list(cds_regions)
+
+    events = []
+    for idx, (start, end, _) in enumerate(self.regions):
+      events.append((start, 1, idx))
+      events.append((end + 1, -1, idx))
+    events.sort()
+
+    self._bounds: List[int] = []
+    self._covering: List[Tuple[int, ...]] = []
+    active = set()
+    event_idx = 0
+    while event_idx < len(events):
+      bound = events[event_idx][0]
+      while event_idx < len(events) and events[event_idx][0] == bound:
+        _, kind, idx = events[event_idx]
+        if kind == 1:
+          active.add(idx)
+        else:
+          active.discard(idx)
+        event_idx += 1
+      self._bounds.append(bound)
+      self._covering.append(tuple(sorted(active)))
+
+  def __len__(self) -> int:
+    return len(self.regions)
+
+  def _segment(self, pos: int) -> int:
+    return bisect.bisect_right(self._bounds, pos) - 1
+
+  def query(self, pos: int) -> List[CdsRegion]:
+    """
+    Gets all CDS regions that contain a position.
+
+    Parameters:
+      pos (int): 1-based position.
+
+    Returns:
+      List[Tuple[int, int, str]]: Overlapping CDS regions, in GenBank order.
+    """
+    seg = self._segment(pos)
+    if seg < 0:
+      return []
+    return [self.regions[idx] for idx in self._covering[seg]]
+
+  def query_range(self, start: int, end: int) -> List[CdsRegion]:
+    """
+    Gets all CDS regions that overlap the closed range [start, end].
+
+    Parameters:
+      start (int): 1-based range start.
+      end (int): 1-based range end (inclusive).
+
+    Returns:
+      List[Tuple[int, int, str]]: Overlapping CDS regions, in GenBank order.
+    """
+    first = max(self._segment(start), 0)
+    last = self._segment(end)
+    hits = set()
+    for seg in range(first, last + 1):
+      hits.update(self._covering[seg])
+    return [self.regions[idx] for idx in sorted(hits)]
+
+  def products(self, pos: int) -> List[str]:
+    """
+    Gets the products of all CDS regions that contain a position.
+
+    Parameters:
+      pos (int): 1-based position.
+
+    Returns:
+      List[str]: Unique product names, in GenBank order.
+    """
+    return list(dict.fromkeys(product for _, _, product in self.query(pos)))
+
+class CdsStore:
+  """
+  CDS regions of a multi-contig reference, one CdsIndex per contig, addressed by CHROM like
+  ReferenceStore: CDS coordinates are per contig, so a position is only looked up among the
+  CDS regions of its own contig.
+  """
+
+  def __init__(self, contig_cds: Iterable[ContigCds]):
+    """
+    Builds one index per contig.
+
+    Parameters:
+      contig_cds (Iterable[Tuple[Tuple[str, ...], List[Tuple[int, int, str]]]]): Contig names and
+        CDS regions, in GenBank order.
+    """
+    self.contigs: List[Tuple[Tuple[str, ...], CdsIndex]] = [(names, CdsIndex(regions)) for names, regions in contig_cds]
+    self._by_name: Dict[str, CdsIndex] = {}
+    for names, cds_index in self.contigs:
+      for name in names:
+        self._by_name.setdefault(name, cds_index)
+
+  @property
+  def contig_names(self) -> List[str]:
+    return [names[0] for names, _ in self.contigs]
+
+  def __len__(self) -> int:
+    return len(self.contigs)
+
+  def __getitem__(self, chrom: str) -> CdsIndex:
+    """
+    Gets the CDS index of a contig by VCF CHROM. A single-contig reference is returned
+    for any CHROM, as VCF and GenBank naming of the same genome often differ.
+    """
+    cds_index = self._by_name.get(chrom)
+    if cds_index is not None:
+      return cds_index
+    if len(self.contigs) == 1:
+      return self.contigs[0][1]
+    raise KeyError(f"Contig '{chrom}' not found in reference (available: {', '.join(self.contig_names)})")
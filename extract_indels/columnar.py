@@ -0,0 +1,171 @@
+import numpy as np
+from itertools import islice
+from typing import List, Any, Iterator, Dict, Optional
+from parsers import (
+  Reference, CdsLookup, MIN_DP, MIN_AF,
+  detect_record_type, get_record_parser, get_sample_name_from_vcf, is_valid_codon_row)
+from vcf_stream import PrefilteredVcfReader
+from regions import Region
+
+CHUNK_SIZE = 50000
+# legacy FREQUENCY is rounded to 2 decimals before the threshold check; the vectorized
+# mask uses the unrounded value, so it is widened by this margin and the row parser decides
+FREQ_ROUND_MARGIN = 0.005
+
+def decode_columns(lines: List[str], record_type: str) -> Dict[str, np.ndarray]:
+  """
+  Decodes the fields needed for filtering from raw VCF lines into NumPy columns.
+  Values that cannot be decoded are NaN and the line is flagged as undecided.
+
+  Parameters:
+    lines (List[str]): Raw VCF data lines (single-sample VCF).
+    record_type (str): 'legacy' or 'mutect2'.
+
+  Returns:
+    Dict[str, np.ndarray]: Columns pos, dp, ad, af, ref_len, alt_len, n_alts, same_first and undecided.
+  """
+  n_lines = len(lines)
+  pos = np.zeros(n_lines, dtype=np.int64)
+  dp = np.full(n_lines, np.nan)
+  ad = np.full(n_lines, np.nan)
+  af = np.full(n_lines, np.nan)
+  ref_len = np.zeros(n_lines, dtype=np.int64)
+  alt_len = np.zeros(n_lines, dtype=np.int64)
+  n_alts = np.zeros(n_lines, dtype=np.int64)
+  same_first = np.zeros(n_lines, dtype=bool)
+  undecided = np.zeros(n_lines, dtype=bool)
+
+  for idx, line in enumerate(lines):
+    fields = line.rstrip('\r\n').split('\t')
+    if len(fields) < 10:
+      undecided[idx] = True
+      continue
+    ref = fields[3]
+    alts = fields[4].split(',')
+    alt = alts[0]
+    ref_len[idx] = len(ref)
+    alt_len[idx] = len(alt)
+    n_alts[idx] = len(alts)
+    same_first[idx] = ref[:1] == alt[:1]
+    if alt[:1] in ('<', '.', '') or alt[-1:] == '.' or '[' in alt or ']' in alt:
+      undecided[idx] = True
+      continue
+    try:
+      sample_data = dict(zip(fields[8].split(':'), fields[9].split(':')))
+      pos[idx] = int(fields[1])
+      dp[idx] = int(sample_data['DP'])
+      if record_type == 'legacy':
+        ad[idx] = int(sample_data['AD'])
+      else:
+        af[idx] = float(sample_data['AF'].split(',')[0])
+    except (KeyError, ValueError):
+      undecided[idx] = True
+
+  return {
+    'pos': pos, 'dp': dp, 'ad': ad, 'af': af, 'ref_len': ref_len, 'alt_len': alt_len,
+    'n_alts': n_alts, 'same_first': same_first, 'undecided': undecided,
+  }
+
+def get_valid_codon_mask(columns: Dict[str, np.ndarray], record_type: str) -> np.ndarray:
+  """
+  Vectorized VALID_CODON_LEN rule: (len(REF) - 1) % 3 == 0 for deletions and
+  (len(ALT) - 1) % 3 == 0 for insertions. For Mutect2 only simple DEL/INS
+  (shared first base, one side of length 1) can be valid.
+  """
+  ref_len, alt_len = columns['ref_len'], columns['alt_len']
+  is_del = ref_len > alt_len
+  valid = np.where(is_del, (ref_len - 1) % 3 == 0, (alt_len - 1) % 3 == 0)
+  if record_type == 'mutect2':
+    simple = columns['same_first'] & np.where(is_del, alt_len == 1, ref_len == 1)
+    valid &= simple
+  return valid
+
+def get_pass_mask(
+  columns: Dict[str, np.ndarray],
+  record_type: str,
+  min_dp: int = MIN_DP,
+  min_af: float = MIN_AF,
+  valid_codon_only: bool = False
+  ) -> np.ndarray:
+  """
+  Applies the indel thresholds as vectorized masks. The mask is a superset of the rows the
+  row parsers accept: undecided lines and (for Mutect2) multi-allelic lines are always kept.
+
+  Parameters:
+    columns (Dict[str, np.ndarray]): Columns from decode_columns.
+    record_type (str): 'legacy' or 'mutect2'.
+    min_dp (int): Minimal depth (DP).
+    min_af (float): Minimal allele frequency.
+    valid_codon_only (bool): Drop indels without a codon-valid length.
+
+  Returns:
+    np.ndarray: Boolean mask of lines that have to be fully parsed.
+  """
+  dp = columns['dp']
+  is_indel = columns['ref_len'] != columns['alt_len']
+  with np.errstate(divide='ignore', invalid='ignore'):
+    if record_type == 'legacy':
+      freq = np.where(dp > 0, columns['ad'] / dp * 100, 0)
+      passed = is_indel & (dp >= min_dp) & (freq >= round(min_af * 100, 2) - FREQ_ROUND_MARGIN)
+    else:
+      passed = is_indel & (dp >= min_dp) & (columns['af'] >= min_af)
+  if valid_codon_only:
+    passed &= get_valid_codon_mask(columns, record_type)
+  passed |= columns['undecided']
+  if record_type == 'mutect2':
+    # multi-allelic indels are rejected with an error by parse_mutect2_record
+    passed |= columns['n_alts'] > 1
+  return passed
+
+def iter_columnar_records(
+  record_type: str,
+  sample_id: str,
+  vcf_file_path: str,
+  cds_index: CdsLookup,
+  full_ref_seq: Reference,
+  min_dp: int = MIN_DP,
+  min_af: float = MIN_AF,
+  valid_codon_only: bool = False,
+  chunk_size: int = CHUNK_SIZE,
+  regions: Optional[List[Region]] = None
+  ) -> Iterator[List[Any]]:
+  """
+  Columnar variant of parsers.iter_vcf_records. Candidate indel lines are decoded in chunks
+  into NumPy columns and filtered with vectorized masks; only the surviving lines are
+  decoded by vcfpy and passed to the row parser for placement and CDS annotation.
+
+  Parameters:
+    record_type (str): VCF type ('legacy', 'mutect2' or 'auto').
+    sample_id (str): Sample ID.
+    vcf_file_path (str): Path to the VCF file.
+    cds_index (Union[CdsIndex, CdsStore]): CDS index or per-contig CDS indexes.
+    full_ref_seq (Union[str, ReferenceStore]): full reference sequence or multi-contig reference store.
+    min_dp (int): Minimal depth (DP).
+    min_af (float): Minimal allele frequency.
+    valid_codon_only (bool): Keep only indels with a codon-valid length.
+    chunk_size (int): Number of candidate lines decoded per chunk.
+    regions (Optional[List[Region]]): Read only records overlapping these regions (needs a tabix index).
+
+  Yields:
+    List[Any]: Extracted information for one VCF record.
+  """
+  with PrefilteredVcfReader.from_path(vcf_file_path, regions) as vcf_reader:
+    if record_type == 'auto':
+      record_type = detect_record_type(vcf_reader.header)
+    record_parser = get_record_parser(record_type)
+    vcf_sample_id = get_sample_name_from_vcf(vcf_reader)
+
+    candidate_lines = vcf_reader.iter_candidate_lines()
+    while True:
+      lines = list(islice(candidate_lines, chunk_size))
+      if not lines:
+        return
+      columns = decode_columns(lines, record_type)
+      passed = get_pass_mask(columns, record_type, min_dp, min_af, valid_codon_only)
+      for idx in np.flatnonzero(passed):
+        record = vcf_reader.parse_line(lines[idx])
+        if record is None:
+          continue
+        indel_info = record_parser(vcf_sample_id, sample_id, record, cds_index, full_ref_seq, min_dp, min_af)
+        if indel_info is not None and (not valid_codon_only or is_valid_codon_row(indel_info)):
+          yield indel_info
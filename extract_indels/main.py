@@ -1,41 +1,111 @@
 import argparse
-from parsers import get_full_ref_seq, get_gene_locations, extract_file_name, process_vcf_records
-from utils import write_csv
-from typing import List, Tuple
+from parsers import extract_file_name, iter_vcf_records, MIN_DP, MIN_AF
+from utils import write_rows, get_file_tag, OUTPUT_FORMATS
+from cds_index import CdsStore
+from reference import load_reference, DEFAULT_CACHE_DIR
+from batch import collect_vcf_paths, run_batch
+from regions import resolve_regions, merge_regions
+from typing import List, Optional, Dict, Any
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def main(record_type: str, vcf_file_path: str, gb_file_path: str, output_path: str) -> None:
+def add_regions(vcf_options: Optional[Dict[str, Any]], regions: Optional[str],
+                cds_store: CdsStore) -> Optional[Dict[str, Any]]:
+  if regions is None:
+    return vcf_options
+  resolved = merge_regions(resolve_regions(regions, cds_store))
+  logging.info(f"Restricting VCF records to {len(resolved)} region(s)")
+  return {**(vcf_options or {}), 'regions': resolved}
+
+def main(record_type: str, vcf_file_path: str, gb_file_path: str, output_path: str,
+         ref_cache_dir: Optional[str] = DEFAULT_CACHE_DIR, output_format: str = 'csv',
+         vcf_options: Optional[Dict[str, Any]] = None, regions: Optional[str] = None) -> None:
   try:
-    all_cds_regions = get_gene_locations(gb_file_path)
-    full_ref_seq = get_full_ref_seq(gb_file_path)
+    full_ref_seq, cds_index = load_reference(gb_file_path, ref_cache_dir)
   except Exception as e:
     logging.error(f"Error getting gene locations: {e}")
     return
+  try:
+    vcf_options = add_regions(vcf_options, regions, cds_index)
+  except Exception as e:
+    logging.error(f"Error reading regions: {e}")
+    return
   
   sample_id = extract_file_name(vcf_file_path)
   try:
-    data = process_vcf_records(record_type, sample_id, vcf_file_path, all_cds_regions, full_ref_seq)
+    rows = iter_vcf_records(record_type, sample_id, vcf_file_path, cds_index, full_ref_seq, **(vcf_options or {}))
+    write_rows(sample_id, output_path, rows, output_format, get_file_tag(vcf_options))
   except Exception as e:
     logging.error(f"Error processing VCF records: {e}")
     return
   
+  logging.info("All done!")
+
+def main_batch(record_type: str, vcf_file_paths: List[str], gb_file_path: str, output_path: str,
+               ref_cache_dir: Optional[str] = DEFAULT_CACHE_DIR, workers: int = 1, merged: bool = False,
+               output_format: str = 'csv', vcf_options: Optional[Dict[str, Any]] = None,
+               regions: Optional[str] = None) -> None:
   try:
-    write_csv(sample_id, output_path, data)
+    full_ref_seq, cds_index = load_reference(gb_file_path, ref_cache_dir)
   except Exception as e:
-    logging.error(f"Error writing output CSV: {e}")
+    logging.error(f"Error getting gene locations: {e}")
     return
-  
+  try:
+    vcf_options = add_regions(vcf_options, regions, cds_index)
+  except Exception as e:
+    logging.error(f"Error reading regions: {e}")
+    return
+
+  vcf_paths = collect_vcf_paths(vcf_file_paths)
+  if not vcf_paths:
+    logging.error("No VCF files found.")
+    return
+  logging.info(f"Processing {len(vcf_paths)} VCF files with {workers} worker(s)")
+
+  try:
+    failed = run_batch(record_type, vcf_paths, cds_index, full_ref_seq, output_path, workers, merged,
+                       output_format, vcf_options)
+  except Exception as e:
+    logging.error(f"Error writing output: {e}")
+    return
+
+  if failed:
+    logging.warning(f"Failed to process {len(failed)} of {len(vcf_paths)} VCF files:")
+    for vcf_file_path, error in failed:
+      logging.warning(f"  - {vcf_file_path}: {error}")
   logging.info("All done!")
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Extracts indels from sorted vcf that: AF >= .1 and depth >= 30.',
-                                     usage='Usage: python main.py <vcf_path> <gb_path> <output_dir>')
-    parser.add_argument('vcf_file_path', type=str, help='Path to the sorted vcf file')
+    parser = argparse.ArgumentParser(description='Extracts indels from sorted vcf that: AF >= .1 and depth >= 30 (configurable).',
+                                     usage='Usage: python main.py <vcf_path> [<vcf_path_or_dir> ...] <gb_path> <output_dir>')
+    parser.add_argument('vcf_file_paths', type=str, nargs='+', help='Path(s) to the sorted vcf file(s) or directories with vcf files')
     parser.add_argument('gb_file_path', type=str, help='Path to the GeneBank file')
     parser.add_argument('output_path', type=str, help='Path where the output CSV will be saved')
     parser.add_argument('--vcf_type', choices=['legacy', 'mutect2', 'auto'], default='auto', help='Type of VCF input.')
+    parser.add_argument('--ref_cache_dir', type=str, default=DEFAULT_CACHE_DIR, help=f'Directory for the parsed reference cache (default: {DEFAULT_CACHE_DIR}).')
+    parser.add_argument('--no_ref_cache', action='store_true', help='Always parse the GenBank file, do not read or write the reference cache.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for batch mode (default: 1).')
+    parser.add_argument('--merged', action='store_true', help='Write one merged CSV for all samples instead of one CSV per sample.')
+    parser.add_argument('--no_prefilter', action='store_true', help='Fully decode every VCF record (disables the fast SNV pre-filter).')
+    parser.add_argument('--output_format', choices=OUTPUT_FORMATS, default='csv', help='Output file format (default: csv). parquet requires pyarrow.')
+    parser.add_argument('--min_dp', type=int, default=MIN_DP, help=f'Minimal depth (DP) of an indel (default: {MIN_DP}).')
+    parser.add_argument('--min_af', type=float, default=MIN_AF, help=f'Minimal allele frequency of an indel, as a fraction (default: {MIN_AF}).')
+    parser.add_argument('--valid_codon_only', action='store_true', help='Keep only indels with a codon-valid length (VALID_CODON_LEN is True).')
+    parser.add_argument('--engine', choices=['row', 'columnar'], default='row', help='row: check records one by one; columnar: apply thresholds as vectorized NumPy masks first (same output).')
+    parser.add_argument('--regions', type=str, default=None, help='Only read records in these regions, using the .tbi/.csi index of a bgzipped VCF: "cds" (all CDS from the GenBank file), a BED file, or a comma-separated list of chrom:start-end regions.')
     
     args = parser.parse_args()
-    main(args.vcf_type, args.vcf_file_path, args.gb_file_path, args.output_path)
\ No newline at end of file
+    ref_cache_dir = None if args.no_ref_cache else args.ref_cache_dir
+    vcf_options = {
+      'prefilter': not args.no_prefilter, 'min_dp': args.min_dp, 'min_af': args.min_af,
+      'valid_codon_only': args.valid_codon_only, 'engine': args.engine,
+    }
+    single_vcf = len(args.vcf_file_paths) == 1 and not os.path.isdir(args.vcf_file_paths[0])
+    if single_vcf and args.workers <= 1 and not args.merged:
+      main(args.vcf_type, args.vcf_file_paths[0], args.gb_file_path, args.output_path,
+           ref_cache_dir, args.output_format, vcf_options, args.regions)
+    else:
+      main_batch(args.vcf_type, args.vcf_file_paths, args.gb_file_path, args.output_path,
+                 ref_cache_dir, args.workers, args.merged, args.output_format, vcf_options, args.regions)
\ No newline at end of file
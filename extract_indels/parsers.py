@@ -1,53 +1,28 @@
-from Bio import SeqIO
 import os
 import vcfpy
-from typing import List, Tuple, Optional, Any, Iterable, Callable
+from typing import List, Tuple, Optional, Any, Iterable, Iterator, Callable, Union
+from cds_index import CdsIndex, CdsStore
+from reference import ReferenceStore, ContigSequence
+from vcf_stream import PrefilteredVcfReader
+from regions import Region
 
 REF_SEQ_LEN_EXTRACT = 15
+MIN_DP = 30
+MIN_AF = 0.1
+
+# a single reference sequence string or a multi-contig store addressed by CHROM
+Reference = Union[str, ReferenceStore]
+# CDS regions of a single reference sequence or per-contig indexes addressed by CHROM
+CdsLookup = Union[CdsIndex, CdsStore]
 
 RecordParser = Callable[
-    [str, str, vcfpy.Record, List[Tuple[int, int, str, str]]],
+    [str, str, vcfpy.Record, CdsLookup, Reference, int, float],
     Optional[List[Any]]
 ]
 
 def format_arr(arr: Iterable[Any]) -> str:
   return ';'.join(str(el) for el in arr)
 
-def get_full_ref_seq(gb_file_path: str) -> str:
-  """
-  Extracts the full reference nucleotide sequence from a GenBank file.
-
-  Parameters:
-      gb_file_path (str): Path to the GenBank file.
-    
-  Returns:
-      str: The full reference nucleotide sequence.
-  """
-  with open(gb_file_path, 'r') as file:
-      for record in SeqIO.parse(file, 'genbank'):
-          return str(record.seq)
-
-def get_gene_locations(gb_file_path: str) -> List[Tuple[int, int, str, str]]:
-  """
-  Extracts gene locations from a GeneBank file.
-  
-  Parameters:
-    gb_file_path (str): Path to the GeneBank file.
-      
-  Returns:
-    List[Tuple[int, int, str, str]]: List of gene locations with start, end, gene name, and product.
-  """
-  all_cds = []
-  with open(gb_file_path, 'r') as file:
-    for record in SeqIO.parse(file, 'genbank'):
-      for feature in record.features:
-        if feature.type == 'CDS':
-          start = int(feature.location.start) + 1
-          end = int(feature.location.end)
-          product = feature.qualifiers.get('product', ['N/A'])[0]
-          all_cds.append((start, end, product))
-  return all_cds
-
 def extract_file_name(vcf_path: str) -> str:
   """
   Extracts the sample ID from a VCF file path.
@@ -64,16 +39,20 @@ def extract_file_name(vcf_path: str) -> str:
   sample_id = os.path.splitext(sample_id)[0]
   return sample_id
 
-def parse_vcf(vcf_file_path: str) -> vcfpy.Reader:
+def parse_vcf(vcf_file_path: str, prefilter: bool = False, regions: Optional[List[Region]] = None) -> vcfpy.Reader:
   """
   Parses a VCF file and returns a VCF reader object.
   
   Parameters:
     vcf_file_path (str): Path to the VCF file.
+    prefilter (bool): Skip records that cannot be indels on the raw line, before vcfpy decodes them.
+    regions (Optional[List[Region]]): Read only records overlapping these regions (needs a tabix index).
       
   Returns:
-    vcfpy.Reader: VCF reader object.
+    vcfpy.Reader: VCF reader object (PrefilteredVcfReader if prefilter or regions are set).
   """
+  if prefilter or regions is not None:
+    return PrefilteredVcfReader.from_path(vcf_file_path, regions, prefilter)
   reader = vcfpy.Reader.from_path(vcf_file_path)
   if reader is None:
     raise RuntimeError(f'Failed to parse VCF file: {vcf_file_path}')
@@ -81,22 +60,52 @@ def parse_vcf(vcf_file_path: str) -> vcfpy.Reader:
 
 def get_cds_info(
   pos: int, 
-  cds_list: List[Tuple[int, int, str, str]]
+  cds_index: CdsIndex
   ) -> Tuple[bool, Optional[str]]:
   """
   Gets CDS information for a given position.
     
   Parameters:
     pos (int): Position to check.
-    cds_list (List[Tuple[int, int, str, str]]): List of CDS regions.
+    cds_index (CdsIndex): Index of the CDS regions of the position's contig.
         
   Returns:
-    Tuple[bool, Tuple[Optional[str]]]: Whether the position is within a CDS and the gene name and product (first CDS, if present in multiple ones).
+    Tuple[bool, Optional[str]]: Whether the position is within a CDS and the products of all CDS regions containing it (';'-separated).
+  """
+  products = cds_index.products(pos)
+  if not products:
+    return False, None
+  return True, format_arr(products)
+
+def get_contig_seq(full_ref_seq: Reference, chrom: str) -> Union[str, ContigSequence]:
+  """
+  Gets the reference sequence a VCF record should be placed on.
+
+  Parameters:
+    full_ref_seq (Union[str, ReferenceStore]): Single reference sequence or multi-contig reference store.
+    chrom (str): CHROM of the VCF record.
+
+  Returns:
+    Union[str, ContigSequence]: Sequence of the contig (sliceable like a str).
   """
-  for cds in cds_list:
-    if cds[0] <= pos <= cds[1]:
-      return True, cds[2]
-  return False, None
+  if isinstance(full_ref_seq, str):
+    return full_ref_seq
+  return full_ref_seq[chrom]
+
+def get_contig_cds_index(cds_index: CdsLookup, chrom: str) -> CdsIndex:
+  """
+  Gets the CDS index a VCF record should be annotated from.
+
+  Parameters:
+    cds_index (Union[CdsIndex, CdsStore]): CDS index of a single reference sequence or per-contig CDS indexes.
+    chrom (str): CHROM of the VCF record.
+
+  Returns:
+    CdsIndex: CDS index of the contig.
+  """
+  if isinstance(cds_index, CdsIndex):
+    return cds_index
+  return cds_index[chrom]
 
 def get_del_placement(pos: int, mut_seq: str, full_ref_seq: str) -> str:
   """
@@ -145,8 +154,10 @@ def parse_legacy_record(
   vcf_sample_id: str,
   sample_id: str, 
   record: vcfpy.Record, 
-  all_cds_regions: List[Tuple[int, int, str, str]],
-  full_ref_seq: str
+  cds_index: CdsLookup,
+  full_ref_seq: Reference,
+  min_dp: int = MIN_DP,
+  min_af: float = MIN_AF
   ) -> Optional[List[Any]]:
   """
   Parses a VCF record and extracts relevant information.
@@ -155,8 +166,10 @@ def parse_legacy_record(
     vcf_sample_id (str): Sample ID as it appears in VCF.
     sample_id (str): Sample ID from the file name.
     record (vcfpy.Record): VCF record.
-    all_cds_regions (List[Tuple[int, int, str, str]]): List of gene locations.
-    full_ref_seq (str): full reference sequence string.
+    cds_index (Union[CdsIndex, CdsStore]): CDS index or per-contig CDS indexes.
+    full_ref_seq (Union[str, ReferenceStore]): full reference sequence string or multi-contig reference store.
+    min_dp (int): Minimal depth (DP).
+    min_af (float): Minimal allele frequency (AD / DP).
         
     Returns:
       Optional[List[Any]]: Valid record or None.
@@ -167,7 +180,7 @@ def parse_legacy_record(
     ad = sample_call.data.get('AD')
     freq = (round(ad / dp * 100, 2)) if dp else 0
 
-    if dp >= 30 and freq >= 10:
+    if dp >= min_dp and freq >= round(min_af * 100, 2):
       pos = record.POS
       ref = record.REF
       alt = record.ALT[0].value
@@ -175,12 +188,13 @@ def parse_legacy_record(
       mut_type = 'deletion' if len(record.REF) > len(record.ALT[0].value) else 'insertion'
       valid_len = ((len(ref) - 1) % 3 == 0) if mut_type == 'deletion' else (len(alt) - 1) % 3 == 0
 
+      ref_seq = get_contig_seq(full_ref_seq, record.CHROM)
       placement =(
-        get_del_placement(pos, ref, full_ref_seq) 
+        get_del_placement(pos, ref, ref_seq) 
         if mut_type == 'deletion' 
-        else get_insert_placement(pos, alt, full_ref_seq))
+        else get_insert_placement(pos, alt, ref_seq))
       
-      _, product = get_cds_info(pos, all_cds_regions)
+      _, product = get_cds_info(pos, get_contig_cds_index(cds_index, record.CHROM))
       return [sample_id, pos, ref, alt, dp, ad, freq, 
               valid_len, mut_type, product, placement]
   return None
@@ -189,8 +203,10 @@ def parse_mutect2_record(
   vcf_sample_id: str,
   sample_id: str, 
   record: vcfpy.Record, 
-  all_cds_regions: List[Tuple[int, int, str, str]],
-  full_ref_seq: str
+  cds_index: CdsLookup,
+  full_ref_seq: Reference,
+  min_dp: int = MIN_DP,
+  min_af: float = MIN_AF
   ) -> Optional[List[Any]]:
   """
   Parses a VCF record and extracts relevant information.
@@ -199,7 +215,10 @@ def parse_mutect2_record(
     vcf_sample_id (str): Sample ID as it appears in VCF.
     sample_id (str): Sample ID from the file name.
     record (vcfpy.Record): VCF record.
-    all_cds_regions (List[Tuple[int, int, str, str]]): List of gene locations.
+    cds_index (Union[CdsIndex, CdsStore]): CDS index or per-contig CDS indexes.
+    full_ref_seq (Union[str, ReferenceStore]): full reference sequence string or multi-contig reference store.
+    min_dp (int): Minimal depth (DP).
+    min_af (float): Minimal allele frequency (AF).
         
     Returns:
       Optional[List[Any]]: Valid record or None.
@@ -217,11 +236,11 @@ def parse_mutect2_record(
   
   sample_call = record.call_for_sample[vcf_sample_id]
   dp = sample_call.data.get('DP')
-  if dp is None or dp < 30:
+  if dp is None or dp < min_dp:
     return None
   
   af = sample_call.data.get('AF')[0]
-  if (af is None) or (af < 0.1):
+  if (af is None) or (af < min_af):
     return None
   
   ad = sample_call.data.get('AD')[1]
@@ -238,11 +257,11 @@ def parse_mutect2_record(
 
   placement = 'NA'
   if mut_type == 'DEL':
-    placement = get_del_placement(pos, ref, full_ref_seq)
+    placement = get_del_placement(pos, ref, get_contig_seq(full_ref_seq, record.CHROM))
   elif mut_type == 'INS':
-    placement =get_insert_placement(pos, alt, full_ref_seq)
+    placement =get_insert_placement(pos, alt, get_contig_seq(full_ref_seq, record.CHROM))
 
-  _, product = get_cds_info(pos, all_cds_regions)
+  _, product = get_cds_info(pos, get_contig_cds_index(cds_index, record.CHROM))
 
   return [sample_id, pos, ref, alt, dp, 
                 ad, af,
@@ -266,35 +285,74 @@ def get_sample_name_from_vcf(vcf_reader: vcfpy.Reader) -> str:
     raise ValueError(f"Expected exactly 1 sample, found {len(sample_names)}")
   return sample_names[0]
   
-def process_vcf_records(
+def is_valid_codon_row(row: List[Any]) -> bool:
+  return row[7] is True
+
+def iter_vcf_records(
   record_type: str,
   sample_id: str,
   vcf_file_path: str, 
-  all_cds_regions: List[Tuple[int, int, str, str]],
-  full_ref_seq: str
-  ) -> List[List[Any]]:
+  cds_index: CdsLookup,
+  full_ref_seq: Reference,
+  prefilter: bool = True,
+  min_dp: int = MIN_DP,
+  min_af: float = MIN_AF,
+  valid_codon_only: bool = False,
+  engine: str = 'row',
+  regions: Optional[List[Region]] = None
+  ) -> Iterator[List[Any]]:
   """
-  Processes VCF records and extracts relevant information.
+  Lazily processes VCF records, yielding one output row per passing indel.
+  The VCF is read as the rows are consumed, so memory does not grow with the number of calls.
     
   Parameters:
+    record_type (str): VCF type ('legacy', 'mutect2' or 'auto').
     sample_id (str): Sample ID.
     vcf_file_path (str): Path to the VCF file.
-    all_cds_regions (List[Tuple[int, int, str, str]]): List of CDS regions.
-    full_ref_seq (str): full reference sequence.
+    cds_index (Union[CdsIndex, CdsStore]): CDS index or per-contig CDS indexes.
+    full_ref_seq (Union[str, ReferenceStore]): full reference sequence or multi-contig reference store.
+    prefilter (bool): Skip non-indel records before they are fully decoded (same output, faster).
+    min_dp (int): Minimal depth (DP).
+    min_af (float): Minimal allele frequency.
+    valid_codon_only (bool): Keep only indels with a codon-valid length (VALID_CODON_LEN is True).
+    engine (str): 'row' checks every record in Python; 'columnar' applies the thresholds as
+      vectorized masks over chunks of candidate records first (same output).
+    regions (Optional[List[Region]]): Read only records overlapping these regions, through the
+      tabix index of a bgzipped VCF.
         
+  Yields:
+    List[Any]: Extracted information for one VCF record.
+  """
+  if engine == 'columnar':
+    from columnar import iter_columnar_records
+    yield from iter_columnar_records(
+      record_type, sample_id, vcf_file_path, cds_index, full_ref_seq, min_dp, min_af, valid_codon_only,
+      regions=regions)
+    return
+
+  with parse_vcf(vcf_file_path, prefilter, regions) as vcf_reader:
+    if record_type == 'auto':
+      record_type = detect_record_type(vcf_reader.header)
+    record_parser = get_record_parser(record_type)
+    vcf_sample_id = get_sample_name_from_vcf(vcf_reader)
+
+    for record in vcf_reader:
+      indel_info = record_parser(vcf_sample_id, sample_id, record, cds_index, full_ref_seq, min_dp, min_af)
+      if indel_info is not None and (not valid_codon_only or is_valid_codon_row(indel_info)):
+        yield indel_info
+
+def process_vcf_records(
+  record_type: str,
+  sample_id: str,
+  vcf_file_path: str, 
+  cds_index: CdsLookup,
+  full_ref_seq: Reference,
+  **vcf_options: Any
+  ) -> List[List[Any]]:
+  """
+  Processes VCF records and extracts relevant information (see iter_vcf_records for vcf_options).
+    
   Returns:
     List[List[Any]]: Extracted information from VCF records.
   """
-  vcf_reader = parse_vcf(vcf_file_path)
-  if record_type == 'auto':
-    record_type = detect_record_type(vcf_reader.header)
-  record_parser = get_record_parser(record_type)
-  vcf_sample_id = get_sample_name_from_vcf(vcf_reader)
-
-  data = []
-  for record in vcf_reader:
-    indel_info = record_parser(vcf_sample_id, sample_id, record, all_cds_regions, full_ref_seq)
-    if indel_info is not None:
-      data.append(indel_info)
-
-  return data
\ No newline at end of file
+  return list(iter_vcf_records(record_type, sample_id, vcf_file_path, cds_index, full_ref_seq, **vcf_options))
@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import mmap
+import operator
+import os
+import pickle
+import tempfile
+from typing import List, Tuple, Optional, Dict, Union
+from cds_index import CdsRegion, CdsStore
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'extract_indels')
+HASH_CHUNK_SIZE = 1 << 20
+
+# (names the contig can be addressed by, sequence); the first name is the primary one
+ContigRecord = Tuple[Tuple[str, ...], str]
+# (names, offset, length) of a contig in the sequence buffer
+ContigEntry = Tuple[Tuple[str, ...], int, int]
+
+class ContigSequence:
+  """
+  Read-only view of one contig in the reference sequence buffer.
+  Slicing works like slicing a Python str (including negative indices) but only the
+  requested bases are read from the buffer.
+  """
+  __slots__ = ('buffer', 'offset', 'length')
+
+  def __init__(self, buffer: Union[bytes, mmap.mmap], offset: int, length: int):
+    self.buffer = buffer
+    self.offset = offset
+    self.length = length
+
+  def __len__(self) -> int:
+    return self.length
+
+  def __getitem__(self, key: Union[int, slice]) -> str:
+    if isinstance(key, slice):
+      start, stop, step = key.indices(self.length)
+      if step != 1:
+        return str(self)[key]
+      if stop <= start:
+        return ''
+      return self.buffer[self.offset + start:self.offset + stop].decode('ascii')
+    idx = operator.index(key)
+    if idx < 0:
+      idx += self.length
+    if not 0 <= idx < self.length:
+      raise IndexError('reference index out of range')
+    return chr(self.buffer[self.offset + idx])
+
+  def __str__(self) -> str:
+    return self.buffer[self.offset:self.offset + self.length].decode('ascii')
+
+class ReferenceStore:
+  """
+  Multi-contig reference addressed by CHROM. Contig sequences are concatenated in one
+  buffer, either in memory or in a memory-mapped file shared (via the page cache)
+  by every process that opens it.
+  """
+
+  def __init__(self, contigs: List[ContigEntry], buffer: Union[bytes, mmap.mmap], seq_path: Optional[str] = None):
+    self.contigs = contigs
+    self.buffer = buffer
+    self.seq_path = seq_path
+    self._by_name: Dict[str, ContigSequence] = {}
+    for names, offset, length in contigs:
+      contig_seq = ContigSequence(buffer, offset, length)
+      for name in names:
+        self._by_name.setdefault(name, contig_seq)
+
+  @classmethod
+  def from_records(cls, contig_records: List[ContigRecord]) -> 'ReferenceStore':
+    contigs, chunks, offset = [], [], 0
+    for names, seq in contig_records:
+      chunks.append(seq.encode('ascii'))
+      contigs.append((names, offset, len(seq)))
+      offset += len(seq)
+    return cls(contigs, b''.join(chunks))
+
+  @classmethod
+  def open(cls, seq_path: str, contigs: List[ContigEntry]) -> 'ReferenceStore':
+    with open(seq_path, 'rb') as file:
+      if os.fstat(file.fileno()).st_size == 0:
+        return cls(contigs, b'', seq_path)
+      buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return cls(contigs, buffer, seq_path)
+
+  def __getstate__(self):
+    if self.seq_path is not None:
+      return {'contigs': self.contigs, 'seq_path': self.seq_path}
+    return {'contigs': self.contigs, 'buffer': bytes(self.buffer)}
+
+  def __setstate__(self, state):
+    if 'seq_path' in state:
+      other = ReferenceStore.open(state['seq_path'], state['contigs'])
+    else:
+      other = ReferenceStore(state['contigs'], state['buffer'])
+    self.__dict__.update(other.__dict__)
+
+  @property
+  def contig_names(self) -> List[str]:
+    return [names[0] for names, _, _ in self.contigs]
+
+  def __len__(self) -> int:
+    return len(self.contigs)
+
+  def __getitem__(self, chrom: str) -> ContigSequence:
+    """
+    Gets the sequence of a contig by VCF CHROM. A single-contig reference is returned
+    for any CHROM, as VCF and GenBank naming of the same genome often differ.
+    """
+    contig_seq = self._by_name.get(chrom)
+    if contig_seq is not None:
+      return contig_seq
+    if len(self.contigs) == 1:
+      _, offset, length = self.contigs[0]
+      return ContigSequence(self.buffer, offset, length)
+    raise KeyError(f"Contig '{chrom}' not found in reference (available: {', '.join(self.contig_names)})")
+
+def hash_file(file_path: str) -> str:
+  """
+  Computes the SHA-256 hex digest of a file's content.
+
+  Parameters:
+    file_path (str): Path to the file.
+
+  Returns:
+    str: Hex digest of the file content.
+  """
+  digest = hashlib.sha256()
+  with open(file_path, 'rb') as file:
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+def get_contig_names(record) -> Tuple[str, ...]:
+  names = [record.id, record.name, record.id.split('.')[0]]
+  return tuple(dict.fromkeys(name for name in names if name and name != '<unknown id>'))
+
+def parse_genbank(gb_file_path: str) -> Tuple[List[ContigRecord], List[List[CdsRegion]]]:
+  """
+  Extracts all contig sequences and CDS regions from a GenBank file in a single pass.
+
+  Parameters:
+    gb_file_path (str): Path to the GenBank file.
+
+  Returns:
+    Tuple[List[Tuple[Tuple[str, ...], str]], List[List[Tuple[int, int, str]]]]: Contigs (names, sequence)
+    in file order and, for each contig, the list of its CDS regions with start, end and product.
+  """
+  from Bio import SeqIO
+
+  contig_records = []
+  contig_cds = []
+  with open(gb_file_path, 'r') as file:
+    for record in SeqIO.parse(file, 'genbank'):
+      contig_records.append((get_contig_names(record), str(record.seq)))
+      cds_regions = []
+      for feature in record.features:
+        if feature.type == 'CDS':
+          start = int(feature.location.start) + 1
+          end = int(feature.location.end)
+          product = feature.qualifiers.get('product', ['N/A'])[0]
+          cds_regions.append((start, end, product))
+      contig_cds.append(cds_regions)
+  return contig_records, contig_cds
+
+def get_cds_store(reference: ReferenceStore, contig_cds: List[List[CdsRegion]]) -> CdsStore:
+  return CdsStore([(names, cds_regions) for (names, _, _), cds_regions in zip(reference.contigs, contig_cds)])
+
+def get_cache_paths(gb_file_path: str, cache_dir: str) -> Tuple[str, str]:
+  cache_prefix = os.path.join(cache_dir, f"{hash_file(gb_file_path)}.v{CACHE_FORMAT_VERSION}")
+  return f"{cache_prefix}.seq", f"{cache_prefix}.idx.pkl"
+
+def atomic_write(file_path: str, content: bytes) -> None:
+  file_dir = os.path.dirname(file_path)
+  os.makedirs(file_dir, exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=file_dir, suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as file:
+      file.write(content)
+    os.replace(tmp_path, file_path)
+  except BaseException:
+    os.remove(tmp_path)
+    raise
+
+def read_cache(seq_path: str, index_path: str) -> Optional[Tuple[ReferenceStore, List[List[CdsRegion]]]]:
+  try:
+    with open(index_path, 'rb') as file:
+      index = pickle.load(file)
+    if len(index['cds']) != len(index['contigs']):
+      raise ValueError('CDS regions are not stored per contig')
+    return ReferenceStore.open(seq_path, index['contigs']), index['cds']
+  except FileNotFoundError:
+    return None
+  except Exception as e:
+    logging.warning(f"Ignoring unreadable reference cache {index_path}: {e}")
+    return None
+
+def write_cache(seq_path: str, index_path: str, reference: ReferenceStore, contig_cds: List[List[CdsRegion]]) -> None:
+  # the index is written last: its presence marks a complete cache entry; CDS regions are
+  # stored per contig, in the order of the contig table
+  atomic_write(seq_path, bytes(reference.buffer))
+  atomic_write(index_path, pickle.dumps({'contigs': reference.contigs, 'cds': contig_cds}, protocol=pickle.HIGHEST_PROTOCOL))
+
+def load_reference(
+  gb_file_path: str,
+  cache_dir: Optional[str] = DEFAULT_CACHE_DIR
+  ) -> Tuple[ReferenceStore, CdsStore]:
+  """
+  Loads the reference contigs and their CDS regions, using an on-disk cache keyed by the
+  GenBank file content hash. The GenBank file is only parsed on a cache miss; cached
+  contigs are memory-mapped rather than read into memory.
+
+  Parameters:
+    gb_file_path (str): Path to the GenBank file.
+    cache_dir (Optional[str]): Directory for cached references; None disables caching.
+
+  Returns:
+    Tuple[ReferenceStore, CdsStore]: The reference store and the per-contig CDS indexes.
+  """
+  if cache_dir is None:
+    contig_records, contig_cds = parse_genbank(gb_file_path)
+    reference = ReferenceStore.from_records(contig_records)
+    return reference, get_cds_store(reference, contig_cds)
+
+  seq_path, index_path = get_cache_paths(gb_file_path, cache_dir)
+  cached = read_cache(seq_path, index_path)
+  if cached is not None:
+    logging.info(f"Loaded reference from cache: {index_path}")
+    reference, contig_cds = cached
+    return reference, get_cds_store(reference, contig_cds)
+
+  contig_records, contig_cds = parse_genbank(gb_file_path)
+  reference = ReferenceStore.from_records(contig_records)
+  try:
+    write_cache(seq_path, index_path, reference, contig_cds)
+    reference = ReferenceStore.open(seq_path, reference.contigs)
+  except OSError as e:
+    logging.warning(f"Could not write reference cache {index_path}: {e}")
+  return reference, get_cds_store(reference, contig_cds)
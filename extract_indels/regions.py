@@ -0,0 +1,129 @@
+import logging
+import os
+from typing import List, Tuple, Optional, Iterator
+from cds_index import CdsStore
+
+# (chrom, begin, end): 0-based, half-open; chrom None means "the single contig of the VCF"
+Region = Tuple[Optional[str], int, int]
+
+CDS_REGIONS = 'cds'
+
+def parse_region(region: str) -> Region:
+  """
+  Parses a samtools-style region string ('chrom', 'chrom:start-end' or 'chrom:start', 1-based, inclusive).
+
+  Parameters:
+    region (str): Region string.
+
+  Returns:
+    Tuple[Optional[str], int, int]: Chromosome, 0-based begin and end (exclusive).
+  """
+  chrom, sep, span = region.strip().rpartition(':')
+  if not sep or not span.replace(',', '').replace('-', '').isdigit():
+    return region.strip(), 0, 2 ** 31 - 1
+  span = span.replace(',', '')
+  start, _, end = span.partition('-')
+  begin = int(start) - 1
+  end = int(end) if end else 2 ** 31 - 1
+  if begin < 0 or end <= begin:
+    raise ValueError(f"Invalid region: {region}")
+  return chrom, begin, end
+
+def read_bed(bed_file_path: str) -> List[Region]:
+  """
+  Reads regions from a BED file (first three columns; header/track/comment lines are skipped).
+
+  Parameters:
+    bed_file_path (str): Path to the BED file.
+
+  Returns:
+    List[Tuple[Optional[str], int, int]]: Regions as 0-based, half-open intervals.
+  """
+  regions = []
+  with open(bed_file_path, 'r') as file:
+    for line in file:
+      if not line.strip() or line.startswith(('#', 'track', 'browser')):
+        continue
+      fields = line.split('\t') if '\t' in line else line.split()
+      regions.append((fields[0], int(fields[1]), int(fields[2])))
+  return regions
+
+def get_cds_regions(cds_store: CdsStore) -> List[Region]:
+  # CDS regions of a single-contig reference apply to the VCF's contig whatever its name,
+  # as in ReferenceStore; with several contigs they are addressed by the primary contig name
+  single_contig = len(cds_store) == 1
+  return [(None if single_contig else names[0], start - 1, end)
+          for names, cds_index in cds_store.contigs for start, end, _ in cds_index.regions]
+
+def resolve_regions(regions_arg: str, cds_store: CdsStore) -> List[Region]:
+  """
+  Resolves the --regions CLI value: 'cds' (all CDS from the GenBank file), a BED file
+  or a comma-separated list of region strings.
+
+  Parameters:
+    regions_arg (str): Value of the --regions option.
+    cds_store (CdsStore): Per-contig CDS regions from the reference.
+
+  Returns:
+    List[Tuple[Optional[str], int, int]]: Regions as 0-based, half-open intervals.
+  """
+  if regions_arg == CDS_REGIONS:
+    return get_cds_regions(cds_store)
+  if os.path.isfile(regions_arg):
+    return read_bed(regions_arg)
+  return [parse_region(region) for region in regions_arg.split(',') if region.strip()]
+
+def merge_regions(regions: List[Region]) -> List[Region]:
+  """
+  Sorts regions and merges overlapping or adjacent ones.
+
+  Parameters:
+    regions (List[Tuple[str, int, int]]): Regions as 0-based, half-open intervals.
+
+  Returns:
+    List[Tuple[str, int, int]]: Disjoint regions, sorted by chromosome and begin.
+  """
+  merged = []
+  for chrom, begin, end in sorted(regions):
+    if merged and merged[-1][0] == chrom and begin <= merged[-1][2]:
+      merged[-1] = (chrom, merged[-1][1], max(merged[-1][2], end))
+    else:
+      merged.append((chrom, begin, end))
+  return merged
+
+def iter_region_lines(vcf_file_path: str, regions: List[Region]) -> Iterator[str]:
+  """
+  Yields the raw VCF lines overlapping the regions, using the tabix (.tbi/.csi) index of a
+  bgzipped VCF. Overlapping regions are merged and a record spanning several regions is
+  yielded only once.
+
+  Parameters:
+    vcf_file_path (str): Path to the bgzipped, indexed VCF file.
+    regions (List[Tuple[Optional[str], int, int]]): Regions as 0-based, half-open intervals.
+
+  Yields:
+    str: Raw VCF data line (without line break).
+  """
+  import pysam
+
+  if not any(os.path.exists(vcf_file_path + ext) for ext in ('.tbi', '.csi')):
+    raise ValueError(f"Region queries need a bgzipped VCF with a .tbi/.csi index: {vcf_file_path}")
+
+  with pysam.TabixFile(vcf_file_path) as tabix_file:
+    contigs = set(tabix_file.contigs)
+    if any(chrom is None for chrom, _, _ in regions):
+      if len(contigs) > 1:
+        raise ValueError(f"CDS regions need a single-contig VCF, found {len(contigs)} contigs; use a BED file")
+      regions = [(chrom if chrom is not None else next(iter(contigs), None), begin, end) for chrom, begin, end in regions]
+
+    prev_chrom, prev_end = None, 0
+    for chrom, begin, end in merge_regions([region for region in regions if region[0] is not None]):
+      if chrom not in contigs:
+        logging.warning(f"{vcf_file_path}: no records for contig {chrom}, skipping region {chrom}:{begin + 1}-{end}")
+        continue
+      for line in tabix_file.fetch(chrom, begin, end):
+        # a record starting before the previous region's end overlapped that region: already yielded
+        if chrom == prev_chrom and int(line.split('\t', 2)[1]) - 1 < prev_end:
+          continue
+        yield line
+      prev_chrom, prev_end = chrom, end
@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+import csv
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import batch
+from batch import collect_vcf_paths, run_batch
+from cds_index import CdsIndex
+
+FULL_REF_SEQ = 'TTACTTGGTTCCATGCTATACATGTCTCTGGGACCAATGGTACTAAGAGGTTTGATAACCCTGTCCTACC'
+
+LEGACY_VCF = '\n'.join([
+  '##fileformat=VCFv4.2',
+  '##contig=<ID=REF1,length=70>',
+  '##FORMAT=<ID=AD,Number=1,Type=Integer,Description="Alt depth">',
+  '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+  '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE',
+  'REF1\t10\t.\tT\tA\t50\tPASS\t.\tAD:DP\t20:100',
+  'REF1\t20\t.\tACAT\tA\t50\tPASS\t.\tAD:DP\t20:100',
+  'REF1\t30\t.\tG\tGAAT\t50\tPASS\t.\tAD:DP\t5:100',
+  '',
+])
+
+class TestBatch(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.vcf_dir = os.path.join(self.tmp_dir.name, 'vcfs')
+    self.output_path = os.path.join(self.tmp_dir.name, 'out')
+    os.makedirs(self.vcf_dir)
+    for name, content in [('s1.fastq.vcf', LEGACY_VCF), ('s2.vcf', LEGACY_VCF), ('bad.vcf', 'not a vcf\n')]:
+      with open(os.path.join(self.vcf_dir, name), 'w') as file:
+        file.write(content)
+    self.cds_index = CdsIndex([(1, 40, 'PRODUCT1')])
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def read_rows(self, file_name):
+    with open(os.path.join(self.output_path, file_name), 'r') as csv_file:
+      return list(csv.reader(csv_file))[1:]
+
+  def test_collect_vcf_paths(self):
+    other_vcf = os.path.join(self.tmp_dir.name, 'other.vcf')
+    self.assertEqual(
+      collect_vcf_paths([self.vcf_dir, other_vcf]),
+      [os.path.join(self.vcf_dir, name) for name in ('bad.vcf', 's1.fastq.vcf', 's2.vcf')] + [other_vcf])
+
+  def test_run_batch_isolates_errors(self):
+    vcf_paths = collect_vcf_paths([self.vcf_dir])
+    failed = run_batch('legacy', vcf_paths, self.cds_index, FULL_REF_SEQ, self.output_path)
+    self.assertEqual([path for path, _ in failed], [os.path.join(self.vcf_dir, 'bad.vcf')])
+    self.assertEqual(
+      self.read_rows('s1_indels_af10_dp30.csv'),
+      [['s1', '20', 'ACAT', 'A', '100', '20', '20.0', 'True', 'deletion', 'PRODUCT1',
+        'TGGTTCCATGCTATA*CAT*GTCTCTGGGACCAAT']])
+    self.assertTrue(os.path.exists(os.path.join(self.output_path, 's2_indels_af10_dp30.csv')))
+
+  def test_run_batch_merged(self):
+    vcf_paths = collect_vcf_paths([self.vcf_dir])
+    run_batch('legacy', vcf_paths, self.cds_index, FULL_REF_SEQ, self.output_path, workers=2, merged=True)
+    self.assertEqual([row[0] for row in self.read_rows('all_samples_indels_af10_dp30.csv')], ['s1', 's2'])
+
+  def test_run_batch_bounds_in_flight_files(self):
+    for idx in range(3, 8):
+      with open(os.path.join(self.vcf_dir, f's{idx}.vcf'), 'w') as file:
+        file.write(LEGACY_VCF)
+    vcf_paths = collect_vcf_paths([self.vcf_dir])
+    in_flight, max_in_flight = set(), []
+
+    class InlineExecutor:
+      # runs each file on submit and tracks the futures whose result was not collected yet
+      def __init__(self, max_workers, initializer, initargs):
+        initializer(*initargs)
+      def __enter__(self):
+        return self
+      def __exit__(self, *exc_info):
+        return False
+      def submit(self, func, vcf_file_path):
+        future = Future()
+        try:
+          future.set_result(func(vcf_file_path))
+        except Exception as e:
+          future.set_exception(e)
+        in_flight.add(future)
+        max_in_flight.append(len(in_flight))
+        original_result = future.result
+        def result():
+          in_flight.discard(future)
+          return original_result()
+        future.result = result
+        return future
+
+    with mock.patch.object(batch, 'ProcessPoolExecutor', InlineExecutor):
+      failed = run_batch('legacy', vcf_paths, self.cds_index, FULL_REF_SEQ, self.output_path, workers=2, merged=True)
+    self.assertEqual(max(max_in_flight), 2)
+    self.assertEqual(len(max_in_flight), len(vcf_paths))
+    self.assertEqual([path for path, _ in failed], [os.path.join(self.vcf_dir, 'bad.vcf')])
+    self.assertEqual([row[0] for row in self.read_rows('all_samples_indels_af10_dp30.csv')],
+                     ['s1', 's2', 's3', 's4', 's5', 's6', 's7'])
+
+if __name__ == '__main__':
+  unittest.main()
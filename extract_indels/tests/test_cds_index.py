@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cds_index import CdsIndex
+
+class TestCdsIndex(unittest.TestCase):
+  def setUp(self):
+    self.cds_index = CdsIndex([
+      (266, 21555, 'ORF1ab'),
+      (266, 13483, 'ORF1a'),
+      (21563, 25384, 'S'),
+      (28274, 29533, 'N'),
+      (28284, 28577, 'ORF9b'),
+    ])
+
+  def test_query(self):
+    self.assertEqual(self.cds_index.query(265), [])
+    self.assertEqual(self.cds_index.query(266), [(266, 21555, 'ORF1ab'), (266, 13483, 'ORF1a')])
+    self.assertEqual(self.cds_index.query(13484), [(266, 21555, 'ORF1ab')])
+    self.assertEqual(self.cds_index.query(21560), [])
+    self.assertEqual(self.cds_index.query(25384), [(21563, 25384, 'S')])
+    self.assertEqual(self.cds_index.query(28577), [(28274, 29533, 'N'), (28284, 28577, 'ORF9b')])
+    self.assertEqual(self.cds_index.query(30000), [])
+
+  def test_query_range(self):
+    self.assertEqual(self.cds_index.query_range(1, 100), [])
+    self.assertEqual(self.cds_index.query_range(21550, 21570), [(266, 21555, 'ORF1ab'), (21563, 25384, 'S')])
+    self.assertEqual(
+      self.cds_index.query_range(13000, 28280),
+      [(266, 21555, 'ORF1ab'), (266, 13483, 'ORF1a'), (21563, 25384, 'S'), (28274, 29533, 'N')])
+
+  def test_products(self):
+    self.assertEqual(self.cds_index.products(300), ['ORF1ab', 'ORF1a'])
+    self.assertEqual(CdsIndex([(1, 5, 'P'), (3, 8, 'P')]).products(4), ['P'])
+    self.assertEqual(CdsIndex([]).products(4), [])
+
+if __name__ == '__main__':
+  unittest.main()
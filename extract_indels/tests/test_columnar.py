@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from columnar import decode_columns, get_pass_mask, get_valid_codon_mask
+from parsers import process_vcf_records
+from cds_index import CdsIndex
+
+FULL_REF_SEQ = 'TTACTTGGTTCCATGCTATACATGTCTCTGGGACCAATGGTACTAAGAGGTTTGATAACCCTGTCCTACC'
+
+LEGACY_LINES = [
+  'REF1\t20\t.\tACAT\tA\t50\tPASS\t.\tAD:DP\t20:100\n',
+  'REF1\t30\t.\tG\tGAAT\t50\tPASS\t.\tAD:DP\t5:100\n',
+  'REF1\t35\t.\tA\tAC\t50\tPASS\t.\tAD:DP\t20:20\n',
+  'REF1\t40\t.\tG\tGA\t50\tPASS\t.\tAD:DP\t10:100\n',
+  'REF1\t45\t.\tG\tGA\t50\tPASS\t.\tAD:DP\t.:100\n',
+]
+
+MUTECT2_VCF = ''.join([
+  '##fileformat=VCFv4.2\n',
+  '##source=Mutect2\n',
+  '##contig=<ID=REF1,length=70>\n',
+  '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths">\n',
+  '##FORMAT=<ID=AF,Number=A,Type=Float,Description="Allele fraction">\n',
+  '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">\n',
+  '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE\n',
+  'REF1\t10\t.\tT\tA\t.\tPASS\t.\tAD:AF:DP\t80,20:0.2:100\n',
+  'REF1\t20\t.\tACAT\tA\t.\tPASS\t.\tAD:AF:DP\t80,20:0.2:100\n',
+  'REF1\t30\t.\tG\tGAAT\t.\tPASS\t.\tAD:AF:DP\t95,5:0.05:100\n',
+  'REF1\t35\t.\tA\tAC\t.\tPASS\t.\tAD:AF:DP\t10,10:0.5:20\n',
+  'REF1\t40\t.\tGT\tCAT\t.\tPASS\t.\tAD:AF:DP\t50,50:0.5:100\n',
+  'REF1\t50\t.\tG\tGA\t.\tPASS\t.\tAD:AF\t50,50:0.5\n',
+])
+
+class TestColumnar(unittest.TestCase):
+  def test_decode_columns(self):
+    columns = decode_columns(LEGACY_LINES, 'legacy')
+    self.assertEqual(columns['pos'].tolist()[:4], [20, 30, 35, 40])
+    self.assertEqual(columns['dp'].tolist()[:4], [100, 100, 20, 100])
+    self.assertEqual(columns['ad'].tolist()[:4], [20, 5, 20, 10])
+    self.assertEqual(columns['ref_len'].tolist(), [4, 1, 1, 1, 1])
+    self.assertEqual(columns['alt_len'].tolist(), [1, 4, 2, 2, 2])
+    self.assertEqual(columns['undecided'].tolist(), [False, False, False, False, True])
+
+  def test_get_pass_mask(self):
+    columns = decode_columns(LEGACY_LINES, 'legacy')
+    self.assertEqual(get_pass_mask(columns, 'legacy').tolist(), [True, False, False, True, True])
+    self.assertEqual(get_pass_mask(columns, 'legacy', min_dp=10, min_af=0.15).tolist(), [True, False, True, False, True])
+    self.assertEqual(get_valid_codon_mask(columns, 'legacy').tolist(), [True, True, False, False, False])
+    self.assertEqual(get_pass_mask(columns, 'legacy', valid_codon_only=True).tolist(), [True, False, False, False, True])
+
+  def test_columnar_engine_matches_row_engine(self):
+    cds_index = CdsIndex([(1, 40, 'PRODUCT1')])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      vcf_file_path = os.path.join(tmp_dir, 'test.vcf')
+      with open(vcf_file_path, 'w') as file:
+        file.write(MUTECT2_VCF)
+      for options in [{}, {'min_dp': 10, 'min_af': 0.01}, {'valid_codon_only': True}]:
+        row_data = process_vcf_records('auto', 'test', vcf_file_path, cds_index, FULL_REF_SEQ, **options)
+        columnar_data = process_vcf_records(
+          'auto', 'test', vcf_file_path, cds_index, FULL_REF_SEQ, engine='columnar', **options)
+        self.assertEqual(columnar_data, row_data)
+        self.assertTrue(row_data)
+
+if __name__ == '__main__':
+  unittest.main()
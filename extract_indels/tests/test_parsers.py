@@ -4,23 +4,25 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from parsers import (
-  extract_sample_id, 
+  extract_file_name, 
   get_cds_info, 
   get_del_placement,
   get_insert_placement)
+from cds_index import CdsIndex
 
 class TestParsers(unittest.TestCase):
-  def test_extract_sample_id(self):
-    self.assertEqual(extract_sample_id('./my/path/test_full.fastq.vcf'), 'test_full')
-    self.assertEqual(extract_sample_id('/path/to/test_full.fastq.vcf'), 'test_full')
+  def test_extract_file_name(self):
+    self.assertEqual(extract_file_name('./my/path/test_full.fastq.vcf'), 'test_full')
+    self.assertEqual(extract_file_name('/path/to/test_full.fastq.vcf'), 'test_full')
 
   def test_get_cds_info(self):
-    self.assertEqual(get_cds_info(3, [(1, 5, 'PRODUCT1')]), (True, ('PRODUCT1')))
-    self.assertEqual(get_cds_info(5, [(1, 5, 'PRODUCT1')]), (True, ('PRODUCT1')))
-    self.assertEqual(get_cds_info(1, [(1, 5, 'PRODUCT1')]), (True, ('PRODUCT1')))
-    self.assertEqual(get_cds_info(8, [(1, 5, 'PRODUCT1')]), (False, (None)))
-    self.assertEqual(get_cds_info(11, [(1, 5, 'PRODUCT1'), (6, 10, 'PRODUCT2')]), (False, (None)))
-    self.assertEqual(get_cds_info(7, []), (False, (None)))
+    self.assertEqual(get_cds_info(3, CdsIndex([(1, 5, 'PRODUCT1')])), (True, ('PRODUCT1')))
+    self.assertEqual(get_cds_info(5, CdsIndex([(1, 5, 'PRODUCT1')])), (True, ('PRODUCT1')))
+    self.assertEqual(get_cds_info(1, CdsIndex([(1, 5, 'PRODUCT1')])), (True, ('PRODUCT1')))
+    self.assertEqual(get_cds_info(8, CdsIndex([(1, 5, 'PRODUCT1')])), (False, (None)))
+    self.assertEqual(get_cds_info(11, CdsIndex([(1, 5, 'PRODUCT1'), (6, 10, 'PRODUCT2')])), (False, (None)))
+    self.assertEqual(get_cds_info(7, CdsIndex([])), (False, (None)))
+    self.assertEqual(get_cds_info(4, CdsIndex([(1, 5, 'PRODUCT1'), (3, 10, 'PRODUCT2')])), (True, ('PRODUCT1;PRODUCT2')))
     
   def test_get_del_placement(self):
     self.assertEqual(
@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+import tempfile
+import pickle
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation
+import reference
+from reference import parse_genbank, load_reference, get_cache_paths, ReferenceStore
+from cds_index import CdsStore
+from parsers import iter_vcf_records
+
+class TestReference(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.gb_file_path = os.path.join(self.tmp_dir.name, 'test.gb')
+    self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+    record1 = SeqRecord(Seq('ATGAAACCCGGGTTTTAG' * 2), id='REF1.2', name='REF1', annotations={'molecule_type': 'DNA'})
+    record1.features.append(SeqFeature(FeatureLocation(0, 18), type='CDS', qualifiers={'product': ['PRODUCT1']}))
+    record1.features.append(SeqFeature(FeatureLocation(18, 36), type='CDS'))
+    record2 = SeqRecord(Seq('GGGCCC'), id='REF2', name='REF2', annotations={'molecule_type': 'DNA'})
+    SeqIO.write([record1, record2], self.gb_file_path, 'genbank')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_parse_genbank(self):
+    contig_records, contig_cds = parse_genbank(self.gb_file_path)
+    self.assertEqual(contig_records, [(('REF1.2', 'REF1'), 'ATGAAACCCGGGTTTTAG' * 2), (('REF2',), 'GGGCCC')])
+    self.assertEqual(contig_cds, [[(1, 18, 'PRODUCT1'), (19, 36, 'N/A')], []])
+
+  def test_reference_store(self):
+    ref_store, _ = load_reference(self.gb_file_path, self.cache_dir)
+    full_ref_seq = 'ATGAAACCCGGGTTTTAG' * 2
+    contig_seq = ref_store['REF1']
+    self.assertIs(ref_store['REF1.2'].buffer, contig_seq.buffer)
+    self.assertEqual(len(contig_seq), len(full_ref_seq))
+    for key in [slice(3, 9), slice(-5, 4), slice(-5, None), slice(30, 50), slice(9, 3), slice(None, None, 2)]:
+      self.assertEqual(contig_seq[key], full_ref_seq[key])
+    self.assertEqual(contig_seq[-1], 'G')
+    self.assertEqual(ref_store['REF2'][-4:], 'GCCC')
+    self.assertEqual(str(ref_store['REF2']), 'GGGCCC')
+    with self.assertRaises(KeyError):
+      ref_store['REF3']
+
+  def test_single_contig_any_chrom(self):
+    ref_store = ReferenceStore.from_records([(('REF1',), 'ACGT')])
+    self.assertEqual(str(ref_store['MN908947.3']), 'ACGT')
+
+  def test_reference_store_pickle(self):
+    ref_store, _ = load_reference(self.gb_file_path, self.cache_dir)
+    restored = pickle.loads(pickle.dumps(ref_store))
+    self.assertEqual(restored.seq_path, ref_store.seq_path)
+    self.assertEqual(str(restored['REF2']), 'GGGCCC')
+    in_memory = ReferenceStore.from_records([(('REF1',), 'ACGT')])
+    self.assertEqual(str(pickle.loads(pickle.dumps(in_memory))['REF1']), 'ACGT')
+
+  def test_load_reference_cache(self):
+    ref_store, cds_store = load_reference(self.gb_file_path, self.cache_dir)
+    for cache_path in get_cache_paths(self.gb_file_path, self.cache_dir):
+      self.assertTrue(os.path.exists(cache_path))
+
+    with mock.patch.object(reference, 'parse_genbank', side_effect=AssertionError('cache not used')):
+      cached_store, cached_cds = load_reference(self.gb_file_path, self.cache_dir)
+    self.assertEqual([(names, cds_index.regions) for names, cds_index in cached_cds.contigs],
+                     [(names, cds_index.regions) for names, cds_index in cds_store.contigs])
+    self.assertEqual(cached_store.contigs, ref_store.contigs)
+    self.assertEqual(str(cached_store['REF1']), 'ATGAAACCCGGGTTTTAG' * 2)
+
+  def test_cds_per_contig(self):
+    # CDS coordinates of two contigs overlap; each position is annotated from its own contig
+    gb_file_path = os.path.join(self.tmp_dir.name, 'two_contigs.gb')
+    records = []
+    for name, product, (start, end) in [('CONTIG1', 'PRODUCT1', (0, 30)), ('CONTIG2', 'PRODUCT2', (9, 36))]:
+      record = SeqRecord(Seq('ATGAAACCCGGGTTTTAG' * 3), id=f'{name}.1', name=name, annotations={'molecule_type': 'DNA'})
+      record.features.append(SeqFeature(FeatureLocation(start, end), type='CDS', qualifiers={'product': [product]}))
+      records.append(record)
+    SeqIO.write(records, gb_file_path, 'genbank')
+    vcf_file_path = os.path.join(self.tmp_dir.name, 'sample.vcf')
+    with open(vcf_file_path, 'w') as file:
+      file.write('\n'.join([
+        '##fileformat=VCFv4.2',
+        '##contig=<ID=CONTIG1.1,length=54>',
+        '##contig=<ID=CONTIG2.1,length=54>',
+        '##FORMAT=<ID=AD,Number=1,Type=Integer,Description="Alt depth">',
+        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+        '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE',
+        'CONTIG1.1\t5\t.\tAAAC\tA\t50\tPASS\t.\tAD:DP\t20:100',
+        'CONTIG1.1\t20\t.\tTGAA\tT\t50\tPASS\t.\tAD:DP\t20:100',
+        'CONTIG2.1\t5\t.\tAAAC\tA\t50\tPASS\t.\tAD:DP\t20:100',
+        'CONTIG2.1\t20\t.\tTGAA\tT\t50\tPASS\t.\tAD:DP\t20:100',
+        'CONTIG2.1\t32\t.\tTTTA\tT\t50\tPASS\t.\tAD:DP\t20:100',
+        '',
+      ]))
+
+    for cache_dir in (None, self.cache_dir, self.cache_dir):
+      ref_store, cds_store = load_reference(gb_file_path, cache_dir)
+      self.assertEqual(cds_store['CONTIG1'].products(20), ['PRODUCT1'])
+      self.assertEqual(cds_store['CONTIG2.1'].products(20), ['PRODUCT2'])
+      self.assertEqual(cds_store['CONTIG2'].products(5), [])
+      with self.assertRaises(KeyError):
+        cds_store['CONTIG3']
+      rows = list(iter_vcf_records('legacy', 'sample', vcf_file_path, cds_store, ref_store))
+      self.assertEqual([(row[1], row[9]) for row in rows],
+                       [(5, 'PRODUCT1'), (20, 'PRODUCT1'), (5, None), (20, 'PRODUCT2'), (32, 'PRODUCT2')])
+
+  def test_single_contig_cds_any_chrom(self):
+    cds_store = CdsStore([(('REF1',), [(1, 5, 'PRODUCT1')])])
+    self.assertEqual(cds_store['MN908947.3'].products(3), ['PRODUCT1'])
+
+  def test_load_reference_no_cache(self):
+    ref_store, _ = load_reference(self.gb_file_path, None)
+    self.assertIsNone(ref_store.seq_path)
+    self.assertFalse(os.path.exists(self.cache_dir))
+
+if __name__ == '__main__':
+  unittest.main()
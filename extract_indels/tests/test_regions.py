@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from regions import parse_region, read_bed, resolve_regions, merge_regions, iter_region_lines, CDS_REGIONS
+from vcf_stream import PrefilteredVcfReader
+from cds_index import CdsStore
+
+VCF_LINES = [
+  '##fileformat=VCFv4.2',
+  '##contig=<ID=REF1,length=100>',
+  '##FORMAT=<ID=AD,Number=1,Type=Integer,Description="Alt depth">',
+  '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+  '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1',
+  'REF1\t5\t.\tA\tT\t.\tPASS\t.\tAD:DP\t50:100',
+  'REF1\t10\t.\tACATG\tA\t.\tPASS\t.\tAD:DP\t50:100',
+  'REF1\t20\t.\tA\tAT\t.\tPASS\t.\tAD:DP\t50:100',
+  'REF1\t40\t.\tC\tCAAT\t.\tPASS\t.\tAD:DP\t50:100',
+  'REF1\t60\t.\tCTT\tC\t.\tPASS\t.\tAD:DP\t50:100',
+]
+
+class TestRegions(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+
+  def write_indexed_vcf(self) -> str:
+    import pysam
+    vcf_path = os.path.join(self.tmp_dir.name, 'sample.vcf')
+    with open(vcf_path, 'w') as file:
+      file.write('\n'.join(VCF_LINES) + '\n')
+    return pysam.tabix_index(vcf_path, preset='vcf')
+
+  def test_parse_region(self):
+    self.assertEqual(parse_region('REF1:10-20'), ('REF1', 9, 20))
+    self.assertEqual(parse_region('REF1:1,000-2,000'), ('REF1', 999, 2000))
+    self.assertEqual(parse_region('REF1:10'), ('REF1', 9, 2 ** 31 - 1))
+    self.assertEqual(parse_region('REF1'), ('REF1', 0, 2 ** 31 - 1))
+    with self.assertRaises(ValueError):
+      parse_region('REF1:20-10')
+
+  def test_read_bed_and_resolve(self):
+    bed_path = os.path.join(self.tmp_dir.name, 'regions.bed')
+    with open(bed_path, 'w') as file:
+      file.write('track name=test\n# comment\nREF1\t9\t20\tgene1\nREF1\t30\t45\n')
+    self.assertEqual(read_bed(bed_path), [('REF1', 9, 20), ('REF1', 30, 45)])
+    cds_store = CdsStore([(('REF1',), [(266, 300, 'orf1')])])
+    self.assertEqual(resolve_regions(bed_path, cds_store), [('REF1', 9, 20), ('REF1', 30, 45)])
+    self.assertEqual(resolve_regions('REF1:1-5,REF1:8-9', cds_store), [('REF1', 0, 5), ('REF1', 7, 9)])
+    self.assertEqual(resolve_regions(CDS_REGIONS, cds_store), [(None, 265, 300)])
+    two_contigs = CdsStore([(('REF1.1', 'REF1'), [(266, 300, 'orf1')]), (('REF2',), [(10, 30, 'orf2')])])
+    self.assertEqual(resolve_regions(CDS_REGIONS, two_contigs), [('REF1.1', 265, 300), ('REF2', 9, 30)])
+
+  def test_merge_regions(self):
+    regions = [('B', 5, 10), ('A', 20, 30), ('A', 0, 10), ('A', 10, 15), ('A', 25, 40)]
+    self.assertEqual(merge_regions(regions), [('A', 0, 15), ('A', 20, 40), ('B', 5, 10)])
+
+  def test_iter_region_lines(self):
+    vcf_path = self.write_indexed_vcf()
+    lines = list(iter_region_lines(vcf_path, [('REF1', 11, 12), ('REF1', 18, 45)]))
+    self.assertEqual([line.split('\t')[1] for line in lines], ['10', '20', '40'])
+
+  def test_record_spanning_regions_read_once(self):
+    vcf_path = self.write_indexed_vcf()
+    # the deletion at POS 10 (REF ACATG) overlaps both regions
+    lines = list(iter_region_lines(vcf_path, [('REF1', 10, 11), ('REF1', 12, 13)]))
+    self.assertEqual([line.split('\t')[1] for line in lines], ['10'])
+
+  def test_cds_regions_use_single_contig(self):
+    vcf_path = self.write_indexed_vcf()
+    lines = list(iter_region_lines(vcf_path, [(None, 55, 70)]))
+    self.assertEqual([line.split('\t')[1] for line in lines], ['60'])
+
+  def test_unindexed_vcf_rejected(self):
+    vcf_path = os.path.join(self.tmp_dir.name, 'plain.vcf')
+    with open(vcf_path, 'w') as file:
+      file.write('\n'.join(VCF_LINES) + '\n')
+    with self.assertRaises(ValueError):
+      list(iter_region_lines(vcf_path, [('REF1', 0, 10)]))
+
+  def test_prefiltered_reader_with_regions(self):
+    vcf_path = self.write_indexed_vcf()
+    with PrefilteredVcfReader.from_path(vcf_path, [('REF1', 0, 30)]) as reader:
+      self.assertEqual([record.POS for record in reader], [10, 20])
+    with PrefilteredVcfReader.from_path(vcf_path, [('REF1', 0, 30)], prefilter=False) as reader:
+      self.assertEqual([record.POS for record in reader], [5, 10, 20])
+
+if __name__ == '__main__':
+  unittest.main()
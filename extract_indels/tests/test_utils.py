@@ -2,8 +2,9 @@ import unittest
 import os
 import csv
 import sys
+import gzip
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import write_csv
+from utils import write_csv, write_rows, batched, OUTPUT_HEADER
 
 class TestUtils(unittest.TestCase):
   def setUp(self):
@@ -44,7 +45,31 @@ class TestUtils(unittest.TestCase):
       
       for idx, row in enumerate(csv_reader):
         self.assertEqual(row, self.data[idx])
-       
+
+  def test_batched(self):
+    self.assertEqual(list(batched(iter(range(5)), 2)), [[0, 1], [2, 3], [4]])
+    self.assertEqual(list(batched([], 2)), [])
+
+  def test_write_rows_csv_gz(self):
+    rows = [['test_sample', 20, 'ACAT', 'A', 100, 20, 20.0, True, 'deletion', 'PRODUCT1', 'placement1']]
+    n_rows = write_rows(self.sample_id, self.output_path, (row for row in rows), 'csv.gz')
+    file_path = os.path.join(self.output_path, f"{self.sample_id}_indels_af10_dp30.csv.gz")
+    try:
+      self.assertEqual(n_rows, 1)
+      with gzip.open(file_path, 'rt') as csv_file:
+        self.assertEqual(list(csv.reader(csv_file)), [OUTPUT_HEADER, [str(el) for el in rows[0]]])
+    finally:
+      os.remove(file_path)
+
+  def test_write_rows_failure_leaves_no_file(self):
+    def failing_rows():
+      yield ['test_sample', 20, 'ACAT', 'A', 100, 20, 20.0, True, 'deletion', 'PRODUCT1', 'placement1']
+      raise ValueError('bad record')
+
+    with self.assertRaises(ValueError):
+      write_rows(self.sample_id, self.output_path, failing_rows(), 'csv')
+    self.assertEqual(os.listdir(self.output_path), [])
+
             
 
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vcfpy
+from vcf_stream import is_indel_candidate, PrefilteredVcfReader
+
+MUTECT2_VCF = '\n'.join([
+  '##fileformat=VCFv4.2',
+  '##source=Mutect2',
+  '##contig=<ID=REF1,length=100>',
+  '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths">',
+  '##FORMAT=<ID=AF,Number=A,Type=Float,Description="Allele fraction">',
+  '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+  '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE',
+  'REF1\t10\t.\tT\tA\t.\tPASS\t.\tAD:AF:DP\t80,20:0.2:100',
+  'REF1\t20\t.\tACAT\tA\t.\tPASS\t.\tAD:AF:DP\t80,20:0.2:100',
+  'REF1\t30\t.\tGA\tTC\t.\tPASS\t.\tAD:AF:DP\t80,20:0.2:100',
+  'REF1\t40\t.\tG\tGAAT,T\t.\tPASS\t.\tAD:AF:DP\t80,10,10:0.1,0.1:100',
+  'REF1\t50\t.\tG\t<DEL>\t.\tPASS\t.\tAD:AF:DP\t80,20:0.2:100',
+  'REF1\t60\t.\tG\t.\t.\tPASS\t.\tAD:AF:DP\t100:.:100',
+  '',
+])
+
+class TestVcfStream(unittest.TestCase):
+  def test_is_indel_candidate(self):
+    self.assertFalse(is_indel_candidate('REF1\t10\t.\tT\tA\t.\tPASS\t.\tGT\t1\n'))
+    self.assertFalse(is_indel_candidate('REF1\t10\t.\tGA\tTC,GG\t.\tPASS\t.\tGT\t1\n'))
+    self.assertFalse(is_indel_candidate('REF1\t10\t.\tT\t.\t.\tPASS\t.\tGT\t1\n'))
+    self.assertTrue(is_indel_candidate('REF1\t10\t.\tTA\tT\t.\tPASS\t.\tGT\t1\n'))
+    self.assertTrue(is_indel_candidate('REF1\t10\t.\tT\tA,TAA\t.\tPASS\t.\tGT\t1\n'))
+    self.assertTrue(is_indel_candidate('REF1\t10\t.\tTAC\t<DUP>\t.\tPASS\t.\tGT\t1\n'))
+    self.assertTrue(is_indel_candidate('REF1\t10\t.\tT\tT[REF1:20[\t.\tPASS\t.\tGT\t1\n'))
+    self.assertTrue(is_indel_candidate('REF1 10 . T A . PASS . GT 1\n'))
+    self.assertFalse(is_indel_candidate('\n'))
+
+  def test_prefiltered_reader_matches_vcfpy(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      vcf_file_path = os.path.join(tmp_dir, 'test.vcf')
+      with open(vcf_file_path, 'w') as file:
+        file.write(MUTECT2_VCF)
+
+      with vcfpy.Reader.from_path(vcf_file_path) as reader:
+        expected = [str(record) for record in reader if any(alt.type not in ('SNV', 'MNV') for alt in record.ALT)]
+      with PrefilteredVcfReader.from_path(vcf_file_path) as reader:
+        self.assertEqual(reader.header.samples.names, ['SAMPLE'])
+        self.assertEqual([str(record) for record in reader], expected)
+      self.assertEqual(len(expected), 3)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,29 +1,177 @@
 import csv
+import gzip
 import os
-from typing import List
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import List, Any, Iterable, Iterator, Optional, Dict
+from parsers import MIN_DP, MIN_AF
 
-def write_csv(sample_id: str, output_path: str, data: List) -> None:
+OUTPUT_HEADER = ['SAMPLE_ID', 'POSITION', 'REFERENCE_SEQ', 'ALTERNATIVE_SEQ',
+                 'SEQ_DEPTH', 'ALT_SEQ_DEPTH', 'FREQUENCY',
+                #  'ADF_RATIO', 'ADR_RATIO', 'STRND_BIAS_PASS', # no longer needed, keep for 'in case'
+                 'VALID_CODON_LEN',
+                 'CHANGE_TYPE', 'PRODUCT', 'PLACEMENT']
+OUTPUT_FORMATS = ('csv', 'csv.gz', 'parquet')
+WRITE_BATCH_SIZE = 10000
+DEFAULT_FILE_TAG = 'af10_dp30'
+
+def batched(rows: Iterable[List[Any]], batch_size: int = WRITE_BATCH_SIZE) -> Iterator[List[List[Any]]]:
+  rows = iter(rows)
+  while True:
+    batch = list(islice(rows, batch_size))
+    if not batch:
+      return
+    yield batch
+
+def get_file_tag(vcf_options: Optional[Dict[str, Any]] = None) -> str:
+  """
+  Builds the thresholds part of the output file name, e.g. 'af10_dp30' for AF >= 0.1 and DP >= 30.
+  """
+  vcf_options = vcf_options or {}
+  min_af = vcf_options.get('min_af', MIN_AF)
+  min_dp = vcf_options.get('min_dp', MIN_DP)
+  return f"af{round(min_af * 100, 2):g}_dp{min_dp}"
+
+def get_output_file_path(sample_id: str, output_path: str, output_format: str = 'csv',
+                         file_tag: str = DEFAULT_FILE_TAG) -> str:
+  return os.path.join(output_path, f"{sample_id}_indels_{file_tag}.{output_format}")
+
+class OutputSink(ABC):
+  """
+  Base class for indel row writers. Rows go to a '.part' file that is renamed to the
+  final name on close, so a failed run leaves no partial output.
+  """
+
+  def __init__(self, file_path: str):
+    self.file_path = file_path
+    self.part_path = f"{file_path}.part"
+    self.n_rows = 0
+    self.file = None
+
+  @abstractmethod
+  def write_rows(self, rows: List[List[Any]]) -> None:
+    ...
+
+  def close(self) -> None:
+    self.file.close()
+    os.replace(self.part_path, self.file_path)
+
+  def abort(self) -> None:
+    self.file.close()
+    os.remove(self.part_path)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    if exc_type is None:
+      self.close()
+    else:
+      self.abort()
+
+class CsvSink(OutputSink):
+  """
+  Writes indel rows to a (optionally gzip-compressed) CSV file.
+  """
+
+  def __init__(self, file_path: str, compress: bool = False):
+    super().__init__(file_path)
+    if compress:
+      self.file = gzip.open(self.part_path, 'wt', newline='')
+    else:
+      self.file = open(self.part_path, 'w', newline='')
+    self.csv_writer = csv.writer(self.file)
+    self.csv_writer.writerow(OUTPUT_HEADER)
+
+  def write_rows(self, rows: List[List[Any]]) -> None:
+    self.csv_writer.writerows(rows)
+    self.n_rows += len(rows)
+
+class ParquetSink(OutputSink):
+  """
+  Writes indel rows to a Parquet file with typed columns, one row group per batch.
+  VALID_CODON_LEN is a nullable boolean ('NA' is stored as null).
+  """
+
+  def __init__(self, file_path: str):
+    try:
+      import pyarrow as pa
+      import pyarrow.parquet as pq
+    except ImportError as e:
+      raise ImportError("Parquet output requires pyarrow (pip install pyarrow)") from e
+
+    super().__init__(file_path)
+    self.pa = pa
+    self.schema = pa.schema([
+      ('SAMPLE_ID', pa.string()), ('POSITION', pa.int64()),
+      ('REFERENCE_SEQ', pa.string()), ('ALTERNATIVE_SEQ', pa.string()),
+      ('SEQ_DEPTH', pa.int64()), ('ALT_SEQ_DEPTH', pa.int64()), ('FREQUENCY', pa.float64()),
+      ('VALID_CODON_LEN', pa.bool_()),
+      ('CHANGE_TYPE', pa.string()), ('PRODUCT', pa.string()), ('PLACEMENT', pa.string()),
+    ])
+    self.file = pq.ParquetWriter(self.part_path, self.schema)
+
+  def write_rows(self, rows: List[List[Any]]) -> None:
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in OUTPUT_HEADER]
+    valid_idx = OUTPUT_HEADER.index('VALID_CODON_LEN')
+    columns[valid_idx] = [value if isinstance(value, bool) else None for value in columns[valid_idx]]
+    self.file.write_table(self.pa.Table.from_arrays(
+      [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+      schema=self.schema))
+    self.n_rows += len(rows)
+
+def open_sink(sample_id: str, output_path: str, output_format: str = 'csv',
+              file_tag: str = DEFAULT_FILE_TAG) -> OutputSink:
+  """
+  Opens an output sink for one sample (or for the merged table).
+
+  Parameters:
+    sample_id (str): The sample ID to include in the file name.
+    output_path (str): The directory where the file will be saved.
+    output_format (str): One of 'csv', 'csv.gz' or 'parquet'.
+    file_tag (str): Thresholds part of the file name (see get_file_tag).
+
+  Returns:
+    OutputSink: Sink with write_rows/close, usable as a context manager.
+  """
+  if output_format not in OUTPUT_FORMATS:
+    raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+  os.makedirs(output_path, exist_ok=True)
+  file_path = get_output_file_path(sample_id, output_path, output_format, file_tag)
+  if output_format == 'parquet':
+    return ParquetSink(file_path)
+  return CsvSink(file_path, compress=(output_format == 'csv.gz'))
+
+def write_rows(sample_id: str, output_path: str, rows: Iterable[List[Any]], output_format: str = 'csv',
+               file_tag: str = DEFAULT_FILE_TAG) -> int:
+  """
+  Streams indel rows into an output file, consuming the rows in bounded batches.
+
+  Parameters:
+    sample_id (str): The sample ID to include in the file name.
+    output_path (str): The directory where the file will be saved.
+    rows (Iterable[List[Any]]): Rows to write; may be a lazy generator.
+    output_format (str): One of 'csv', 'csv.gz' or 'parquet'.
+    file_tag (str): Thresholds part of the file name (see get_file_tag).
+
+  Returns:
+    int: Number of rows written.
+  """
+  with open_sink(sample_id, output_path, output_format, file_tag) as sink:
+    for batch in batched(rows):
+      sink.write_rows(batch)
+  return sink.n_rows
+
+def write_csv(sample_id: str, output_path: str, data: Iterable[List[Any]]) -> None:
   """
   Writes the extracted indel information to a CSV file.
 
   Parameters:
     sample_id (str): The sample ID to include in the CSV file name.
     output_path (str): The directory where the CSV file will be saved.
-    data (List[List[Any]]): The data to be written to the CSV file. Each sublist represents a row.
+    data (Iterable[List[Any]]): The data to be written to the CSV file. Each sublist represents a row.
 
   Returns:
     None
   """
-  os.makedirs(output_path, exist_ok=True)
-  file_name = f"{sample_id}_indels_af10_dp30.csv"
-  full_indel_csv_filename = os.path.join(output_path, file_name)
-  
-  with open(full_indel_csv_filename, 'w', newline='') as csv_file:
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow(['SAMPLE_ID', 'POSITION', 'REFERENCE_SEQ', 'ALTERNATIVE_SEQ', 
-                         'SEQ_DEPTH', 'ALT_SEQ_DEPTH', 'FREQUENCY', 
-                        #  'ADF_RATIO', 'ADR_RATIO', 'STRND_BIAS_PASS', # no longer needed, keep for 'in case'
-                         'VALID_CODON_LEN',  
-                         'CHANGE_TYPE', 'PRODUCT', 'PLACEMENT'])
-    for row in data:
-      csv_writer.writerow(row)
\ No newline at end of file
+  write_rows(sample_id, output_path, data, 'csv')
@@ -0,0 +1,102 @@
+import gzip
+import io
+import vcfpy
+from typing import Iterator, Optional, TextIO, List
+from regions import Region, iter_region_lines
+
+# characters that mark symbolic/breakend ALT alleles; such lines are always fully decoded
+SPECIAL_ALT_CHARS = ('<', '[', ']')
+
+def open_vcf_text(vcf_file_path: str) -> TextIO:
+  if vcf_file_path.endswith('.gz') or vcf_file_path.endswith('.bgz'):
+    return gzip.open(vcf_file_path, 'rt')
+  return open(vcf_file_path, 'r')
+
+def is_indel_candidate(line: str) -> bool:
+  """
+  Checks on the raw VCF line whether the record may be an indel.
+  Only REF and ALT are looked at; plain substitutions (every ALT allele has the
+  REF length) are rejected, anything else is kept for full decoding.
+
+  Parameters:
+    line (str): Raw VCF data line.
+
+  Returns:
+    bool: False if the record is certainly not an indel.
+  """
+  fields = line.split('\t', 5)
+  if len(fields) < 6:
+    # not tab-separated or truncated: leave the decision (or the error) to vcfpy
+    return bool(line.strip())
+  ref, alt = fields[3], fields[4]
+  if alt == '.':
+    return False
+  ref_len = len(ref)
+  for allele in alt.split(','):
+    if len(allele) != ref_len or allele[0] == '.' or allele[-1] == '.':
+      return True
+    if any(char in allele for char in SPECIAL_ALT_CHARS):
+      return True
+  return False
+
+class PrefilteredVcfReader:
+  """
+  VCF reader that skips records which cannot be indels before vcfpy decodes them.
+  Only the header and the candidate lines are parsed by vcfpy, so the records
+  yielded are the same vcfpy.Record objects the plain vcfpy.Reader would produce.
+  With regions, only records overlapping them are read, through the tabix index.
+  """
+
+  def __init__(self, stream: TextIO, path: Optional[str] = None,
+               regions: Optional[List[Region]] = None, prefilter: bool = True):
+    self.stream = stream
+    self.path = path
+    self.regions = regions
+    self.prefilter = prefilter
+    header_lines = []
+    for line in stream:
+      header_lines.append(line)
+      if not line.startswith('##'):
+        break
+    self._vcf_reader = vcfpy.Reader.from_stream(io.StringIO(''.join(header_lines)), path=path)
+    self.header = self._vcf_reader.header
+
+  @classmethod
+  def from_path(cls, vcf_file_path: str, regions: Optional[List[Region]] = None,
+                prefilter: bool = True) -> 'PrefilteredVcfReader':
+    stream = open_vcf_text(vcf_file_path)
+    try:
+      return cls(stream, vcf_file_path, regions, prefilter)
+    except BaseException:
+      stream.close()
+      raise
+
+  def iter_lines(self) -> Iterator[str]:
+    if self.regions is None:
+      return iter(self.stream)
+    if self.path is None:
+      raise ValueError("Region queries need a VCF file path")
+    return iter_region_lines(self.path, self.regions)
+
+  def iter_candidate_lines(self) -> Iterator[str]:
+    for line in self.iter_lines():
+      if is_indel_candidate(line) if self.prefilter else line.strip():
+        yield line
+
+  def parse_line(self, line: str) -> Optional[vcfpy.Record]:
+    return self._vcf_reader.parser.parse_line(line)
+
+  def __iter__(self) -> Iterator[vcfpy.Record]:
+    for line in self.iter_candidate_lines():
+      record = self.parse_line(line)
+      if record is not None:
+        yield record
+
+  def close(self) -> None:
+    self.stream.close()
+
+  def __enter__(self) -> 'PrefilteredVcfReader':
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self.close()
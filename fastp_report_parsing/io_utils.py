@@ -1,27 +1,192 @@
 import os
 import csv
-from parsers import parse_fastp_stats
-
-def extract_data(json_files, output_file_path):
-  header = [
-    'SAMPLE_ID', 'TOTAL_READS', 'R1_mean_len', 
-    # 'R2_mean_len', 'DUPLIC_RATE', 
-    'DUPLIC_RATE', 
-    # 'INSERT_SIZE_PEAK', 'INSERT_SIZE_UNKNOWN', 
-    'GC_CONT_BEFORE_FILT', 'GC_CONT_AFTER_FILT', 
-    'PASSED_FILT_READS', 'PASSED_FILT_PERCENT', 
-    'LOW_QUAL_READS', 'LOW_QUAL_RATIO', 
-    'TOO_MANY_N_READS', 'TOO_MANY_N_RATIO', 
-    'TOO_SHORT_READS', 'TOO_SHORT_RATIO', 
-  ]
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from parsers import parse_fastp_stats, parse_fastp_curves, CURVE_SECTIONS, CURVE_METRIC_NAMES
 
+def get_sample_id(json_file):
+  basename = os.path.basename(json_file)
+  return basename.replace('_report.json', '')
+
+def parse_report(json_file):
+  return [get_sample_id(json_file)] + parse_fastp_stats(json_file)
+
+def iter_parsed_reports(parse_func, json_files, workers=1):
+  """
+  Parses the reports in input order, over a process pool when workers > 1.
+  """
+  if workers <= 1 or len(json_files) <= 1:
+    yield from map(parse_func, json_files)
+    return
+  chunksize = max(1, len(json_files) // (workers * 8))
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    yield from executor.map(parse_func, json_files, chunksize=chunksize)
+
+def iter_report_rows(json_files, workers=1):
+  return iter_parsed_reports(parse_report, json_files, workers)
+
+REPORT_HEADER = [
+  'SAMPLE_ID', 'TOTAL_READS', 'R1_mean_len', 
+  # 'R2_mean_len', 'DUPLIC_RATE', 
+  'DUPLIC_RATE', 
+  # 'INSERT_SIZE_PEAK', 'INSERT_SIZE_UNKNOWN', 
+  'GC_CONT_BEFORE_FILT', 'GC_CONT_AFTER_FILT', 
+  'PASSED_FILT_READS', 'PASSED_FILT_PERCENT', 
+  'LOW_QUAL_READS', 'LOW_QUAL_RATIO', 
+  'TOO_MANY_N_READS', 'TOO_MANY_N_RATIO', 
+  'TOO_SHORT_READS', 'TOO_SHORT_RATIO', 
+]
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+
+def extract_data(json_files, output_file_path, workers=1):
   with open(output_file_path, 'w', newline='') as output_file:
     writer = csv.writer(output_file)
-    writer.writerow(header)
+    writer.writerow(REPORT_HEADER)
 
-    for json_file in json_files:
-      basename = os.path.basename(json_file)
-      sample_id = basename.replace('_report.json', '')
-      fastp_stats = parse_fastp_stats(json_file)
-      current_row = [sample_id] + fastp_stats
+    for current_row in iter_report_rows(json_files, workers):
       writer.writerow(current_row)
+
+def get_manifest_path(output_file_path):
+  # not *.json: the output directory may be the report directory
+  return f"{os.path.splitext(output_file_path)[0]}.manifest"
+
+def hash_file(file_path):
+  digest = hashlib.sha256()
+  with open(file_path, 'rb') as file:
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+def read_manifest(manifest_path):
+  """
+  Returns {report path: entry} of already ingested reports; entries hold size, mtime_ns,
+  sha256 and the report's CSV row. A missing or outdated manifest is empty.
+  """
+  try:
+    with open(manifest_path, 'r') as file:
+      manifest = json.load(file)
+  except FileNotFoundError:
+    return {}
+  if manifest.get('version') != MANIFEST_VERSION or manifest.get('header') != REPORT_HEADER:
+    print(f"Manifest {manifest_path} is outdated, all reports will be parsed again.")
+    return {}
+  return manifest['reports']
+
+def atomic_write_text(file_path, write):
+  tmp_path = f"{file_path}.tmp"
+  with open(tmp_path, 'w', newline='') as file:
+    write(file)
+  os.replace(tmp_path, file_path)
+
+def hash_and_parse_report(task):
+  """
+  Hashes a report and parses it unless its hash equals known_sha256 (a touched but unchanged
+  report). Runs in the pool workers, so new reports are hashed in parallel with their parse.
+
+  Returns the hash and the report row (None when unchanged).
+  """
+  json_file, known_sha256 = task
+  sha256 = hash_file(json_file)
+  if sha256 == known_sha256:
+    return sha256, None
+  return sha256, parse_report(json_file)
+
+def extract_data_incremental(json_files, output_file_path, workers=1):
+  """
+  Updates the QC table in place: only reports that are new or changed since the last run (by
+  size and mtime, then content hash) are parsed, their rows are upserted and rows of reports
+  that no longer exist are dropped. Rows follow the order of json_files, as in extract_data.
+
+  Returns the numbers of parsed and dropped reports.
+  """
+  manifest_path = get_manifest_path(output_file_path)
+  manifest = read_manifest(manifest_path) if os.path.exists(output_file_path) else {}
+  reports = {}
+  to_check = []
+  for json_file in json_files:
+    key = os.path.abspath(json_file)
+    stat = os.stat(json_file)
+    entry = manifest.get(key)
+    if entry is not None and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+      reports[key] = entry
+      continue
+    # new, touched or rewritten: hashed in the workers, touched reports are reparsed only if the content changed
+    known_sha256 = entry['sha256'] if entry is not None and entry['size'] == stat.st_size else None
+    reports[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': None,
+                    'row': entry['row'] if entry is not None else None}
+    to_check.append((key, json_file, known_sha256))
+
+  n_parsed = 0
+  tasks = [(json_file, known_sha256) for _, json_file, known_sha256 in to_check]
+  for (key, _, _), (sha256, current_row) in zip(to_check, iter_parsed_reports(hash_and_parse_report, tasks, workers)):
+    reports[key]['sha256'] = sha256
+    if current_row is not None:
+      reports[key]['row'] = current_row
+      n_parsed += 1
+  n_dropped = len(set(manifest) - set(reports))
+
+  def write_table(output_file):
+    writer = csv.writer(output_file)
+    writer.writerow(REPORT_HEADER)
+    writer.writerows(entry['row'] for entry in reports.values())
+
+  atomic_write_text(output_file_path, write_table)
+  atomic_write_text(manifest_path, lambda file: json.dump(
+    {'version': MANIFEST_VERSION, 'header': REPORT_HEADER, 'reports': reports}, file))
+  return n_parsed, n_dropped
+
+CURVE_FORMATS = ('npz', 'parquet')
+
+def collect_curves(json_files, workers=1):
+  """
+  Stacks the per-cycle curves of all reports into one float32 array of shape
+  (samples, sections, cycles, metrics); samples with fewer cycles are padded with NaN.
+
+  Returns the sample ids, the per-sample cycle counts and the array.
+  """
+  sample_curves = list(iter_parsed_reports(parse_fastp_curves, json_files, workers))
+  n_cycles = np.array([curves.shape[1] for curves in sample_curves], dtype=np.int32)
+  max_cycles = int(n_cycles.max()) if len(sample_curves) else 0
+  all_curves = np.full((len(sample_curves), len(CURVE_SECTIONS), max_cycles, len(CURVE_METRIC_NAMES)), np.nan, dtype=np.float32)
+  for sample_idx, curves in enumerate(sample_curves):
+    all_curves[sample_idx, :, :curves.shape[1]] = curves
+  return [get_sample_id(json_file) for json_file in json_files], n_cycles, all_curves
+
+def write_curves_npz(curves_file_path, sample_ids, n_cycles, all_curves):
+  # one (samples, cycles, metrics) array per section
+  arrays = {section: all_curves[:, section_idx] for section_idx, section in enumerate(CURVE_SECTIONS)}
+  with open(curves_file_path, 'wb') as file:
+    np.savez_compressed(file, sample_ids=np.array(sample_ids), metrics=np.array(CURVE_METRIC_NAMES),
+                        n_cycles=n_cycles, **arrays)
+
+def write_curves_parquet(curves_file_path, sample_ids, n_cycles, all_curves):
+  try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+  except ImportError as e:
+    raise ImportError("Parquet output requires pyarrow (pip install pyarrow)") from e
+
+  # long table: one row per sample, section and cycle, one float32 column per metric
+  in_run = np.broadcast_to(np.arange(all_curves.shape[2])[None, None, :] < n_cycles[:, None, None], all_curves.shape[:3])
+  sample_idx, section_idx, cycle_idx = np.nonzero(in_run)
+  columns = {
+    'SAMPLE_ID': pa.DictionaryArray.from_arrays(sample_idx.astype(np.int32), pa.array(sample_ids)),
+    'SECTION': pa.DictionaryArray.from_arrays(section_idx.astype(np.int32), pa.array(CURVE_SECTIONS)),
+    'CYCLE': pa.array(cycle_idx.astype(np.int32) + 1),
+  }
+  values = all_curves[sample_idx, section_idx, cycle_idx]
+  for metric_idx, metric in enumerate(CURVE_METRIC_NAMES):
+    columns[metric] = pa.array(values[:, metric_idx])
+  pq.write_table(pa.table(columns), curves_file_path)
+
+def extract_curves(json_files, curves_file_path, curve_format='npz', workers=1):
+  if curve_format not in CURVE_FORMATS:
+    raise ValueError(f"Unknown curve format '{curve_format}', expected one of {CURVE_FORMATS}")
+  sample_ids, n_cycles, all_curves = collect_curves(json_files, workers)
+  if curve_format == 'npz':
+    write_curves_npz(curves_file_path, sample_ids, n_cycles, all_curves)
+  else:
+    write_curves_parquet(curves_file_path, sample_ids, n_cycles, all_curves)
@@ -3,19 +3,32 @@
 import argparse
 import os
 import glob
-from io_utils import extract_data
+from io_utils import extract_data, extract_data_incremental, extract_curves, CURVE_FORMATS
 
-def main(json_files_path, output_path):
+def main(json_files_path, output_path, workers=1, incremental=False, curve_format=None):
   json_files_paths = glob.glob(os.path.join(json_files_path, "*.json"))
   output_file_path = f"{output_path}/fastp_qc_report.csv"
-  extract_data(json_files_paths, output_file_path)
+  if incremental:
+    n_parsed, n_dropped = extract_data_incremental(json_files_paths, output_file_path, workers)
+    print(f"Parsed {n_parsed} new or changed of {len(json_files_paths)} reports, dropped {n_dropped} deleted.")
+  else:
+    extract_data(json_files_paths, output_file_path, workers)
+  if curve_format is not None:
+    extract_curves(json_files_paths, f"{output_path}/fastp_qc_curves.{curve_format}", curve_format, workers)
   
 if __name__ == '__main__':
   parser = argparse.ArgumentParser(description='Extracts selected statistics from fastp json report files.',
                                   usage='Usage: ./main.py <json_files_path> <output_dir>')
   parser.add_argument('json_files_path', type=str, help='Path to the directory with fastp json report files')
   parser.add_argument('output_path', type=str, help='Path where the output CSV will be saved')
+  parser.add_argument('--incremental', action='store_true',
+                      help='Parse only reports that are new or changed since the last run (tracked in fastp_qc_report.manifest), '
+                           'update their rows and drop rows of deleted reports')
+  parser.add_argument('--curves', choices=CURVE_FORMATS, default=None,
+                      help='Also collect the per-cycle quality and base content curves (read1 before/after filtering) '
+                           'of all samples into fastp_qc_curves.npz or .parquet')
+  parser.add_argument('--workers', type=int, default=1, help='Number of worker processes parsing the reports (default: 1)')
   
   args = parser.parse_args()
-  main(args.json_files_path, args.output_path)
+  main(args.json_files_path, args.output_path, args.workers, args.incremental, args.curves)
   print('Parsing fastp json reports is done!')
\ No newline at end of file
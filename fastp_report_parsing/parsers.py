@@ -1,8 +1,88 @@
 import json
+import numpy as np
 
-def parse_fastp_stats(json_file_path):
+try:
+  import orjson
+  load_json = orjson.loads
+except ImportError:
+  load_json = json.loads
+
+# the only report sections parse_fastp_stats reads; fastp writes them first, ahead of the large
+# per-cycle curves, k-mer tables and overrepresented sequences
+FASTP_SECTIONS = ('summary', 'filtering_result', 'duplication')
+READ_CHUNK_SIZE = 1 << 14
+CURVE_SECTIONS = ('read1_before_filtering', 'read1_after_filtering')
+CURVE_METRICS = [
+  ('quality_curves', 'A'), ('quality_curves', 'T'), ('quality_curves', 'C'), ('quality_curves', 'G'),
+  ('quality_curves', 'mean'),
+  ('content_curves', 'A'), ('content_curves', 'T'), ('content_curves', 'C'), ('content_curves', 'G'),
+  ('content_curves', 'N'), ('content_curves', 'GC'),
+]
+CURVE_METRIC_NAMES = [f"{curves.split('_')[0]}_{base}" for curves, base in CURVE_METRICS]
+_decoder = json.JSONDecoder()
+
+class IncompleteJson(Exception):
+  pass
+
+def _skip_ws(text, idx):
+  while idx < len(text) and text[idx] in ' \t\r\n':
+    idx += 1
+  if idx == len(text):
+    raise IncompleteJson()
+  return idx
+
+def scan_top_level(text, sections):
+  """
+  Decodes the top-level members of a JSON object one by one and stops as soon as all
+  requested sections are found. Raises IncompleteJson if text ends before that.
+  """
+  data = {}
+  idx = _skip_ws(text, 0)
+  if text[idx] != '{':
+    raise ValueError('fastp report is not a JSON object')
+  idx += 1
+  while True:
+    idx = _skip_ws(text, idx)
+    if text[idx] == '}':
+      return data
+    try:
+      key, idx = _decoder.raw_decode(text, idx)
+      idx = _skip_ws(text, idx)
+      if text[idx] != ':':
+        raise ValueError(f'Unexpected character in fastp report at {idx}')
+      value, idx = _decoder.raw_decode(text, _skip_ws(text, idx + 1))
+    except json.JSONDecodeError:
+      raise IncompleteJson()
+    if key in sections:
+      data[key] = value
+      if len(data) == len(sections):
+        return data
+    idx = _skip_ws(text, idx)
+    if text[idx] == ',':
+      idx += 1
+
+def load_fastp_sections(json_file_path, sections=FASTP_SECTIONS):
+  """
+  Reads only the leading part of a fastp report, growing the read until the requested
+  sections are decoded. Falls back to a full parse if the sections are not where fastp puts them.
+  """
   with open(json_file_path, 'r') as file:
-    data = json.load(file)
+    text = file.read(READ_CHUNK_SIZE)
+    while True:
+      try:
+        return scan_top_level(text, sections)
+      except IncompleteJson:
+        chunk = file.read(max(len(text), READ_CHUNK_SIZE))
+        if not chunk:
+          break
+        text += chunk
+      except ValueError:
+        text += file.read()
+        break
+  return load_json(text)
+
+def parse_fastp_stats(json_file_path):
+  data = load_fastp_sections(json_file_path)
   
   total_reads = data["summary"]["before_filtering"]["total_reads"]
   duplication_rate = data["duplication"]["rate"]
@@ -45,3 +125,23 @@ def parse_fastp_stats(json_file_path):
     too_many_N_reads, too_many_N_ratio,
     too_short_reads, too_short_ratio,
   ]
+
+
+def parse_fastp_curves(json_file_path):
+  """
+  Extracts the per-cycle quality and base content curves of read1 before and after filtering.
+
+  Returns a float32 array of shape (len(CURVE_SECTIONS), cycles, len(CURVE_METRICS));
+  curves missing from the report are NaN.
+  """
+  # the curve sections sit behind the k-mer tables, a plain full parse is cheaper than scanning to them
+  with open(json_file_path, 'rb') as file:
+    data = load_json(file.read())
+  n_cycles = max(data[section].get('total_cycles', 0) for section in CURVE_SECTIONS)
+  curves = np.full((len(CURVE_SECTIONS), n_cycles, len(CURVE_METRICS)), np.nan, dtype=np.float32)
+  for section_idx, section in enumerate(CURVE_SECTIONS):
+    for metric_idx, (curves_key, base) in enumerate(CURVE_METRICS):
+      values = data[section].get(curves_key, {}).get(base)
+      if values:
+        curves[section_idx, :len(values), metric_idx] = values[:n_cycles]
+  return curves
\ No newline at end of file
@@ -0,0 +1,188 @@
+import unittest
+import sys
+import os
+import csv
+import json
+import glob
+import shutil
+import tempfile
+import contextlib
+import io
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import io_utils
+from io_utils import extract_data, extract_data_incremental, extract_curves, get_manifest_path, REPORT_HEADER
+from parsers import parse_fastp_curves, CURVE_SECTIONS, CURVE_METRICS, CURVE_METRIC_NAMES
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'test_data')
+
+class TestIncremental(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.report_dir = os.path.join(self.tmp_dir.name, 'reports')
+    os.makedirs(self.report_dir)
+    for json_file in sorted(glob.glob(os.path.join(TEST_DATA, '*.json'))):
+      shutil.copy(json_file, self.report_dir)
+    self.output_file_path = os.path.join(self.tmp_dir.name, 'fastp_qc_report.csv')
+
+  def get_json_files(self):
+    return sorted(glob.glob(os.path.join(self.report_dir, '*.json')))
+
+  def report_path(self, sample_id):
+    return os.path.join(self.report_dir, f'{sample_id}_report.json')
+
+  def run_incremental(self, workers=1):
+    with contextlib.redirect_stdout(io.StringIO()):
+      return extract_data_incremental(self.get_json_files(), self.output_file_path, workers)
+
+  def read_table(self, output_file_path=None):
+    with open(output_file_path or self.output_file_path, 'r', newline='') as file:
+      return list(csv.reader(file))
+
+  def full_table(self):
+    output_file_path = os.path.join(self.tmp_dir.name, 'full.csv')
+    with contextlib.redirect_stdout(io.StringIO()):
+      extract_data(self.get_json_files(), output_file_path)
+    return self.read_table(output_file_path)
+
+  def rewrite_report(self, sample_id, total_reads):
+    with open(self.report_path(sample_id), 'r') as file:
+      report = json.load(file)
+    report['summary']['before_filtering']['total_reads'] = total_reads
+    with open(self.report_path(sample_id), 'w') as file:
+      json.dump(report, file)
+
+  def test_first_run_matches_full_table(self):
+    self.assertEqual(self.run_incremental(), (3, 0))
+    self.assertEqual(self.read_table(), self.full_table())
+    self.assertTrue(os.path.exists(get_manifest_path(self.output_file_path)))
+
+  def test_unchanged_reports_are_not_parsed(self):
+    self.run_incremental()
+    with mock.patch.object(io_utils, 'parse_report', side_effect=AssertionError('report parsed again')):
+      self.assertEqual(self.run_incremental(), (0, 0))
+      # touched with the same content: the hash matches, the row is kept
+      stat = os.stat(self.report_path('Sample2'))
+      os.utime(self.report_path('Sample2'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+      self.assertEqual(self.run_incremental(), (0, 0))
+    self.assertEqual(self.read_table(), self.full_table())
+
+  def test_changed_deleted_and_new_reports(self):
+    self.run_incremental()
+    before = {row[0]: row for row in self.read_table()[1:]}
+    self.rewrite_report('Sample1', 123456)
+    os.remove(self.report_path('Sample3'))
+    shutil.copy(os.path.join(TEST_DATA, 'Sample3_report.json'), self.report_path('Sample4'))
+
+    for workers in (1, 2):
+      self.assertEqual(self.run_incremental(workers), (2, 1) if workers == 1 else (0, 0))
+    table = self.read_table()
+    self.assertEqual(table, self.full_table())
+    self.assertEqual(table[0], REPORT_HEADER)
+    rows = {row[0]: row for row in table[1:]}
+    self.assertEqual(sorted(rows), ['Sample1', 'Sample2', 'Sample4'])
+    self.assertEqual(rows['Sample1'][1], '123456')
+    self.assertNotEqual(rows['Sample1'], before['Sample1'])
+    self.assertEqual(rows['Sample2'], before['Sample2'])
+    self.assertEqual(rows['Sample4'][1:], before['Sample3'][1:])
+
+  def test_same_size_edit_is_parsed(self):
+    self.run_incremental()
+    with open(self.report_path('Sample2'), 'r') as file:
+      text = file.read()
+    total_reads = json.loads(text)['summary']['before_filtering']['total_reads']
+    edited = str(total_reads)[:-1] + str((int(str(total_reads)[-1]) + 1) % 10)
+    stat = os.stat(self.report_path('Sample2'))
+    with open(self.report_path('Sample2'), 'w') as file:
+      file.write(text.replace(f'"total_reads":{total_reads}', f'"total_reads":{edited}', 1))
+    self.assertEqual(os.stat(self.report_path('Sample2')).st_size, stat.st_size)
+    os.utime(self.report_path('Sample2'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    self.assertEqual(self.run_incremental(), (1, 0))
+    rows = {row[0]: row for row in self.read_table()[1:]}
+    self.assertEqual(rows['Sample2'][1], edited)
+
+  def test_outdated_manifest(self):
+    self.run_incremental()
+    with open(get_manifest_path(self.output_file_path), 'w') as file:
+      json.dump({'version': 0, 'reports': {}}, file)
+    self.assertEqual(self.run_incremental(), (3, 0))
+    self.assertEqual(self.read_table(), self.full_table())
+
+class TestCurves(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.json_files = sorted(glob.glob(os.path.join(TEST_DATA, '*.json')))
+    # a shorter run with a missing curve: padded with NaN in the stacked array
+    with open(self.json_files[0], 'r') as file:
+      report = json.load(file)
+    for section in CURVE_SECTIONS:
+      report[section]['total_cycles'] = 50
+      for curves_key, base in CURVE_METRICS:
+        report[section][curves_key][base] = report[section][curves_key][base][:50]
+    del report['read1_after_filtering']['content_curves']['GC']
+    self.short_file = os.path.join(self.tmp_dir.name, 'Short_report.json')
+    with open(self.short_file, 'w') as file:
+      json.dump(report, file)
+    self.json_files.append(self.short_file)
+
+  def expected_curves(self, json_file):
+    with open(json_file, 'r') as file:
+      report = json.load(file)
+    return report, [[report[section][curves_key].get(base) for curves_key, base in CURVE_METRICS]
+                    for section in CURVE_SECTIONS]
+
+  def test_parse_fastp_curves(self):
+    for json_file in self.json_files:
+      report, expected = self.expected_curves(json_file)
+      curves = parse_fastp_curves(json_file)
+      n_cycles = max(report[section]['total_cycles'] for section in CURVE_SECTIONS)
+      self.assertEqual(curves.shape, (len(CURVE_SECTIONS), n_cycles, len(CURVE_METRICS)))
+      self.assertEqual(curves.dtype, np.float32)
+      for section_idx, section_curves in enumerate(expected):
+        for metric_idx, values in enumerate(section_curves):
+          if values is None:
+            self.assertTrue(np.isnan(curves[section_idx, :, metric_idx]).all())
+          else:
+            np.testing.assert_array_equal(curves[section_idx, :len(values), metric_idx], np.float32(values))
+
+  def test_npz_round_trip(self):
+    curves_file = os.path.join(self.tmp_dir.name, 'curves.npz')
+    extract_curves(self.json_files, curves_file, 'npz', workers=2)
+    with np.load(curves_file) as npz:
+      self.assertEqual(npz['sample_ids'].tolist(), ['Sample1', 'Sample2', 'Sample3', 'Short'])
+      self.assertEqual(npz['metrics'].tolist(), CURVE_METRIC_NAMES)
+      self.assertEqual(npz['n_cycles'].tolist(), [151, 151, 151, 50])
+      for section_idx, section in enumerate(CURVE_SECTIONS):
+        self.assertEqual(npz[section].shape, (4, 151, len(CURVE_METRICS)))
+        for sample_idx, json_file in enumerate(self.json_files):
+          curves = parse_fastp_curves(json_file)
+          np.testing.assert_array_equal(npz[section][sample_idx, :curves.shape[1]], curves[section_idx])
+          self.assertTrue(np.isnan(npz[section][sample_idx, curves.shape[1]:]).all())
+
+  def test_parquet_round_trip(self):
+    import pandas as pd
+
+    curves_file = os.path.join(self.tmp_dir.name, 'curves.parquet')
+    extract_curves(self.json_files, curves_file, 'parquet')
+    table = pd.read_parquet(curves_file)
+    self.assertEqual(list(table.columns), ['SAMPLE_ID', 'SECTION', 'CYCLE'] + CURVE_METRIC_NAMES)
+    # one row per sample, section and cycle of that sample
+    self.assertEqual(len(table), (151 * 3 + 50) * len(CURVE_SECTIONS))
+    for json_file in self.json_files:
+      sample_id = os.path.basename(json_file).replace('_report.json', '')
+      curves = parse_fastp_curves(json_file)
+      for section_idx, section in enumerate(CURVE_SECTIONS):
+        rows = table[(table['SAMPLE_ID'] == sample_id) & (table['SECTION'] == section)]
+        self.assertEqual(rows['CYCLE'].tolist(), list(range(1, curves.shape[1] + 1)))
+        np.testing.assert_array_equal(rows[CURVE_METRIC_NAMES].to_numpy(), curves[section_idx])
+
+  def test_unknown_curve_format(self):
+    with self.assertRaises(ValueError):
+      extract_curves(self.json_files, os.path.join(self.tmp_dir.name, 'curves.csv'), 'csv')
+
+if __name__ == '__main__':
+  unittest.main()
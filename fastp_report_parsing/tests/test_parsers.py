@@ -0,0 +1,101 @@
+import unittest
+import sys
+import os
+import csv
+import json
+import glob
+import tempfile
+import contextlib
+import io
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import parsers
+from parsers import load_fastp_sections, parse_fastp_stats, FASTP_SECTIONS
+from io_utils import extract_data
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'test_data')
+JSON_LOADERS = [('json', json.loads)] + ([('orjson', orjson.loads)] if orjson is not None else [])
+
+def load_full_report(json_file_path, sections=FASTP_SECTIONS):
+  # the previous parse path: the whole report through json.load
+  with open(json_file_path, 'r') as file:
+    return json.load(file)
+
+class TestParsers(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.json_files = sorted(glob.glob(os.path.join(TEST_DATA, '*.json')))
+
+  def write_report(self, name, report):
+    json_file_path = os.path.join(self.tmp_dir.name, f'{name}_report.json')
+    with open(json_file_path, 'w') as file:
+      json.dump(report, file, indent=4)
+    return json_file_path
+
+  def read_table(self, output_file_path):
+    with open(output_file_path, 'r', newline='') as file:
+      return list(csv.reader(file))
+
+  def test_load_fastp_sections_matches_full_load(self):
+    for json_file in self.json_files:
+      full_report = load_full_report(json_file)
+      expected = {section: full_report[section] for section in FASTP_SECTIONS}
+      self.assertEqual(load_fastp_sections(json_file), expected)
+      # a read much smaller than the sections is grown until they are decoded
+      with mock.patch.object(parsers, 'READ_CHUNK_SIZE', 64):
+        self.assertEqual(load_fastp_sections(json_file), expected)
+
+  def test_sections_out_of_place(self):
+    full_report = load_full_report(self.json_files[0])
+    # the needed sections after the large per-cycle sections
+    reordered = {key: value for key, value in full_report.items() if key not in FASTP_SECTIONS}
+    reordered.update((section, full_report[section]) for section in reversed(FASTP_SECTIONS))
+    json_file = self.write_report('reordered', reordered)
+    self.assertEqual(load_fastp_sections(json_file), {section: full_report[section] for section in FASTP_SECTIONS})
+    self.assertEqual(parse_fastp_stats(json_file), parse_fastp_stats(self.json_files[0]))
+
+  def test_missing_section(self):
+    full_report = load_full_report(self.json_files[0])
+    del full_report['duplication']
+    json_file = self.write_report('no_duplication', full_report)
+    sections = load_fastp_sections(json_file)
+    self.assertEqual(sorted(sections), ['filtering_result', 'summary'])
+    with self.assertRaises(KeyError):
+      parse_fastp_stats(json_file)
+    with mock.patch.object(parsers, 'load_fastp_sections', load_full_report):
+      with self.assertRaises(KeyError):
+        parse_fastp_stats(json_file)
+
+  def test_not_a_json_object(self):
+    json_file = os.path.join(self.tmp_dir.name, 'list_report.json')
+    with open(json_file, 'w') as file:
+      file.write('[1, 2]')
+    for _, load_json in JSON_LOADERS:
+      with mock.patch.object(parsers, 'load_json', load_json):
+        self.assertEqual(load_fastp_sections(json_file), [1, 2])
+
+  def test_extract_data_matches_full_load(self):
+    expected_path = os.path.join(self.tmp_dir.name, 'expected.csv')
+    with mock.patch.object(parsers, 'load_fastp_sections', load_full_report), contextlib.redirect_stdout(io.StringIO()):
+      extract_data(self.json_files, expected_path)
+    expected = self.read_table(expected_path)
+    self.assertEqual(len(expected), len(self.json_files) + 1)
+
+    for loader_name, load_json in JSON_LOADERS:
+      for workers in (1, 2):
+        with self.subTest(json_loader=loader_name, workers=workers):
+          output_path = os.path.join(self.tmp_dir.name, f'{loader_name}_{workers}.csv')
+          # the pool forks after the patch, so the workers use the same loader
+          with mock.patch.object(parsers, 'load_json', load_json), contextlib.redirect_stdout(io.StringIO()):
+            extract_data(self.json_files, output_path, workers)
+          self.assertEqual(self.read_table(output_path), expected)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,129 @@
+import os
+import io
+import time
+import shutil
+import tempfile
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+from count_matrix import read_abundance_h5, read_abundance_tsv
+import kallisto_output_parser2
+
+
+def write_kallisto_outputs(kal_out_path, n_targets, n_samples, seed=0):
+    """
+    Write n_samples synthetic kallisto output directories, each with an abundance.tsv and an
+    abundance.h5 laid out as kallisto writes them (gzip-compressed datasets, aux/ids as
+    variable-length strings). Returns the target_ids.
+    """
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    target_ids = np.array([f'ENST{idx:011d}.{idx % 9 + 1}' for idx in range(n_targets)], dtype=object)
+    lengths = rng.integers(200, 5000, n_targets).astype(np.int32)
+    eff_lengths = np.maximum(lengths - 180.0, 1.0)
+    for sample_idx in range(n_samples):
+        sample_dir = os.path.join(kal_out_path, f'Sample{sample_idx}')
+        os.makedirs(sample_dir, exist_ok=True)
+        est_counts = np.where(rng.random(n_targets) < 0.3, rng.gamma(0.5, 200.0, n_targets), 0.0).round(4)
+        rates = est_counts / eff_lengths
+        pd.DataFrame({'target_id': target_ids, 'length': lengths, 'eff_length': eff_lengths, 'est_counts': est_counts,
+                      'tpm': rates * (1e6 / rates.sum())}).to_csv(
+            os.path.join(sample_dir, 'abundance.tsv'), sep='\t', index=False, float_format='%g')
+        with h5py.File(os.path.join(sample_dir, 'abundance.h5'), 'w') as h5_file:
+            aux = h5_file.create_group('aux')
+            aux.create_dataset('ids', data=target_ids, dtype=h5py.string_dtype('ascii'), compression='gzip', compression_opts=6)
+            aux.create_dataset('lengths', data=lengths, compression='gzip', compression_opts=6)
+            aux.create_dataset('eff_lengths', data=eff_lengths, compression='gzip', compression_opts=6)
+            aux.create_dataset('num_bootstrap', data=np.array([0]))
+            h5_file.create_dataset('est_counts', data=est_counts, compression='gzip', compression_opts=6)
+            h5_file.create_group('bootstrap')
+    return target_ids
+
+
+def time_call(func, repeats=1):
+    """Best wall time of repeats calls, in seconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_file_reads(sample_dir, repeats=5):
+    """Per-file read times of one sample: the full TSV and h5 readers, and the h5 counts without aux/ids."""
+    import h5py
+
+    tsv_file = os.path.join(sample_dir, 'abundance.tsv')
+    h5_file_path = os.path.join(sample_dir, 'abundance.h5')
+
+    def read_h5_counts():
+        with h5py.File(h5_file_path, 'r') as h5_file:
+            h5_file['est_counts'][:]
+
+    def read_h5_ids():
+        with h5py.File(h5_file_path, 'r') as h5_file:
+            h5_file['aux/ids'][:]
+
+    return {
+        'abundance.tsv (pyarrow)': time_call(lambda: read_abundance_tsv(tsv_file), repeats),
+        'abundance.h5': time_call(lambda: read_abundance_h5(h5_file_path), repeats),
+        '  est_counts only': time_call(read_h5_counts, repeats),
+        '  aux/ids only': time_call(read_h5_ids, repeats),
+    }
+
+
+def time_merges(meta_path, kal_out_path, work_path, engines, workers=1):
+    """Whole-merge wall times of main() for each engine with --abundance_format tsv and h5."""
+    timings = {}
+    for engine in engines:
+        for abundance_format in ('tsv', 'h5'):
+            output_path = os.path.join(work_path, f'merge_{engine}_{abundance_format}')
+            shutil.rmtree(output_path, ignore_errors=True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings[(engine, abundance_format)] = time_call(lambda: kallisto_output_parser2.main(
+                    output_path, meta_path, [kal_out_path], engine, workers, abundance_format))
+            shutil.rmtree(output_path, ignore_errors=True)
+    return timings
+
+
+def main(n_targets, n_samples, engines, workers=1, work_path=None, seed=0):
+    tmp_dir = None
+    if work_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        work_path = tmp_dir.name
+    try:
+        kal_out_path = os.path.join(work_path, 'kallisto')
+        print(f"Writing {n_samples} synthetic samples with {n_targets} targets to {work_path}")
+        target_ids = write_kallisto_outputs(kal_out_path, n_targets, n_samples, seed)
+        meta_path = os.path.join(work_path, 'meta.csv')
+        pd.DataFrame({'target_id': target_ids}).to_csv(meta_path, index=False)
+
+        print("\nPer-file read time (best of 5):")
+        for name, seconds in time_file_reads(os.path.join(kal_out_path, 'Sample0')).items():
+            print(f"  {name:<26} {seconds * 1000:8.1f} ms")
+        if engines:
+            print(f"\nWhole merge of {n_samples} samples, {workers} worker(s):")
+            for (engine, abundance_format), seconds in time_merges(meta_path, kal_out_path, work_path, engines, workers).items():
+                print(f"  --engine {engine:<8} --abundance_format {abundance_format:<4} {seconds:8.2f} s")
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time reading kallisto abundance.tsv against abundance.h5 on synthetic samples.',
+                                     usage='python benchmark_abundance_read.py [--targets 200000] [--samples 20] [--engines chunked mmap]')
+    parser.add_argument('--targets', type=int, default=200000, help='(optional) Targets per sample. Default is 200000.')
+    parser.add_argument('--samples', type=int, default=20, help='(optional) Number of samples. Default is 20.')
+    parser.add_argument('--engines', nargs='*', choices=kallisto_output_parser2.ENGINES, default=list(kallisto_output_parser2.ENGINES),
+                        help='(optional) Engines to time whole merges with; none times only the per-file reads. Default is all.')
+    parser.add_argument('--workers', type=int, default=1, help='(optional) Worker processes for the merges. Default is 1.')
+    parser.add_argument('--work_path', type=str, default=None,
+                        help='(optional) Directory for the synthetic samples and outputs. Default is a temporary directory.')
+    parser.add_argument('--seed', type=int, default=0, help='(optional) Random seed of the synthetic counts. Default is 0.')
+
+    args = parser.parse_args()
+    main(args.targets, args.samples, args.engines, args.workers, args.work_path, args.seed)
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+# rows per Parquet row group when the matrix is written out of core
+WRITE_BLOCK_ROWS = 100000
+
+
+def fingerprint_target_ids(target_ids):
+    """
+    Order-sensitive 128-bit fingerprint of a target_id sequence, hashed from the Arrow
+    string buffers (value offsets and bytes) instead of comparing Python strings.
+    """
+    import pyarrow as pa
+
+    ids = pa.array(target_ids) if not isinstance(target_ids, (pa.Array, pa.ChunkedArray)) else target_ids
+    ids = ids.cast(pa.large_string())
+    if isinstance(ids, pa.ChunkedArray):
+        ids = ids.combine_chunks()
+    offsets = np.frombuffer(ids.buffers()[1], dtype=np.int64)[ids.offset:ids.offset + len(ids) + 1]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((offsets - offsets[0]).tobytes())
+    if len(ids):
+        digest.update(memoryview(ids.buffers()[2])[offsets[0]:offsets[-1]])
+    return digest.hexdigest()
+
+
+def validate_target_ids(n_targets, fingerprint, curr_target_ids, file_path):
+    """
+    Compare target_ids with the reference count and fingerprint. Returns the same warning
+    check_target_ids prints when they differ, else None.
+    """
+    if len(curr_target_ids) != n_targets:
+        return (f"WARNING: {file_path} has {len(curr_target_ids)} target_ids, "
+                f"expected {n_targets}. Skipping.")
+    if fingerprint_target_ids(curr_target_ids) != fingerprint:
+        return f"WARNING: {file_path} has different target_id order/values. Skipping."
+    return None
+
+
+# per-target abundance.tsv columns that can be merged
+ABUNDANCE_METRICS = ('est_counts', 'tpm', 'eff_length')
+# abundance.h5 datasets holding them; tpm is not stored and is derived from est_counts and eff_lengths
+H5_DATASETS = {'est_counts': 'est_counts', 'eff_length': 'aux/eff_lengths', 'length': 'aux/lengths'}
+
+
+def read_abundance_tsv(file_path, columns=('est_counts',)):
+    """
+    Read target_id (as an Arrow string array) and the value columns (float32) of an abundance.tsv
+    in one pass, parsing only these columns. Returns the target_ids and {column: values}.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    table = pa_csv.read_csv(
+        file_path,
+        parse_options=pa_csv.ParseOptions(delimiter='\t'),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=['target_id', *columns],
+            column_types={'target_id': pa.large_string(), **{column: pa.float64() for column in columns}})
+    )
+    # parsed as float64 and then cast, as pandas does for dtype float32
+    values = {column: table.column(column).to_numpy().astype(np.float32) for column in columns}
+    return table.column('target_id'), values
+
+
+def get_tpm(est_counts, eff_lengths):
+    """TPM as kallisto computes it: counts per effective length, scaled to sum to one million."""
+    rates = np.divide(est_counts, eff_lengths, out=np.zeros_like(est_counts), where=eff_lengths > 0)
+    total = rates.sum()
+    return rates * (1e6 / total) if total > 0 else rates
+
+
+def read_abundance_h5(file_path, columns=('est_counts',)):
+    """
+    Read target_id (as an Arrow string array) and the value columns (float32) of a kallisto
+    abundance.h5: the ids come from aux/ids and the values are read as binary arrays.
+    Returns the target_ids and {column: values}.
+    """
+    try:
+        import h5py
+    except ImportError as e:
+        raise ImportError("Reading abundance.h5 requires h5py (pip install h5py)") from e
+    import pyarrow as pa
+
+    unknown = [column for column in columns if column not in H5_DATASETS and column != 'tpm']
+    if unknown:
+        raise ValueError(f"abundance.h5 has no {unknown} values, expected {list(H5_DATASETS) + ['tpm']}")
+    with h5py.File(file_path, 'r') as h5_file:
+        ids = h5_file['aux/ids'][:]
+        needed = set(columns) - {'tpm'} | ({'est_counts', 'eff_length'} if 'tpm' in columns else set())
+        arrays = {column: h5_file[H5_DATASETS[column]][:].astype(np.float64) for column in needed}
+    if 'tpm' in columns:
+        arrays['tpm'] = get_tpm(arrays['est_counts'], arrays['eff_length'])
+    target_ids = pa.array(ids, type=pa.large_binary()).cast(pa.large_string())
+    return target_ids, {column: arrays[column].astype(np.float32) for column in columns}
+
+
+def read_abundance(file_path, columns=('est_counts',)):
+    """Read target_ids and the value columns from an abundance.h5 or abundance.tsv file."""
+    if file_path.endswith('.h5'):
+        return read_abundance_h5(file_path, columns)
+    return read_abundance_tsv(file_path, columns)
+
+
+def write_parquet_blocks(output_file, blocks):
+    """Write DataFrames with the same columns and index levels to one Parquet file, one row group each."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for block_df in blocks:
+            if writer is None:
+                table = pa.Table.from_pandas(block_df)
+                writer = pq.ParquetWriter(output_file, table.schema)
+            else:
+                table = pa.Table.from_pandas(block_df, schema=writer.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_metrics_parquet(output_file, matrices, target_ids, sample_ids, col_indices, block_rows=WRITE_BLOCK_ROWS):
+    """
+    Write several targets x samples matrices ({metric: MmapCountMatrix}) as one Parquet file,
+    stacked by rows under a (metric, target_id) index.
+    """
+    write_parquet_blocks(output_file, (
+        block_df for metric, matrix in matrices.items()
+        for block_df in matrix.iter_blocks(target_ids, sample_ids, col_indices, block_rows, metric)))
+
+
+class MmapCountMatrix:
+    """
+    Preallocated float32 targets x samples matrix backed by a memory-mapped file.
+    The file is column-major, so each sample's values are one contiguous block that is
+    written straight into its slot; only the pages being touched stay in memory.
+    """
+
+    def __init__(self, file_path, n_targets, n_samples, mode='w+'):
+        self.file_path = file_path
+        self.shape = (n_targets, n_samples)
+        self.data = np.memmap(file_path, dtype=np.float32, mode=mode, shape=self.shape, order='F')
+
+    def write_column(self, col_idx, values):
+        self.data[:, col_idx] = values
+
+    def flush(self):
+        self.data.flush()
+
+    def iter_blocks(self, target_ids, sample_ids, col_indices, block_rows=WRITE_BLOCK_ROWS, metric=None):
+        """
+        Yield the selected columns as DataFrames of block_rows targets, indexed by target_id
+        or, with metric, by (metric, target_id).
+        """
+        col_indices = np.asarray(col_indices, dtype=np.int64)
+        for start in range(0, self.shape[0], block_rows):
+            stop = min(start + block_rows, self.shape[0])
+            block = np.ascontiguousarray(self.data[start:stop][:, col_indices])
+            if metric is None:
+                index = pd.Index(target_ids[start:stop], name='target_id')
+            else:
+                index = pd.MultiIndex.from_arrays([np.full(stop - start, metric, dtype=object), target_ids[start:stop]],
+                                                  names=['metric', 'target_id'])
+            yield pd.DataFrame(block, columns=list(sample_ids), index=index)
+
+    def write_parquet(self, output_file, target_ids, sample_ids, col_indices, block_rows=WRITE_BLOCK_ROWS):
+        """
+        Write the selected columns as a Parquet file with a target_id index, one row group
+        per block of targets, so the full matrix is never held in memory.
+        """
+        write_parquet_blocks(output_file, self.iter_blocks(target_ids, sample_ids, col_indices, block_rows))
+
+    def close(self, remove=True):
+        self.data.flush()
+        del self.data
+        if remove:
+            os.remove(self.file_path)
@@ -0,0 +1,125 @@
+import json
+import os
+from itertools import zip_longest
+from datetime import datetime, timezone
+import pandas as pd
+from count_matrix import WRITE_BLOCK_ROWS
+
+STORE_MANIFEST = 'count_store.manifest'
+STORE_VERSION = 1
+
+
+class CountStore:
+    """
+    Appendable targets x samples count matrix kept as one Parquet file per ingested batch
+    (same target_id index and row order in every file) plus a JSON manifest with the
+    target_id fingerprint and the samples of each batch. Appending a batch never rewrites
+    the stored ones; the reader presents all batches as one matrix and only opens the
+    files and columns it needs.
+    """
+
+    def __init__(self, store_path, manifest):
+        self.store_path = store_path
+        self.manifest = manifest
+
+    @classmethod
+    def open(cls, store_path):
+        with open(os.path.join(store_path, STORE_MANIFEST), 'r') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported count store version {manifest.get('version')} in {store_path}")
+        return cls(store_path, manifest)
+
+    @classmethod
+    def open_or_create(cls, store_path, n_targets, fingerprint, metrics=('est_counts',)):
+        """Open the store, checking it holds the same targets, or create an empty one."""
+        if os.path.exists(os.path.join(store_path, STORE_MANIFEST)):
+            store = cls.open(store_path)
+            store.check_targets(n_targets, fingerprint, metrics)
+            return store
+        os.makedirs(store_path, exist_ok=True)
+        store = cls(store_path, {'version': STORE_VERSION, 'metrics': list(metrics), 'n_targets': n_targets,
+                                 'target_fingerprint': fingerprint, 'batches': []})
+        store.write_manifest()
+        return store
+
+    def check_targets(self, n_targets, fingerprint, metrics=('est_counts',)):
+        if self.manifest['n_targets'] != n_targets or self.manifest['target_fingerprint'] != fingerprint:
+            raise ValueError(f"target_ids do not match the count store {self.store_path} "
+                             f"({self.manifest['n_targets']} stored, {n_targets} given or different order/values)")
+        if self.metrics != list(metrics):
+            raise ValueError(f"Count store {self.store_path} holds {self.metrics}, not {list(metrics)}")
+
+    @property
+    def metrics(self):
+        return self.manifest['metrics']
+
+    @property
+    def batches(self):
+        return self.manifest['batches']
+
+    @property
+    def sample_ids(self):
+        return [sample_id for batch in self.batches for sample_id in batch['samples']]
+
+    @property
+    def shape(self):
+        return self.manifest['n_targets'], len(self.sample_ids)
+
+    def new_batch_file(self):
+        return os.path.join(self.store_path, f"batch_{len(self.batches):05d}.parquet")
+
+    def write_manifest(self):
+        manifest_path = os.path.join(self.store_path, STORE_MANIFEST)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.manifest, file)
+        os.replace(tmp_path, manifest_path)
+
+    def add_batch(self, batch_file, sample_ids):
+        """Register a written batch file; the manifest is replaced atomically."""
+        duplicates = set(sample_ids) & set(self.sample_ids)
+        if duplicates:
+            raise ValueError(f"Samples already in the count store: {sorted(duplicates)}")
+        self.batches.append({'file': os.path.basename(batch_file), 'samples': list(sample_ids),
+                             'created': datetime.now(timezone.utc).isoformat(timespec='seconds')})
+        self.write_manifest()
+
+    def read(self, sample_ids=None):
+        """
+        Read the given samples (all by default) as one DataFrame indexed by target_id,
+        or by (metric, target_id) for a store of several metrics.
+        """
+        wanted = self.sample_ids if sample_ids is None else list(sample_ids)
+        missing = set(wanted) - set(self.sample_ids)
+        if missing:
+            raise KeyError(f"Samples not in the count store: {sorted(missing)}")
+        wanted_set = set(wanted)
+        frames = []
+        for batch in self.batches:
+            columns = [sample_id for sample_id in batch['samples'] if sample_id in wanted_set]
+            if columns:
+                frames.append(pd.read_parquet(os.path.join(self.store_path, batch['file']), columns=columns))
+        if not frames:
+            return pd.DataFrame(columns=wanted)
+        return pd.concat(frames, axis=1)[wanted]
+
+    def iter_row_blocks(self, block_rows=WRITE_BLOCK_ROWS):
+        """Yield the full matrix as DataFrames of block_rows rows each, across all batches."""
+        import pyarrow.parquet as pq
+
+        index_names = ['metric', 'target_id'] if len(self.metrics) > 1 else ['target_id']
+        readers = [pq.ParquetFile(os.path.join(self.store_path, batch['file'])).iter_batches(
+                       block_rows, columns=batch['samples'] + (index_names if idx == 0 else []))
+                   for idx, batch in enumerate(self.batches)]
+        for record_batches in zip_longest(*readers):
+            # every batch file holds all rows, so the record batches line up unless a file is truncated
+            if any(record_batch is None or record_batch.num_rows != record_batches[0].num_rows
+                   for record_batch in record_batches):
+                raise ValueError(f"Batch files of the count store {self.store_path} have different numbers of rows")
+            block = {name: column for record_batch in record_batches
+                     for name, column in zip(record_batch.schema.names, record_batch.columns)}
+            index = pd.MultiIndex.from_arrays([block.pop(name).to_numpy(zero_copy_only=False) for name in index_names],
+                                              names=index_names)
+            yield pd.DataFrame({name: column.to_numpy() for name, column in block.items()},
+                               index=index if len(index_names) > 1 else index.get_level_values(0))
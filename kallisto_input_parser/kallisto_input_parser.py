@@ -1,9 +1,51 @@
 import os
+import numpy as np
 import pandas as pd
 import argparse
 import re
 
-def main(kal_out_path, meta_path, output_path):
+METRICS = ('est_counts', 'tpm', 'eff_length')
+
+def get_output_file_name(metrics):
+  if list(metrics) == ['est_counts']:
+    return 'kallisto_raw_counts_merged.csv'
+  if len(metrics) == 1:
+    return f'kallisto_{metrics[0]}_merged.csv'
+  return 'kallisto_metrics_merged.csv'
+
+def collect_abundance_files(kal_out_path):
+  abundance_files = []
+  for root, dirs, files in os.walk(kal_out_path):
+    if "abundance.tsv" in files:
+      file_basename = os.path.basename(root)
+      basespace_suffx = r"_S\d+$"
+      sample_id = re.sub(basespace_suffx, "", file_basename)
+      abundance_files.append((sample_id, os.path.join(root, "abundance.tsv")))
+  return abundance_files
+
+def get_sample_rows(target_index, curr_target_ids, file_path):
+  """
+  Map a sample's target_ids to rows of the target_id index (-1: not in the metadata) and
+  report the ids that do not line up with the metadata. Duplicated ids keep their first row.
+
+  Returns the rows and a mask of the sample's rows to use.
+  """
+  keep = ~curr_target_ids.duplicated()
+  rows = target_index.get_indexer(curr_target_ids.where(keep))
+  n_unknown = int((rows[keep.values] == -1).sum())
+  n_missing = len(target_index) - int(keep.sum()) + n_unknown
+  problems = []
+  if not keep.all():
+    problems.append(f"{int((~keep).sum())} duplicated target_ids (first kept)")
+  if n_unknown:
+    problems.append(f"{n_unknown} target_ids not in the metadata (ignored)")
+  if n_missing:
+    problems.append(f"{n_missing} metadata target_ids missing (left empty)")
+  if problems:
+    print(f"WARNING: {file_path}: {', '.join(problems)}")
+  return rows, keep.values & (rows != -1)
+
+def main(kal_out_path, meta_path, output_path, metrics=('est_counts',)):
   kal_out_path = os.path.abspath(kal_out_path)
   meta_path = os.path.abspath(meta_path)
   output_path = os.path.abspath(output_path)
@@ -14,35 +56,49 @@ def main(kal_out_path, meta_path, output_path):
     print(f"Error reading metadata file: {e}")
     return
 
-  df_list = []
-  for root, dirs, files in os.walk(kal_out_path):
-    if "abundance.tsv" in files:
-      file_path = os.path.join(root, "abundance.tsv")
-      try:
-        curr_df = pd.read_table(file_path, sep='\t', usecols=['target_id', 'est_counts'])
-      except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        continue
-      file_basename = os.path.basename(root)
-      basespace_suffx = r"_S\d+$"
-      sample_id = re.sub(basespace_suffx, "", file_basename)
-      curr_df.rename(columns={'est_counts': sample_id}, inplace=True)
-      df_list.append(curr_df)
+  # one row per distinct metadata target_id; duplicated metadata rows share their row's values
+  target_index = pd.Index(result_df['target_id'].unique())
+  meta_rows = target_index.get_indexer(result_df['target_id'])
 
-  if not df_list:
+  abundance_files = collect_abundance_files(kal_out_path)
+  if not abundance_files:
     print("No valid data files were found.")
     return
 
-  for df in df_list:
+  # every sample is written by position into its column of a preallocated matrix per metric
+  matrices = {metric: np.full((len(target_index), len(abundance_files)), np.nan, order='F') for metric in metrics}
+  sample_ids = []
+  for sample_id, file_path in abundance_files:
     try:
-      result_df = result_df.merge(df, on='target_id', how='left')
+      # all metrics in one pass over the file
+      curr_df = pd.read_table(file_path, sep='\t', usecols=['target_id', *metrics])
     except Exception as e:
-      print(f"Error merging dataframe with the following column names: {df.columns}")
+      print(f"Error reading file {file_path}: {e}")
       continue
+    rows, use = get_sample_rows(target_index, curr_df['target_id'], file_path)
+    col_idx = len(sample_ids)
+    for metric, matrix in matrices.items():
+      matrix[rows[use], col_idx] = curr_df[metric].values[use]
+    sample_ids.append(sample_id)
+
+  if not sample_ids:
+    print("No valid data files were found.")
+    return
+
+  metric_dfs = {}
+  for metric, matrix in matrices.items():
+    metric_df = pd.DataFrame(matrix[meta_rows, :len(sample_ids)], columns=sample_ids)
+    metric_df.insert(0, 'target_id', result_df['target_id'].values)
+    metric_dfs[metric] = metric_df
 
   os.makedirs(output_path, exist_ok=True)
 
-  result_df.to_csv(os.path.join(output_path, 'kallisto_raw_counts_merged.csv'), index=False)
+  if len(metric_dfs) == 1:
+    merged_df = metric_dfs[metrics[0]]
+  else:
+    # one table, the metrics stacked by rows with a leading metric column
+    merged_df = pd.concat(metric_dfs, names=['metric']).reset_index(level='metric')
+  merged_df.to_csv(os.path.join(output_path, get_output_file_name(metrics)), index=False)
   print("All done!")
     
 if __name__ == "__main__":
@@ -51,6 +107,9 @@ if __name__ == "__main__":
   parser.add_argument('kal_out_path', type=str, help='Absolute path to the kallisto output directories')
   parser.add_argument('meta_path', type=str, help='Path to the metadata file (CSV format). Must contain "target_id" column that references same peptide id as were provided to kallisto')
   parser.add_argument('output_path', type=str, help='Path where the merged output CSV will be saved')
+  parser.add_argument('--metrics', nargs='+', choices=METRICS, default=['est_counts'],
+                      help='Abundance columns to merge in one pass over each file; several metrics are written to '
+                           'kallisto_metrics_merged.csv, stacked by rows with a leading "metric" column')
   
   args = parser.parse_args()
-  main(args.kal_out_path, args.meta_path, args.output_path)
\ No newline at end of file
+  main(args.kal_out_path, args.meta_path, args.output_path, list(dict.fromkeys(args.metrics)))
\ No newline at end of file
@@ -2,6 +2,15 @@ import os
 import pandas as pd
 import argparse
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from count_matrix import (
+    ABUNDANCE_METRICS, MmapCountMatrix, fingerprint_target_ids, validate_target_ids, read_abundance,
+    write_metrics_parquet)
+from count_store import CountStore
+from sparse_matrix import SPARSE_FORMATS, SparseCountBuilder, get_nonzero
+
+ENGINES = ('chunked', 'mmap')
+ABUNDANCE_FORMATS = ('auto', 'h5', 'tsv')
 
 
 def check_target_ids(target_ids, curr_target_ids, file_path):
@@ -16,7 +25,271 @@ def check_target_ids(target_ids, curr_target_ids, file_path):
     return True
 
 
-def main(output_path, meta_path, kal_out_paths):
+def get_abundance_file(files, abundance_format='auto'):
+    """
+    Pick the abundance file of a kallisto output directory; 'auto' prefers abundance.tsv and falls
+    back to abundance.h5. Decoding the variable-length aux/ids strings makes an h5 read slower than
+    the TSV parse (see benchmark_abundance_read.py), so h5 is only read where the TSV is missing.
+    """
+    names = {'auto': ('abundance.tsv', 'abundance.h5'), 'h5': ('abundance.h5',), 'tsv': ('abundance.tsv',)}
+    for name in names[abundance_format]:
+        if name in files:
+            return name
+    return None
+
+
+def get_output_file(output_path, metrics, extension='parquet'):
+    if list(metrics) == ['est_counts']:
+        return os.path.join(output_path, f'kallisto_raw_counts_merged.{extension}')
+    if len(metrics) == 1:
+        return os.path.join(output_path, f'kallisto_{metrics[0]}_merged.{extension}')
+    return os.path.join(output_path, f'kallisto_metrics_merged.{extension}')
+
+
+def read_abundance_df(file_path, metrics=('est_counts',)):
+    """Read target_id and the metric columns of one sample as a DataFrame."""
+    if file_path.endswith('.h5'):
+        curr_target_ids, values = read_abundance(file_path, metrics)
+        return pd.DataFrame({'target_id': curr_target_ids.to_numpy(zero_copy_only=False), **values})
+    return pd.read_csv(
+        file_path,
+        sep='\t',
+        usecols=['target_id', *metrics],
+        dtype={'target_id': str, **{metric: 'float32' for metric in metrics}}
+    )
+
+
+def stack_metrics(frames):
+    """
+    A single metric stays a plain target_id-indexed matrix; several ({metric: DataFrame})
+    are stacked by rows under a (metric, target_id) index.
+    """
+    if len(frames) == 1:
+        return next(iter(frames.values()))
+    return pd.concat(frames, names=['metric'])
+
+
+def report_skipped_samples(skipped_samples):
+    if skipped_samples:
+        print(f"\nSkipped {len(skipped_samples)} samples:")
+        for s in skipped_samples:
+            print(f"  - {s}")
+    else:
+        print("All samples processed successfully.")
+
+
+_mmap_worker = {}
+
+
+def load_sample_columns(matrices, fingerprint, col_idx, file_path):
+    """
+    Parse one sample's metrics in a single pass into their matrix columns ({metric: MmapCountMatrix}).
+    Returns (ok, message).
+    """
+    try:
+        curr_target_ids, values = read_abundance(file_path, list(matrices))
+        n_targets = next(iter(matrices.values())).shape[0]
+        warning = validate_target_ids(n_targets, fingerprint, curr_target_ids, file_path)
+        if warning is not None:
+            return False, warning
+        for metric, matrix in matrices.items():
+            matrix.write_column(col_idx, values[metric])
+        return True, None
+    except Exception as e:
+        return False, f"Error reading file {file_path}: {e}"
+
+
+def init_mmap_worker(matrix_files, shape, fingerprint):
+    # every worker maps the shared matrix files once and writes only its assigned columns
+    _mmap_worker.update(matrices={metric: MmapCountMatrix(matrix_file, *shape, mode='r+')
+                                  for metric, matrix_file in matrix_files.items()},
+                        fingerprint=fingerprint)
+
+
+def load_sample_columns_worker(task):
+    col_idx, file_path = task
+    return load_sample_columns(_mmap_worker['matrices'], _mmap_worker['fingerprint'], col_idx, file_path)
+
+
+def merge_mmap(abundance_files, target_ids, output_path, output_file, workers=1, metrics=('est_counts',)):
+    """
+    Merge the metrics into preallocated float32 targets x samples memory-mapped matrices, one
+    per metric. Each sample is parsed once, validated by target_id fingerprint and written into
+    its column of every matrix; the matrices are then written to one Parquet file block by block
+    (stacked under a (metric, target_id) index for several metrics). With workers > 1 the files are
+    parsed by a process pool, each worker writing into the columns assigned to its samples;
+    columns and messages keep the input order. Returns the written and the skipped samples.
+    """
+    n_targets = len(target_ids)
+    fingerprint = fingerprint_target_ids(target_ids)
+    matrices = {}
+    sample_ids, col_indices, skipped_samples = [], [], []
+    executor = None
+    try:
+        for metric in metrics:
+            matrices[metric] = MmapCountMatrix(os.path.join(output_path, f'kallisto_{metric}_merged.f32.tmp'),
+                                               n_targets, len(abundance_files))
+        tasks = [(col_idx, file_path) for col_idx, (_, file_path) in enumerate(abundance_files)]
+        if workers > 1:
+            matrix_files = {}
+            for metric, matrix in matrices.items():
+                matrix.flush()
+                matrix_files[metric] = matrix.file_path
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_mmap_worker,
+                                           initargs=(matrix_files, (n_targets, len(abundance_files)), fingerprint))
+            results = executor.map(load_sample_columns_worker, tasks,
+                                   chunksize=max(1, len(tasks) // (workers * 8)))
+        else:
+            results = (load_sample_columns(matrices, fingerprint, col_idx, file_path) for col_idx, file_path in tasks)
+
+        for (col_idx, _), (sample_id, _), (ok, message) in zip(tasks, abundance_files, results):
+            if message is not None:
+                print(message)
+            if not ok:
+                skipped_samples.append(sample_id)
+                continue
+            sample_ids.append(sample_id)
+            col_indices.append(col_idx)
+
+        if not col_indices:
+            print("No valid data found. Exiting.")
+            return sample_ids, skipped_samples
+
+        for matrix in matrices.values():
+            matrix.flush()
+        print("Writing merged matrix...")
+        if len(matrices) == 1:
+            next(iter(matrices.values())).write_parquet(output_file, target_ids, sample_ids, col_indices)
+        else:
+            write_metrics_parquet(output_file, matrices, target_ids, sample_ids, col_indices)
+        print(f"All done! Output saved to {output_file}")
+        print(f"Final matrix shape: {n_targets} features x {len(col_indices)} samples"
+              + (f" x {len(matrices)} metrics ({', '.join(matrices)})" if len(matrices) > 1 else ''))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        for matrix in matrices.values():
+            matrix.close()
+    return sample_ids, skipped_samples
+
+
+_sparse_worker = {}
+
+
+def read_sample_nonzero(n_targets, fingerprint, metrics, file_path):
+    """
+    Parse one sample's metrics in a single pass and keep only its non-zero rows.
+    Returns (ok, message, rows, {metric: values}).
+    """
+    try:
+        curr_target_ids, values = read_abundance(file_path, metrics)
+        warning = validate_target_ids(n_targets, fingerprint, curr_target_ids, file_path)
+        if warning is not None:
+            return False, warning, None, None
+        rows, values = get_nonzero(values)
+        return True, None, rows, values
+    except Exception as e:
+        return False, f"Error reading file {file_path}: {e}", None, None
+
+
+def init_sparse_worker(n_targets, fingerprint, metrics):
+    _sparse_worker.update(n_targets=n_targets, fingerprint=fingerprint, metrics=metrics)
+
+
+def read_sample_nonzero_worker(file_path):
+    return read_sample_nonzero(_sparse_worker['n_targets'], _sparse_worker['fingerprint'],
+                               _sparse_worker['metrics'], file_path)
+
+
+def merge_sparse(abundance_files, target_ids, output_file, sparse_format='npz', workers=1, metrics=('est_counts',)):
+    """
+    Merge the metrics into sparse targets x samples matrices built column by column: each sample
+    is parsed once, validated by target_id fingerprint and only its non-zero rows are kept.
+    Written as CSC arrays with label vectors (.npz) or as a long non-zero table (Parquet).
+    Returns the skipped samples.
+    """
+    n_targets = len(target_ids)
+    fingerprint = fingerprint_target_ids(target_ids)
+    builder = SparseCountBuilder(n_targets, metrics)
+    skipped_samples = []
+    file_paths = [file_path for _, file_path in abundance_files]
+    executor = None
+    try:
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_sparse_worker,
+                                           initargs=(n_targets, fingerprint, list(metrics)))
+            results = executor.map(read_sample_nonzero_worker, file_paths,
+                                   chunksize=max(1, len(file_paths) // (workers * 8)))
+        else:
+            results = (read_sample_nonzero(n_targets, fingerprint, list(metrics), file_path) for file_path in file_paths)
+
+        for (sample_id, _), (ok, message, rows, values) in zip(abundance_files, results):
+            if message is not None:
+                print(message)
+            if not ok:
+                skipped_samples.append(sample_id)
+                continue
+            builder.add_column(sample_id, rows, values)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if not builder.sample_ids:
+        print("No valid data found. Exiting.")
+        return skipped_samples
+
+    print("Writing sparse merged matrix...")
+    if sparse_format == 'npz':
+        builder.save_npz(output_file, target_ids)
+    else:
+        builder.write_parquet(output_file, target_ids)
+    n_cells = n_targets * len(builder.sample_ids)
+    print(f"All done! Output saved to {output_file}")
+    print(f"Final matrix shape: {n_targets} features x {len(builder.sample_ids)} samples, "
+          f"{builder.nnz} non-zero ({builder.nnz / n_cells:.2%})")
+    return skipped_samples
+
+
+def append_to_store(abundance_files, target_ids, store_path, workers=1, metrics=('est_counts',)):
+    """
+    Merge only the samples not yet in the count store at store_path into a new batch file
+    and register it in the store manifest. The store's target_id fingerprint must match the
+    metadata; samples already stored (or given twice) are refused. Returns the skipped samples.
+    """
+    store = CountStore.open_or_create(store_path, len(target_ids), fingerprint_target_ids(target_ids), metrics)
+    stored_samples = set(store.sample_ids)
+    new_files, skipped_samples = [], []
+    for sample_id, file_path in abundance_files:
+        if sample_id in stored_samples:
+            print(f"WARNING: {sample_id} ({file_path}) is already in the count store. Skipping.")
+            skipped_samples.append(sample_id)
+            continue
+        stored_samples.add(sample_id)
+        new_files.append((sample_id, file_path))
+
+    if not new_files:
+        print("No new samples to add.")
+        return skipped_samples
+
+    batch_file = store.new_batch_file()
+    part_file = f"{batch_file}.part"
+    try:
+        sample_ids, skipped = merge_mmap(new_files, target_ids, store_path, part_file, workers, metrics)
+    except BaseException:
+        if os.path.exists(part_file):
+            os.remove(part_file)
+        raise
+    skipped_samples.extend(skipped)
+    if sample_ids:
+        os.replace(part_file, batch_file)
+        store.add_batch(batch_file, sample_ids)
+        print(f"Added {len(sample_ids)} samples as {os.path.basename(batch_file)}; "
+              f"count store now {store.shape[0]} features x {store.shape[1]} samples")
+    return skipped_samples
+
+
+def main(output_path, meta_path, kal_out_paths, engine='chunked', workers=1, abundance_format='auto', append=False,
+         metrics=('est_counts',), sparse_format=None):
     meta_path = os.path.abspath(meta_path)
     output_path = os.path.abspath(output_path)
 
@@ -34,14 +307,39 @@ def main(output_path, meta_path, kal_out_paths):
     for kal_out_path in kal_out_paths:
         kal_out_path = os.path.abspath(kal_out_path)
         for root, dirs, files in os.walk(kal_out_path):
-            if "abundance.tsv" in files:
+            abundance_file = get_abundance_file(files, abundance_format)
+            if abundance_file is not None:
                 sample_id = os.path.basename(root)
-                abundance_files.append((sample_id, os.path.join(root, "abundance.tsv")))
+                abundance_files.append((sample_id, os.path.join(root, abundance_file)))
 
-    print(f"Found {len(abundance_files)} samples")
+    n_h5 = sum(file_path.endswith('.h5') for _, file_path in abundance_files)
+    print(f"Found {len(abundance_files)} samples ({n_h5} abundance.h5, {len(abundance_files) - n_h5} abundance.tsv)")
+
+    if append:
+        try:
+            skipped_samples = append_to_store(abundance_files, target_ids, output_path, workers, metrics)
+        except ValueError as e:
+            print(f"Error appending to count store: {e}")
+            return
+        report_skipped_samples(skipped_samples)
+        return
 
     os.makedirs(output_path, exist_ok=True)
 
+    if sparse_format is not None:
+        output_file = get_output_file(output_path, metrics, 'npz' if sparse_format == 'npz' else 'sparse.parquet')
+        report_skipped_samples(merge_sparse(abundance_files, target_ids, output_file, sparse_format, workers, metrics))
+        return
+
+    output_file = get_output_file(output_path, metrics)
+
+    if workers > 1 and engine != 'mmap':
+        print(f"Parallel parsing writes into the shared mmap matrix, using --engine mmap with {workers} workers")
+        engine = 'mmap'
+    if engine == 'mmap':
+        report_skipped_samples(merge_mmap(abundance_files, target_ids, output_path, output_file, workers, metrics)[1])
+        return
+
     # process in chunks, save each chunk as parquet
     chunk_size = 100  # adjust based on available RAM
     chunks = [abundance_files[i:i+chunk_size] for i in range(0, len(abundance_files), chunk_size)]
@@ -51,44 +349,41 @@ def main(output_path, meta_path, kal_out_paths):
     for chunk_idx, chunk in enumerate(chunks):
         print(f"Processing chunk {chunk_idx+1}/{len(chunks)}")
 
-        series_list = []
+        series_lists = {metric: [] for metric in metrics}
 
         for sample_id, file_path in chunk:
             try:
-                curr_df = pd.read_csv(
-                    file_path,
-                    sep='\t',
-                    usecols=['target_id', 'est_counts'],
-                    dtype={'target_id': str, 'est_counts': 'float32'}
-                )
+                curr_df = read_abundance_df(file_path, metrics)
 
                 # check target_id order and values match reference
                 if not check_target_ids(target_ids, curr_df['target_id'].values, file_path):
                     skipped_samples.append(sample_id)
                     continue
 
-                # extract est_counts as series with target_id as index
-                s = curr_df.set_index('target_id')['est_counts'].rename(sample_id)
-                series_list.append(s)
+                # extract each metric as series with target_id as index
+                curr_df = curr_df.set_index('target_id')
+                for metric in metrics:
+                    series_lists[metric].append(curr_df[metric].rename(sample_id))
 
             except Exception as e:
                 print(f"Error reading file {file_path}: {e}")
                 skipped_samples.append(sample_id)
                 continue
 
-        if not series_list:
+        if not series_lists[metrics[0]]:
             print(f"No valid samples in chunk {chunk_idx+1}, skipping.")
             continue
 
-        # single concat per chunk
-        chunk_df = pd.concat(series_list, axis=1)
+        # single concat per chunk and metric
+        chunk_df = stack_metrics({metric: pd.concat(series_list, axis=1)
+                                  for metric, series_list in series_lists.items()})
 
         # save chunk to parquet
         chunk_file = os.path.join(output_path, f'chunk_{chunk_idx}.parquet')
         chunk_df.to_parquet(chunk_file)
         chunk_files.append(chunk_file)
 
-        del series_list, chunk_df
+        del series_lists, chunk_df
 
     if not chunk_files:
         print("No valid data found. Exiting.")
@@ -101,10 +396,10 @@ def main(output_path, meta_path, kal_out_paths):
         axis=1
     )
 
-    output_file = os.path.join(output_path, 'kallisto_raw_counts_merged.parquet')
     result_df.to_parquet(output_file)
     print(f"All done! Output saved to {output_file}")
-    print(f"Final matrix shape: {result_df.shape[0]} features x {result_df.shape[1]} samples")
+    print(f"Final matrix shape: {result_df.shape[0] // len(metrics)} features x {result_df.shape[1]} samples"
+          + (f" x {len(metrics)} metrics ({', '.join(metrics)})" if len(metrics) > 1 else ''))
 
     # cleanup chunk files
     for f in chunk_files:
@@ -112,12 +407,7 @@ def main(output_path, meta_path, kal_out_paths):
     print("Chunk files removed.")
 
     # report skipped samples
-    if skipped_samples:
-        print(f"\nSkipped {len(skipped_samples)} samples:")
-        for s in skipped_samples:
-            print(f"  - {s}")
-    else:
-        print("All samples processed successfully.")
+    report_skipped_samples(skipped_samples)
 
 
 if __name__ == "__main__":
@@ -128,6 +418,24 @@ if __name__ == "__main__":
     parser.add_argument('output_path', type=str, help='Path where the merged output CSV will be saved')
     parser.add_argument('meta_path', type=str, help='Path to the metadata file (CSV format)')
     parser.add_argument('kal_out_paths', type=str, nargs='+', help='Paths to the kallisto output directories')
+    parser.add_argument('--engine', choices=ENGINES, default='chunked',
+                        help='chunked: per-chunk DataFrames reassembled at the end; '
+                             'mmap: preallocated float32 memory-mapped matrix filled sample by sample and written out of core')
+
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes parsing abundance files in parallel (implies --engine mmap)')
+    parser.add_argument('--abundance_format', choices=ABUNDANCE_FORMATS, default='auto',
+                        help='auto: read abundance.tsv where present, else abundance.h5; h5/tsv: only that file type')
+    parser.add_argument('--append', action='store_true',
+                        help='Add only the new samples to a count store in output_path '
+                             '(one Parquet file per batch plus a manifest, read with count_store.CountStore)')
+    parser.add_argument('--metrics', nargs='+', choices=ABUNDANCE_METRICS, default=['est_counts'],
+                        help='Abundance columns to merge in one pass over each file; several metrics are written '
+                             'to kallisto_metrics_merged.parquet stacked under a (metric, target_id) index')
+    parser.add_argument('--sparse', choices=SPARSE_FORMATS, default=None,
+                        help='Write only the non-zero values, built sample by sample: npz (CSC arrays with target and '
+                             'sample labels, see sparse_matrix.load_sparse_counts) or parquet (one row per non-zero value)')
 
     args = parser.parse_args()
-    main(args.output_path, args.meta_path, args.kal_out_paths)
\ No newline at end of file
+    main(args.output_path, args.meta_path, args.kal_out_paths, args.engine, args.workers, args.abundance_format, args.append,
+         list(dict.fromkeys(args.metrics)), args.sparse)
\ No newline at end of file
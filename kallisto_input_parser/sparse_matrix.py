@@ -0,0 +1,122 @@
+import json
+import numpy as np
+
+SPARSE_FORMATS = ('npz', 'parquet')
+
+
+def get_nonzero(values):
+    """Rows where any metric is non-zero and their values ({metric: float32 array})."""
+    nonzero = np.zeros(len(next(iter(values.values()))), dtype=bool)
+    for metric_values in values.values():
+        nonzero |= metric_values != 0
+    rows = np.flatnonzero(nonzero).astype(np.int32)
+    return rows, {metric: metric_values[rows] for metric, metric_values in values.items()}
+
+
+class SparseCountBuilder:
+    """
+    Targets x samples matrices (one per metric) assembled column by column in CSC form.
+    Only the non-zero entries of each sample are kept, so memory and output size scale with
+    the number of non-zero counts; all metrics share the sparsity pattern (rows where any
+    metric is non-zero).
+    """
+
+    def __init__(self, n_targets, metrics=('est_counts',)):
+        self.n_targets = n_targets
+        self.metrics = list(metrics)
+        self.sample_ids = []
+        self.indptr = [0]
+        self.indices = []
+        self.data = {metric: [] for metric in self.metrics}
+
+    @property
+    def nnz(self):
+        return self.indptr[-1]
+
+    def add_column(self, sample_id, rows, values):
+        """Append one sample given its non-zero rows and their values ({metric: array})."""
+        self.sample_ids.append(sample_id)
+        self.indices.append(np.asarray(rows, dtype=np.int32))
+        for metric in self.metrics:
+            self.data[metric].append(np.asarray(values[metric], dtype=np.float32))
+        self.indptr.append(self.indptr[-1] + len(rows))
+
+    def get_arrays(self):
+        indices = np.concatenate(self.indices) if self.indices else np.zeros(0, dtype=np.int32)
+        data = {metric: np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.float32)
+                for metric, arrays in self.data.items()}
+        return np.asarray(self.indptr, dtype=np.int64), indices, data
+
+    def save_npz(self, output_file, target_ids):
+        """
+        Save CSC components (indptr, indices and one data array per metric) with the target
+        and sample label vectors; load_sparse_counts turns them back into scipy matrices.
+        """
+        indptr, indices, data = self.get_arrays()
+        np.savez_compressed(
+            output_file, shape=np.array([self.n_targets, len(self.sample_ids)]), indptr=indptr, indices=indices,
+            metrics=np.array(self.metrics), target_ids=np.asarray(target_ids, dtype=str),
+            sample_ids=np.array(self.sample_ids, dtype=str), **{f'data_{metric}': data[metric] for metric in self.metrics})
+
+    def write_parquet(self, output_file, target_ids):
+        """
+        Write a long (COO) table with target_id, sample_id and one column per metric, one row
+        per non-zero entry. target_id and sample_id are dictionary columns whose dictionaries are
+        the full label vectors, so all-zero targets and samples survive the round trip.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        indptr, indices, data = self.get_arrays()
+        target_ids = pa.array(np.asarray(target_ids, dtype=object), type=pa.string())
+        sample_idx = np.repeat(np.arange(len(self.sample_ids), dtype=np.int32), np.diff(indptr))
+        table = pa.table({
+            'target_id': pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), target_ids),
+            'sample_id': pa.DictionaryArray.from_arrays(pa.array(sample_idx, type=pa.int32()),
+                                                        pa.array(self.sample_ids, type=pa.string())),
+            **{metric: pa.array(data[metric]) for metric in self.metrics}
+        })
+        if not len(indices):
+            # the dictionaries are stored in the row groups and an empty table has none
+            table = table.replace_schema_metadata({
+                'target_ids': json.dumps(target_ids.to_pylist()), 'sample_ids': json.dumps(self.sample_ids)})
+        pq.write_table(table, output_file, compression='zstd')
+
+
+def load_sparse_counts(file_path):
+    """
+    Load a sparse merge written as .npz or Parquet.
+
+    Returns ({metric: scipy.sparse.csc_matrix of shape targets x samples}, target_ids, sample_ids).
+    """
+    try:
+        from scipy import sparse
+    except ImportError as e:
+        raise ImportError("Loading sparse count matrices requires scipy (pip install scipy)") from e
+
+    if file_path.endswith('.npz'):
+        with np.load(file_path) as npz:
+            shape = tuple(npz['shape'])
+            matrices = {metric: sparse.csc_matrix((npz[f'data_{metric}'], npz['indices'], npz['indptr']), shape=shape)
+                        for metric in npz['metrics']}
+            return matrices, npz['target_ids'], npz['sample_ids']
+
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(file_path).unify_dictionaries()
+    labels, positions = {}, {}
+    for name in ('target_id', 'sample_id'):
+        chunks = [chunk for chunk in table.column(name).chunks if len(chunk)]
+        if not chunks:
+            labels[name] = np.array(json.loads(table.schema.metadata[f'{name}s'.encode()]), dtype=object)
+            positions[name] = np.zeros(0, dtype=np.int32)
+            continue
+        # all row groups carry the full label dictionary, so the indices are label positions
+        labels[name] = chunks[0].dictionary.to_numpy(zero_copy_only=False)
+        positions[name] = np.concatenate([chunk.indices.to_numpy() for chunk in chunks])
+    metrics = [name for name in table.column_names if name not in ('target_id', 'sample_id')]
+    shape = (len(labels['target_id']), len(labels['sample_id']))
+    matrices = {metric: sparse.coo_matrix((table.column(metric).to_numpy(), (positions['target_id'], positions['sample_id'])),
+                                          shape=shape).tocsc()
+                for metric in metrics}
+    return matrices, labels['target_id'], labels['sample_id']
@@ -0,0 +1,94 @@
+import unittest
+import sys
+import os
+import tempfile
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from count_matrix import read_abundance, read_abundance_h5, read_abundance_tsv, get_tpm
+from kallisto_output_parser2 import get_abundance_file, merge_mmap
+
+TARGET_IDS = np.array([f'ENST{idx:05d}.{idx % 3 + 1}' for idx in range(9)], dtype=object)
+
+
+def write_abundance(sample_dir, est_counts, eff_lengths, lengths):
+    """Write a kallisto-style abundance.tsv and abundance.h5 of one sample."""
+    import h5py
+
+    rates = est_counts / eff_lengths
+    pd.DataFrame({'target_id': TARGET_IDS, 'length': lengths, 'eff_length': eff_lengths, 'est_counts': est_counts,
+                  'tpm': rates * (1e6 / rates.sum())}).to_csv(
+        os.path.join(sample_dir, 'abundance.tsv'), sep='\t', index=False, float_format='%g')
+    with h5py.File(os.path.join(sample_dir, 'abundance.h5'), 'w') as h5_file:
+        aux = h5_file.create_group('aux')
+        aux.create_dataset('ids', data=TARGET_IDS, dtype=h5py.string_dtype('ascii'), compression='gzip')
+        aux.create_dataset('lengths', data=lengths, compression='gzip')
+        aux.create_dataset('eff_lengths', data=eff_lengths, compression='gzip')
+        h5_file.create_dataset('est_counts', data=est_counts, compression='gzip')
+
+
+class TestAbundanceReaders(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sample_dir = self.tmp_dir.name
+        lengths = np.array([1200, 800, 450, 3000, 150, 900, 2200, 600, 1000], dtype=np.int32)
+        self.eff_lengths = np.array([1021.5, 621.25, 271.0, 2821.75, 1.0, 721.5, 2021.0, 421.125, 821.0])
+        self.est_counts = np.array([10.0, 0.0, 3.5, 1234.25, 0.0, 17.0, 0.5, 88.0, 2.0])
+        write_abundance(self.sample_dir, self.est_counts, self.eff_lengths, lengths)
+        self.tsv_file = os.path.join(self.sample_dir, 'abundance.tsv')
+        self.h5_file = os.path.join(self.sample_dir, 'abundance.h5')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_h5_matches_tsv(self):
+        metrics = ['est_counts', 'tpm', 'eff_length']
+        h5_ids, h5_values = read_abundance_h5(self.h5_file, metrics)
+        tsv_ids, tsv_values = read_abundance_tsv(self.tsv_file, metrics)
+        self.assertEqual(h5_ids.to_pylist(), tsv_ids.to_pylist())
+        self.assertEqual(h5_ids.to_pylist(), TARGET_IDS.tolist())
+        for metric in metrics:
+            self.assertEqual(h5_values[metric].dtype, np.float32)
+            # the TSV holds printed values (6 significant digits)
+            np.testing.assert_allclose(h5_values[metric], tsv_values[metric], rtol=1e-5)
+        np.testing.assert_array_equal(h5_values['est_counts'], self.est_counts.astype(np.float32))
+
+    def test_tpm_derivation(self):
+        tpm = get_tpm(self.est_counts, self.eff_lengths)
+        self.assertAlmostEqual(tpm.sum(), 1e6, places=3)
+        self.assertEqual(tpm[1], 0.0)
+        np.testing.assert_allclose(tpm[3] / tpm[0], (1234.25 / 2821.75) / (10.0 / 1021.5))
+        np.testing.assert_array_equal(get_tpm(np.zeros(3), np.ones(3)), np.zeros(3))
+        np.testing.assert_array_equal(get_tpm(np.array([1.0, 2.0]), np.array([0.0, 2.0])), np.array([0.0, 1e6]))
+
+    def test_read_abundance_dispatch(self):
+        _, h5_values = read_abundance(self.h5_file, ['est_counts'])
+        _, tsv_values = read_abundance(self.tsv_file, ['est_counts'])
+        np.testing.assert_allclose(h5_values['est_counts'], tsv_values['est_counts'], rtol=1e-5)
+        with self.assertRaises(ValueError):
+            read_abundance_h5(self.h5_file, ['length_ratio'])
+
+    def test_merge_from_h5_matches_tsv(self):
+        frames = {}
+        for extension in ('h5', 'tsv'):
+            output_file = os.path.join(self.tmp_dir.name, f'merged_{extension}.parquet')
+            with contextlib.redirect_stdout(io.StringIO()):
+                merge_mmap([('S1', os.path.join(self.sample_dir, f'abundance.{extension}'))], TARGET_IDS,
+                           self.tmp_dir.name, output_file, metrics=['est_counts', 'tpm'])
+            frames[extension] = pd.read_parquet(output_file)
+        pd.testing.assert_frame_equal(frames['h5'], frames['tsv'], rtol=1e-5)
+
+    def test_get_abundance_file(self):
+        files = ['abundance.h5', 'abundance.tsv', 'run_info.json']
+        self.assertEqual(get_abundance_file(files), 'abundance.tsv')
+        self.assertEqual(get_abundance_file(['abundance.h5']), 'abundance.h5')
+        self.assertEqual(get_abundance_file(files, 'h5'), 'abundance.h5')
+        self.assertIsNone(get_abundance_file(['abundance.tsv'], 'h5'))
+        self.assertIsNone(get_abundance_file(['run_info.json']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import sys
+import os
+import tempfile
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from count_matrix import fingerprint_target_ids
+from count_store import CountStore
+from kallisto_output_parser2 import append_to_store, merge_mmap
+
+TARGET_IDS = np.array([f'ENST{idx:05d}' for idx in range(11)])
+METRICS = ['est_counts', 'tpm']
+
+
+class TestCountStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tmp_dir.name, 'store')
+        rng = np.random.default_rng(0)
+        self.abundance_files = []
+        for sample_idx in range(5):
+            sample_id = f'Sample{sample_idx}'
+            sample_dir = os.path.join(self.tmp_dir.name, 'kal', sample_id)
+            os.makedirs(sample_dir)
+            pd.DataFrame({
+                'target_id': TARGET_IDS, 'length': 1000, 'eff_length': 850.0,
+                'est_counts': rng.integers(0, 50, len(TARGET_IDS)).astype(float),
+                'tpm': rng.random(len(TARGET_IDS)).round(3),
+            }).to_csv(os.path.join(sample_dir, 'abundance.tsv'), sep='\t', index=False)
+            self.abundance_files.append((sample_id, os.path.join(sample_dir, 'abundance.tsv')))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def append(self, abundance_files, metrics=METRICS, target_ids=TARGET_IDS):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return append_to_store(abundance_files, target_ids, self.store_path, metrics=metrics)
+
+    def dense_merge(self, metrics=METRICS):
+        output_file = os.path.join(self.tmp_dir.name, 'dense.parquet')
+        with contextlib.redirect_stdout(io.StringIO()):
+            merge_mmap(self.abundance_files, TARGET_IDS, self.tmp_dir.name, output_file, metrics=metrics)
+        return pd.read_parquet(output_file)
+
+    def test_read_matches_dense_merge(self):
+        self.append(self.abundance_files[:2])
+        self.append(self.abundance_files[2:])
+        store = CountStore.open(self.store_path)
+        self.assertEqual(len(store.batches), 2)
+        self.assertEqual(store.shape, (len(TARGET_IDS), 5))
+        pd.testing.assert_frame_equal(store.read(), self.dense_merge())
+
+    def test_read_subset(self):
+        self.append(self.abundance_files[:3])
+        self.append(self.abundance_files[3:])
+        store = CountStore.open(self.store_path)
+        wanted = ['Sample4', 'Sample1']
+        pd.testing.assert_frame_equal(store.read(wanted), self.dense_merge()[wanted])
+        with self.assertRaises(KeyError):
+            store.read(['Sample9'])
+
+    def test_iter_row_blocks_matches_dense_merge(self):
+        self.append(self.abundance_files[:2])
+        self.append(self.abundance_files[2:])
+        store = CountStore.open(self.store_path)
+        blocks = list(store.iter_row_blocks(block_rows=4))
+        self.assertEqual([len(block) for block in blocks], [4, 4, 4, 4, 4, 2])
+        pd.testing.assert_frame_equal(pd.concat(blocks), self.dense_merge())
+
+    def test_iter_row_blocks_with_different_row_groups(self):
+        self.append(self.abundance_files[:2], metrics=['est_counts'])
+        self.append(self.abundance_files[2:], metrics=['est_counts'])
+        store = CountStore.open(self.store_path)
+        # rewrite the second batch with row groups that do not line up with the first one
+        batch_file = os.path.join(self.store_path, store.batches[1]['file'])
+        pd.read_parquet(batch_file).to_parquet(batch_file, row_group_size=3)
+        blocks = list(store.iter_row_blocks(block_rows=4))
+        self.assertEqual([len(block) for block in blocks], [4, 4, 3])
+        pd.testing.assert_frame_equal(pd.concat(blocks), self.dense_merge(metrics=['est_counts']))
+
+    def test_iter_row_blocks_truncated_batch(self):
+        self.append(self.abundance_files[:2], metrics=['est_counts'])
+        self.append(self.abundance_files[2:], metrics=['est_counts'])
+        store = CountStore.open(self.store_path)
+        batch_file = os.path.join(self.store_path, store.batches[1]['file'])
+        pd.read_parquet(batch_file).iloc[:-1].to_parquet(batch_file)
+        with self.assertRaises(ValueError):
+            list(store.iter_row_blocks(block_rows=4))
+
+    def test_duplicate_samples_refused(self):
+        self.append(self.abundance_files[:2])
+        skipped = self.append(self.abundance_files[1:3])
+        self.assertEqual(skipped, ['Sample1'])
+        store = CountStore.open(self.store_path)
+        self.assertEqual(store.sample_ids, ['Sample0', 'Sample1', 'Sample2'])
+        with self.assertRaises(ValueError):
+            store.add_batch(store.new_batch_file(), ['Sample2'])
+        self.assertEqual(len(CountStore.open(self.store_path).batches), 2)
+
+    def test_target_mismatch(self):
+        self.append(self.abundance_files[:2])
+        with self.assertRaises(ValueError):
+            self.append(self.abundance_files[2:], target_ids=TARGET_IDS[::-1])
+        with self.assertRaises(ValueError):
+            self.append(self.abundance_files[2:], target_ids=TARGET_IDS[:-1])
+        with self.assertRaises(ValueError):
+            CountStore.open_or_create(self.store_path, len(TARGET_IDS), fingerprint_target_ids(TARGET_IDS), ['est_counts'])
+        self.assertEqual(CountStore.open(self.store_path).sample_ids, ['Sample0', 'Sample1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+import tempfile
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from count_matrix import fingerprint_target_ids, validate_target_ids
+import kallisto_output_parser2
+
+TARGET_IDS = np.array([f'ENST{idx:05d}' for idx in range(13)])
+SAMPLE_IDS = ['Sample0', 'Sample1', 'Sample2']
+
+
+class TestMergeEngines(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kal_out_path = os.path.join(self.tmp_dir.name, 'kal')
+        self.meta_path = os.path.join(self.tmp_dir.name, 'meta.csv')
+        pd.DataFrame({'target_id': TARGET_IDS}).to_csv(self.meta_path, index=False)
+        rng = np.random.default_rng(0)
+        for sample_id in SAMPLE_IDS:
+            self.write_sample(sample_id, TARGET_IDS, rng)
+        # same targets in another order: skipped by every engine
+        self.write_sample('Reordered', TARGET_IDS[::-1], rng)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_sample(self, sample_id, target_ids, rng):
+        sample_dir = os.path.join(self.kal_out_path, sample_id)
+        os.makedirs(sample_dir)
+        est_counts = np.where(rng.random(len(target_ids)) < 0.5, rng.integers(1, 500, len(target_ids)), 0).astype(float)
+        eff_lengths = rng.integers(100, 2000, len(target_ids)).astype(float)
+        rates = est_counts / eff_lengths
+        pd.DataFrame({'target_id': target_ids, 'length': 2000, 'eff_length': eff_lengths, 'est_counts': est_counts,
+                      'tpm': (rates * (1e6 / rates.sum())).round(3)}).to_csv(
+            os.path.join(sample_dir, 'abundance.tsv'), sep='\t', index=False)
+
+    def merge(self, name, **kwargs):
+        output_path = os.path.join(self.tmp_dir.name, name)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            kallisto_output_parser2.main(output_path, self.meta_path, [self.kal_out_path], **kwargs)
+        self.assertIn('Reordered', output.getvalue())
+        metrics = kwargs.get('metrics', ('est_counts',))
+        return pd.read_parquet(kallisto_output_parser2.get_output_file(output_path, metrics))
+
+    def test_chunked_matches_mmap(self):
+        chunked = self.merge('chunked', engine='chunked')
+        mmap = self.merge('mmap', engine='mmap')
+        self.assertEqual(sorted(chunked.columns), SAMPLE_IDS)
+        self.assertEqual(list(chunked.index), list(TARGET_IDS))
+        pd.testing.assert_frame_equal(chunked, mmap)
+        pd.testing.assert_frame_equal(chunked, self.merge('mmap_workers', engine='mmap', workers=2))
+
+    def test_multi_metric_matches_single_metric_runs(self):
+        metrics = ['est_counts', 'tpm', 'eff_length']
+        for engine in kallisto_output_parser2.ENGINES:
+            with self.subTest(engine=engine):
+                stacked = self.merge(f'{engine}_metrics', engine=engine, metrics=metrics)
+                self.assertEqual(list(stacked.index.names), ['metric', 'target_id'])
+                self.assertEqual(list(stacked.index.get_level_values('metric').unique()), metrics)
+                for metric in metrics:
+                    single = self.merge(f'{engine}_{metric}', engine=engine, metrics=[metric])
+                    pd.testing.assert_frame_equal(stacked.loc[metric], single)
+
+    def test_validate_target_ids(self):
+        n_targets, fingerprint = len(TARGET_IDS), fingerprint_target_ids(TARGET_IDS)
+        self.assertIsNone(validate_target_ids(n_targets, fingerprint, TARGET_IDS.copy(), 'same.tsv'))
+        warning = validate_target_ids(n_targets, fingerprint, TARGET_IDS[::-1], 'reordered.tsv')
+        self.assertIn('reordered.tsv has different target_id order/values', warning)
+        renamed = TARGET_IDS.copy()
+        renamed[5] = 'ENST99999'
+        self.assertIn('different target_id', validate_target_ids(n_targets, fingerprint, renamed, 'renamed.tsv'))
+        self.assertIn('has 12 target_ids, expected 13', validate_target_ids(n_targets, fingerprint, TARGET_IDS[:-1], 'short.tsv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import importlib.util
+import sys
+import os
+import tempfile
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sparse_matrix import SparseCountBuilder, get_nonzero, load_sparse_counts
+from kallisto_output_parser2 import merge_mmap, merge_sparse
+
+TARGET_IDS = np.array([f'ENST{idx:05d}' for idx in range(7)])
+METRICS = ['est_counts', 'tpm']
+
+
+@unittest.skipUnless(importlib.util.find_spec('scipy'), 'scipy not installed')
+class TestSparseMatrix(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # targets x samples; targets 1 and 4 and sample 'Empty' are all zero, target 5 is only non-zero in tpm
+        est_counts = np.array([[3, 0, 1], [0, 0, 0], [7.5, 0, 0], [0, 0, 2], [0, 0, 0], [0, 0, 0], [1, 0, 4]], dtype=np.float32)
+        tpm = est_counts * 10
+        tpm[5, 2] = 0.25
+        self.sample_ids = ['Sample0', 'Empty', 'Sample2']
+        self.dense = {'est_counts': est_counts, 'tpm': tpm}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def build(self, sample_ids=None):
+        builder = SparseCountBuilder(len(TARGET_IDS), METRICS)
+        for col_idx, sample_id in enumerate(sample_ids or self.sample_ids):
+            rows, values = get_nonzero({metric: matrix[:, col_idx] for metric, matrix in self.dense.items()})
+            builder.add_column(sample_id, rows, values)
+        return builder
+
+    def assert_round_trip(self, output_file, sample_ids):
+        matrices, target_ids, loaded_sample_ids = load_sparse_counts(output_file)
+        self.assertEqual(list(target_ids), list(TARGET_IDS))
+        self.assertEqual(list(loaded_sample_ids), sample_ids)
+        self.assertEqual(list(matrices), METRICS)
+        for metric in METRICS:
+            self.assertEqual(matrices[metric].format, 'csc')
+            self.assertEqual(matrices[metric].shape, (len(TARGET_IDS), len(sample_ids)))
+            np.testing.assert_array_equal(matrices[metric].toarray(), self.dense[metric][:, :len(sample_ids)])
+
+    def test_get_nonzero(self):
+        rows, values = get_nonzero({metric: matrix[:, 2] for metric, matrix in self.dense.items()})
+        self.assertEqual(rows.tolist(), [0, 3, 5, 6])
+        self.assertEqual(values['est_counts'].tolist(), [1, 2, 0, 4])
+        self.assertEqual(values['tpm'].tolist(), [10, 20, 0.25, 40])
+
+    def test_npz_round_trip(self):
+        builder = self.build()
+        self.assertEqual(builder.nnz, 7)
+        output_file = os.path.join(self.tmp_dir.name, 'counts.npz')
+        builder.save_npz(output_file, TARGET_IDS)
+        self.assert_round_trip(output_file, self.sample_ids)
+
+    def test_parquet_round_trip(self):
+        output_file = os.path.join(self.tmp_dir.name, 'counts.sparse.parquet')
+        self.build().write_parquet(output_file, TARGET_IDS)
+        self.assert_round_trip(output_file, self.sample_ids)
+
+    def test_all_zero_round_trip(self):
+        self.dense = {metric: matrix[:, [1]] for metric, matrix in self.dense.items()}
+        for output_file in ('empty.npz', 'empty.sparse.parquet'):
+            with self.subTest(output_file=output_file):
+                output_file = os.path.join(self.tmp_dir.name, output_file)
+                builder = self.build(['Empty'])
+                self.assertEqual(builder.nnz, 0)
+                if output_file.endswith('.npz'):
+                    builder.save_npz(output_file, TARGET_IDS)
+                else:
+                    builder.write_parquet(output_file, TARGET_IDS)
+                self.assert_round_trip(output_file, ['Empty'])
+
+    def test_merge_sparse_matches_dense_merge(self):
+        abundance_files = []
+        for col_idx, sample_id in enumerate(self.sample_ids):
+            sample_dir = os.path.join(self.tmp_dir.name, 'kal', sample_id)
+            os.makedirs(sample_dir)
+            pd.DataFrame({'target_id': TARGET_IDS, 'length': 1000, 'eff_length': 850.0,
+                          **{metric: matrix[:, col_idx] for metric, matrix in self.dense.items()}}).to_csv(
+                os.path.join(sample_dir, 'abundance.tsv'), sep='\t', index=False)
+            abundance_files.append((sample_id, os.path.join(sample_dir, 'abundance.tsv')))
+        dense_file = os.path.join(self.tmp_dir.name, 'dense.parquet')
+        with contextlib.redirect_stdout(io.StringIO()):
+            merge_mmap(abundance_files, TARGET_IDS, self.tmp_dir.name, dense_file, metrics=METRICS)
+        dense = pd.read_parquet(dense_file)
+        for sparse_format, output_file in (('npz', 'merged.npz'), ('parquet', 'merged.sparse.parquet')):
+            with self.subTest(sparse_format=sparse_format):
+                output_file = os.path.join(self.tmp_dir.name, output_file)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    merge_sparse(abundance_files, TARGET_IDS, output_file, sparse_format, metrics=METRICS)
+                matrices, target_ids, sample_ids = load_sparse_counts(output_file)
+                for metric in METRICS:
+                    pd.testing.assert_frame_equal(
+                        pd.DataFrame(matrices[metric].toarray(), index=pd.Index(target_ids, name='target_id'),
+                                     columns=list(sample_ids)),
+                        dense.loc[metric])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+import numpy as np
+import json
+import argparse
+import os
+import shutil
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# residues a k-mer may contain, 5 bits each (code = position in the alphabet + 1), so k <= 12 fits an uint64;
+# case-sensitive like the JSONL k-mer db: k-mers with lowercase residues are kept only in the JSONL db,
+# under their peptide, and are skipped by the index
+ALPHABET = 'ACDEFGHIKLMNPQRSTVWYBJOUXZ*'
+BITS_PER_RESIDUE = 5
+MAX_KMER_LEN = 64 // BITS_PER_RESIDUE
+INDEX_VERSION = 1
+INDEX_META = 'index.json'
+INDEX_ARRAYS = ('kmers', 'offsets', 'peptides', 'peptide_name_offsets', 'peptide_names')
+
+RESIDUE_CODES = np.zeros(256, dtype=np.uint64)
+RESIDUE_CODES[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(1, len(ALPHABET) + 1, dtype=np.uint64)
+
+
+def check_kmer_len(kmer_len):
+    if not 1 <= kmer_len <= MAX_KMER_LEN:
+        raise ValueError(f'k-mer length must be between 1 and {MAX_KMER_LEN} for the binary index, got {kmer_len}')
+
+
+def get_residue_codes(seq):
+    """Residue codes of a sequence; 0 for residues outside the alphabet."""
+    return RESIDUE_CODES[np.frombuffer(seq.encode('ascii', errors='replace'), dtype=np.uint8)]
+
+
+def pack_kmer_codes(residues, kmer_len):
+    """
+    Integer codes of all kmer_len windows of a residue code array, packed BITS_PER_RESIDUE bits
+    per residue. This is the only k-mer encoding: the index is built and queried with it.
+    """
+    n_windows = len(residues) - kmer_len + 1
+    if n_windows <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    codes = np.zeros(n_windows, dtype=np.uint64)
+    for offset in range(kmer_len):
+        codes <<= np.uint64(BITS_PER_RESIDUE)
+        codes |= residues[offset:offset + n_windows]
+    return codes
+
+
+def encode_kmers(kmers, kmer_len):
+    """Integer codes of a batch of k-mers; raises ValueError for a wrong length or residues outside the alphabet."""
+    for kmer in kmers:
+        if len(kmer) != kmer_len:
+            raise ValueError(f'k-mer {kmer} has length {len(kmer)}, the index holds {kmer_len}-mers')
+    residues = get_residue_codes(''.join(kmers))
+    invalid = np.flatnonzero(~residues.reshape(len(kmers), kmer_len).all(axis=1))
+    if len(invalid):
+        raise ValueError(f'k-mer {kmers[invalid[0]]} contains residues outside {ALPHABET}')
+    # the k-mers are back to back, so each one is the window starting at its offset
+    return pack_kmer_codes(residues, kmer_len)[::kmer_len]
+
+
+def get_peptide_kmer_codes(peptide_seqs, kmer_len):
+    """
+    Integer codes of all k-mer windows of all peptides in one vectorized pass over the
+    concatenated sequences. Windows that cross a peptide boundary or contain a residue
+    outside the alphabet are dropped.
+
+    Returns the k-mer codes, the peptide index of each code and the number of dropped windows.
+    """
+    seqs = [str(seq) for seq in peptide_seqs]
+    lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+    residues = get_residue_codes(''.join(seqs))
+    peptide_of = np.repeat(np.arange(len(seqs), dtype=np.int64), lengths)
+    codes = pack_kmer_codes(residues, kmer_len)
+    n_windows = len(codes)
+    if n_windows == 0:
+        return codes, np.zeros(0, dtype=np.int64), 0
+
+    n_invalid = np.concatenate(([0], np.cumsum(residues == 0)))
+    in_peptide = peptide_of[:n_windows] == peptide_of[kmer_len - 1:]
+    valid = n_invalid[kmer_len:] == n_invalid[:n_windows]
+    n_dropped = int((in_peptide & ~valid).sum())
+    keep = in_peptide & valid
+    return codes[keep], peptide_of[:n_windows][keep], n_dropped
+
+
+def build_kmer_index(index_path, peptide_ids, peptide_seqs, kmer_len):
+    """
+    Build the binary inverted k-mer index of a peptide library in index_path:
+    sorted unique k-mer codes (kmers.npy, uint64), offsets into the peptide array
+    (offsets.npy, uint32 or uint64, one more than k-mers) and the peptides of each k-mer
+    (peptides.npy, sorted peptide numbers in the smallest unsigned dtype), plus the
+    peptide ids as offsets and UTF-8 bytes. All arrays are .npy files that KmerIndex
+    memory-maps. The index is written to a temporary directory and moved into place.
+    K-mers with residues outside ALPHABET, such as lowercase ones, are skipped: the JSONL
+    db keeps them under their peptide, the index does not.
+    """
+    check_kmer_len(kmer_len)
+    codes, peptide_idx, n_dropped = get_peptide_kmer_codes(peptide_seqs, kmer_len)
+    if n_dropped:
+        logging.warning(f'Skipped {n_dropped} k-mers with residues outside {ALPHABET} (e.g. lowercase); they are only in the JSONL db')
+
+    # sort by k-mer, then peptide, and keep each (k-mer, peptide) pair once
+    order = np.lexsort((peptide_idx, codes))
+    codes, peptide_idx = codes[order], peptide_idx[order]
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = (codes[1:] != codes[:-1]) | (peptide_idx[1:] != peptide_idx[:-1])
+    codes, peptide_idx = codes[first], peptide_idx[first]
+
+    kmers, kmer_starts = np.unique(codes, return_index=True)
+    offsets = np.append(kmer_starts, len(codes)).astype(np.uint32 if len(codes) < 2 ** 32 else np.uint64)
+    peptides = peptide_idx.astype(np.min_scalar_type(max(len(peptide_ids) - 1, 0)))
+    names = [str(peptide_id).encode() for peptide_id in peptide_ids]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in names], out=name_offsets[1:])
+
+    tmp_path = f'{index_path}.part'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    arrays = {'kmers': kmers, 'offsets': offsets, 'peptides': peptides,
+              'peptide_name_offsets': name_offsets, 'peptide_names': np.frombuffer(b''.join(names), dtype=np.uint8)}
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), arrays[name])
+    with open(os.path.join(tmp_path, INDEX_META), 'w') as file:
+        json.dump({'version': INDEX_VERSION, 'kmer_len': kmer_len, 'alphabet': ALPHABET,
+                   'bits_per_residue': BITS_PER_RESIDUE, 'n_kmers': len(kmers), 'n_peptides': len(names),
+                   'n_postings': len(peptides)}, file)
+    os.replace(tmp_path, index_path)
+    logging.info(f'K-mer index with {len(kmers)} {kmer_len}-mers over {len(names)} peptides saved to {index_path}')
+
+
+class KmerIndex:
+    """
+    Read-only view of an index written by build_kmer_index. The arrays are memory-mapped,
+    so opening it parses nothing; a lookup is a binary search over the sorted k-mer codes.
+    """
+
+    def __init__(self, index_path):
+        with open(os.path.join(index_path, INDEX_META), 'r') as file:
+            meta = json.load(file)
+        if meta.get('version') != INDEX_VERSION or meta.get('alphabet') != ALPHABET:
+            raise ValueError(f'Unsupported k-mer index format in {index_path}')
+        self.index_path = index_path
+        self.kmer_len = meta['kmer_len']
+        for name in INDEX_ARRAYS:
+            setattr(self, name, np.load(os.path.join(index_path, f'{name}.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.kmers)
+
+    def get_peptide_id(self, peptide_idx):
+        start, end = self.peptide_name_offsets[peptide_idx], self.peptide_name_offsets[peptide_idx + 1]
+        return self.peptide_names[start:end].tobytes().decode()
+
+    def encode_many(self, kmers):
+        """Integer codes of a batch of k-mers."""
+        return encode_kmers(kmers, self.kmer_len)
+
+    def lookup_peptides(self, kmer):
+        """Peptide numbers (positions in the keys table order) containing the k-mer."""
+        return self.lookup_many_peptides([kmer])[0]
+
+    def lookup_many_peptides(self, kmers):
+        """Peptide numbers for each k-mer, found with one vectorized binary search."""
+        codes = self.encode_many(kmers)
+        positions = np.searchsorted(self.kmers, codes)
+        found = positions < len(self.kmers)
+        found[found] = self.kmers[positions[found]] == codes[found]
+        empty = np.zeros(0, dtype=self.peptides.dtype)
+        return [np.asarray(self.peptides[self.offsets[position]:self.offsets[position + 1]]) if is_found else empty
+                for position, is_found in zip(positions.tolist(), found.tolist())]
+
+    def lookup(self, kmer):
+        """Peptide ids containing the k-mer."""
+        return [self.get_peptide_id(peptide_idx) for peptide_idx in self.lookup_peptides(kmer).tolist()]
+
+    def lookup_many(self, kmers):
+        """{k-mer: peptide ids} for a batch of k-mers."""
+        return {kmer: [self.get_peptide_id(peptide_idx) for peptide_idx in peptides.tolist()]
+                for kmer, peptides in zip(kmers, self.lookup_many_peptides(kmers))}
+
+
+def read_kmers_file(kmers_file_path):
+    with open(kmers_file_path, 'r') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def main(index_path, kmers, kmers_file_path=None):
+    try:
+        index = KmerIndex(os.path.abspath(index_path))
+    except Exception as e:
+        logging.error(f'Could not open k-mer index: {e}')
+        return
+    if kmers_file_path is not None:
+        kmers = kmers + read_kmers_file(kmers_file_path)
+    try:
+        results = index.lookup_many(kmers)
+    except ValueError as e:
+        logging.error(e)
+        return
+    for kmer, peptide_ids in results.items():
+        print(f"{kmer}\t{','.join(peptide_ids)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Look up the peptides containing k-mers in a binary Phip-seq k-mer index.',
+                                     usage='python kmer_index.py /path/to/peptide_kmer_index KMER [KMER ...] [--kmers_file kmers.txt]')
+    parser.add_argument('index_path', type=str, help='Path to the index directory written by phipseq-key-kmer-parser.py --format index.')
+    parser.add_argument('kmers', type=str, nargs='*', help='K-mers to look up.')
+    parser.add_argument('--kmers_file', type=str, default=None, help='(optional) File with one k-mer per line for batch lookups.')
+
+    args = parser.parse_args()
+    main(args.index_path, args.kmers, args.kmers_file)
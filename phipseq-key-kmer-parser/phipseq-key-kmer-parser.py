@@ -3,6 +3,9 @@ import json
 import argparse
 import os
 import logging
+from kmer_index import build_kmer_index, check_kmer_len
+
+OUTPUT_FORMATS = ('jsonl', 'index', 'both')
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -28,15 +31,24 @@ def dump_kmer_db(result_file_path, keys_table, kmer_len):
             file.write(json_obj + '\n')
       
 
-def main(kmer_len, keys_file_path, output_path):
+def main(kmer_len, keys_file_path, output_path, output_format='jsonl'):
     output_path = os.path.abspath(output_path)
     os.makedirs(output_path, exist_ok=True)
     result_file_path = os.path.abspath(f'{output_path}/peptide_kmer_db.jsonl')
+    index_path = os.path.abspath(f'{output_path}/peptide_kmer_index')
     keys_file_path = os.path.abspath(keys_file_path)
     
-    if os.path.exists(result_file_path):
-        logging.error(f'The file {result_file_path} already exists. Aborting to prevent data loss.')
-        return
+    result_paths = {'jsonl': [result_file_path], 'index': [index_path], 'both': [result_file_path, index_path]}[output_format]
+    for path in result_paths:
+        if os.path.exists(path):
+            logging.error(f'The file {path} already exists. Aborting to prevent data loss.')
+            return
+    if output_format != 'jsonl':
+        try:
+            check_kmer_len(kmer_len)
+        except ValueError as e:
+            logging.error(e)
+            return
     
     keys_table = read_keys_csv(keys_file_path)
     
@@ -44,7 +56,10 @@ def main(kmer_len, keys_file_path, output_path):
         return
 
     keys_table.sort_values(by = 'target_inter_id', inplace=True)
-    dump_kmer_db(result_file_path, keys_table, kmer_len)
+    if output_format != 'index':
+        dump_kmer_db(result_file_path, keys_table, kmer_len)
+    if output_format != 'jsonl':
+        build_kmer_index(index_path, keys_table['target_id'].tolist(), keys_table['peptide_seq'].tolist(), kmer_len)
     logging.info('All done!')
     
 if __name__ == '__main__':
@@ -53,6 +68,10 @@ if __name__ == '__main__':
     parser.add_argument('-k', '--kmer_len', type=int, default=9, help='(optional) Desired k-mer length. Default is 9.')
     parser.add_argument('keys_file_path', type=str, help='Path to the Phip-seq keys file (CSV format). Must contain "target_id" and "peptide_seq" columns.')
     parser.add_argument('output_path', type=str, help='Path where the .jsonl database will be saved.')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='jsonl',
+                        help='(optional) jsonl: k-mers per peptide (peptide_kmer_db.jsonl); index: memory-mappable inverted index '
+                             '(peptide_kmer_index/, query it with kmer_index.py; case-sensitive like the jsonl, k-mers with residues '
+                             'outside the uppercase amino acid alphabet are skipped); both. Default is jsonl.')
     
     args = parser.parse_args()
-    main(args.kmer_len, args.keys_file_path, args.output_path)
\ No newline at end of file
+    main(args.kmer_len, args.keys_file_path, args.output_path, args.format)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import importlib.util
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from kmer_index import ALPHABET, KmerIndex, encode_kmers
+
+# the CLI script's name is not an importable module name
+spec = importlib.util.spec_from_file_location(
+    'phipseq_key_kmer_parser', os.path.join(os.path.dirname(__file__), '..', 'phipseq-key-kmer-parser.py'))
+key_kmer_parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(key_kmer_parser)
+
+KMER_LEN = 4
+KEYS = pd.DataFrame({
+    'target_inter_id': [3, 1, 2, 5, 4, 6],
+    'target_id': ['pep_c', 'pep_a', 'pep_b', 'pep_e', 'pep_d', 'pep_f'],
+    'peptide_seq': ['MKTAYIAKQR', 'GSHMKTAYIA', 'mktayiakqr', 'ACDE*FGXKT', 'MKT', 'AKQRmkTAYI'],
+})
+
+
+class TestKmerIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.keys_file_path = os.path.join(self.tmp_dir.name, 'keys.csv')
+        KEYS.to_csv(self.keys_file_path, index=False)
+        self.output_path = os.path.join(self.tmp_dir.name, 'out')
+        key_kmer_parser.main(KMER_LEN, self.keys_file_path, self.output_path, 'both')
+        self.index = KmerIndex(os.path.join(self.output_path, 'peptide_kmer_index'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_jsonl_inverse(self):
+        inverse = {}
+        with open(os.path.join(self.output_path, 'peptide_kmer_db.jsonl'), 'r') as file:
+            for line in file:
+                record = json.loads(line)
+                for kmer in record['kmers']:
+                    inverse.setdefault(kmer, set()).add(record['peptide_id'])
+        return inverse
+
+    def test_index_matches_jsonl_inverse(self):
+        inverse = self.read_jsonl_inverse()
+        indexed = {kmer: peptide_ids for kmer, peptide_ids in inverse.items() if set(kmer) <= set(ALPHABET)}
+        self.assertEqual(len(self.index), len(indexed))
+        results = self.index.lookup_many(list(indexed))
+        self.assertEqual({kmer: set(peptide_ids) for kmer, peptide_ids in results.items()}, indexed)
+        # peptide ids come back in keys table order (sorted by target_inter_id)
+        self.assertEqual(results['MKTA'], ['pep_a', 'pep_c'])
+
+    def test_case_sensitive(self):
+        inverse = self.read_jsonl_inverse()
+        self.assertEqual(inverse['mkta'], {'pep_b'})
+        self.assertEqual(self.index.lookup('MKTA'), ['pep_a', 'pep_c'])
+        for kmer in ('mkta', 'RmkT'):
+            with self.assertRaises(ValueError):
+                self.index.lookup(kmer)
+            with self.assertRaises(ValueError):
+                encode_kmers([kmer], 4)
+
+    def test_encode_kmers(self):
+        # 5 bits per residue, code = position in ALPHABET + 1
+        self.assertEqual(encode_kmers(['AC', 'CA', '*Z'], 2).tolist(), [1 << 5 | 2, 2 << 5 | 1, 27 << 5 | 26])
+        self.assertEqual(self.index.encode_many(['MKTA', 'KTAY']).tolist(), encode_kmers(['MKTA', 'KTAY'], 4).tolist())
+        self.assertEqual(len(encode_kmers([], 4)), 0)
+        with self.assertRaises(ValueError):
+            encode_kmers(['MKT'], 4)
+
+    def test_missing_kmer(self):
+        self.assertEqual(self.index.lookup('WWWW'), [])
+        with self.assertRaises(ValueError):
+            self.index.lookup('MKTAY')
+
+
+if __name__ == '__main__':
+    unittest.main()